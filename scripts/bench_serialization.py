@@ -0,0 +1,85 @@
+"""
+So sánh chi phí serialize output của /predict/l2/batch và /predict/l1/batch trên dữ liệu giả:
+
+  model    : đường cũ của FastAPI - validate lại theo response_model rồi json.dumps
+  orjson   : dict thuần (src.api.responses) + ORJSONResponse, dạng rows (mặc định)
+  columnar : như orjson nhưng ?format=columnar (các mảng song song)
+
+Đo thời gian dựng body (trung bình --repeat lần) và số byte payload.
+
+    python scripts/bench_serialization.py --items 500 --codes 80
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from src.api.responses import batch_response
+from src.services.l1.schema import L1PredictResult
+from src.services.l2.schema import L2PredictResult
+
+LOAI = ["UT1", "UT2", "UT3", "UT4", "UT5"]
+
+def fake_batch(kind: str, items: int, codes: int, seed: int) -> list:
+    rnd = random.Random(seed)
+    pool = [f"UEF{7340000 + i}{rnd.choice(['', '_THPTQG', '_DGNL'])}" for i in range(codes * 4)]
+    if kind == "l2":
+        return [[L2PredictResult.model_construct(ma_xet_tuyen=c, score=rnd.random())
+                 for c in rnd.sample(pool, codes)] for _ in range(items)]
+    return [[L1PredictResult.model_construct(
+                 loai_uu_tien=loai, ma_xet_tuyen={c: rnd.random() for c in rnd.sample(pool, codes // len(LOAI))})
+             for loai in LOAI] for _ in range(items)]
+
+def model_path(kind: str) -> Callable[[list], bytes]:
+    """Mô phỏng FastAPI khi route trả list model: serialize_response (validate) + JSONResponse."""
+    result = L2PredictResult if kind == "l2" else L1PredictResult
+    field = create_model_field(name="Response", type_=List[List[result]], mode="serialization")
+
+    def render(batch: list) -> bytes:
+        content = asyncio.run(serialize_response(field=field, response_content=batch, is_coroutine=False))
+        return JSONResponse(content).body
+    return render
+
+def timed(fn: Callable[[list], bytes], batch: list, repeat: int) -> tuple[float, int]:
+    body = fn(batch)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(batch)
+    return (time.perf_counter() - t0) / repeat, len(body)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500, help="số input trong batch")
+    parser.add_argument("--codes", type=int, default=80, help="số mã mỗi input")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--kinds", nargs="*", default=["l2", "l1"])
+    args = parser.parse_args()
+
+    print(f"{'kind':<4} {'path':<9} {'ms':>9} {'KiB':>9} {'speedup':>8}  ({args.items} items x {args.codes} mã)")
+    for kind in args.kinds:
+        batch = fake_batch(kind, args.items, args.codes, args.seed)
+        paths = {
+            "model": model_path(kind),
+            "orjson": lambda b: batch_response(kind, b, "rows").body,
+            "columnar": lambda b: batch_response(kind, b, "columnar").body,
+        }
+        base = None
+        for name, fn in paths.items():
+            sec, size = timed(fn, batch, args.repeat)
+            base = base or sec
+            print(f"{kind:<4} {name:<9} {sec * 1000:>9.1f} {size / 1024:>9.1f} {base / sec:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+So sánh thời gian khởi động và bộ nhớ của worker giữa 2 bố cục artifact:
+
+  bundle : l1_model.joblib (nén) + parse l2_lightgbm.txt bằng Booster
+  mmap   : models/l1_groups/ (mmap) + user_item_lightgbm/flat/ (mmap, engine numpy)
+
+Mỗi cấu hình chạy N tiến trình đồng thời (như N worker uvicorn); sau khi load xong, đọc
+/proc/<pid>/smaps_rollup để lấy RSS, PSS (phần chia đều trang dùng chung) và phần private.
+
+    python -m src.services.l1.model_store export
+    python -m src.services.l2.tree_engine export
+    python scripts/bench_startup.py --workers 4
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+CONFIGS = {
+    "bundle": {"L2_TREE_ENGINE": "booster", "MODEL_MMAP": "0", "_L1_LAYOUT": "0"},
+    "mmap": {"L2_TREE_ENGINE": "numpy", "MODEL_MMAP": "1", "_L1_LAYOUT": "1"},
+}
+
+def child() -> None:
+    sys.path.insert(0, str(ROOT))
+    t0 = time.perf_counter()
+    from src.core.config import settings
+    from src.services.l1.predictor import L1Predictor
+    from src.services.l2.predictor import L2Predictor
+    t1 = time.perf_counter()
+    l1 = L1Predictor.load(settings.MODEL_DIR, use_group_layout=os.environ["_L1_LAYOUT"] == "1")
+    l2 = L2Predictor.load(settings.MODEL_DIR, settings.L2_THRESHOLD)
+    # chạm vào toàn bộ model như khi phục vụ request
+    if l1.answer_table is None:
+        for g in l1.groups:
+            l1.groups.get(g)
+    t2 = time.perf_counter()
+    print(json.dumps({"import_s": t1 - t0, "load_s": t2 - t1, "l2_booster": l2.booster is not None}), flush=True)
+    sys.stdin.read()      # giữ tiến trình sống đến khi parent đo xong
+
+def smaps_rollup(pid: int) -> dict[str, int]:
+    out = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        k, v = line.split(":", 1)
+        out[k] = int(v.split()[0])      # kB
+    return out
+
+def run(name: str, env_over: dict, workers: int) -> dict:
+    env = {**os.environ, **env_over}
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "--child"], env=env, cwd=ROOT,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    reports = [json.loads(p.stdout.readline()) for p in procs]
+    mem = [smaps_rollup(p.pid) for p in procs]
+    for p in procs:
+        p.stdin.close()
+        p.wait()
+    mib = lambda k: sum(m.get(k, 0) for m in mem) / 1024
+    return {
+        "config": name,
+        "load_s": max(r["load_s"] for r in reports),
+        "rss_mib": mib("Rss"),
+        "pss_mib": mib("Pss"),
+        "private_mib": mib("Private_Clean") + mib("Private_Dirty"),
+        "l2_booster": reports[0]["l2_booster"],
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--configs", nargs="*", default=list(CONFIGS))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    print(f"{'config':<8} {'load (s)':>9} {'RSS MiB':>9} {'PSS MiB':>9} {'private MiB':>12}  ({args.workers} workers, tổng)")
+    for name in args.configs:
+        r = run(name, CONFIGS[name], args.workers)
+        print(f"{r['config']:<8} {r['load_s']:>9.3f} {r['rss_mib']:>9.1f} {r['pss_mib']:>9.1f} {r['private_mib']:>12.1f}"
+              + ("" if r["l2_booster"] or name == "bundle" else "  (không dựng Booster)"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+from functools import wraps
+from time import perf_counter
+import inspect
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core import metrics, timing
+
+_METHODS = ("GET", "POST")
+_STATUSES = ("2xx", "3xx", "4xx", "5xx")
+OTHER_ROUTE = "other"
+_SERIES: set[tuple[str, str, str]] = set()
+
+def declare_routes(app: FastAPI) -> None:
+    """
+    Khai báo nhãn (method, route, status) của http_request_duration_seconds theo các route của app;
+    request có bộ nhãn khác (vd. method lạ) không được ghi, để số series cố định.
+    """
+    values = [(m, r.path, s) for r in app.routes if isinstance(r, APIRoute) for m in r.methods for s in _STATUSES]
+    values += [(m, OTHER_ROUTE, s) for m in _METHODS for s in _STATUSES]
+    _SERIES.update(values)
+    metrics.declare(metrics.HTTP_REQUESTS, values)
+
+class MetricsMiddleware:
+    """
+    Đo thời gian mỗi request HTTP (tới khi gửi xong body, kể cả response streaming) theo route
+    template (scope["route"] do FastAPI gán khi khớp route) thay vì path thật, để số series cố định.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not metrics.REGISTRY.enabled:
+            await self.app(scope, receive, send)
+            return
+        t0 = perf_counter()
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if isinstance(route, APIRoute) else OTHER_ROUTE
+            series = (scope["method"], path, metrics.status_class(status))
+            if series in _SERIES:
+                metrics.HTTP_REQUESTS.labels(*series).observe(perf_counter() - t0)
+
+class ServerTimingMiddleware:
+    """
+    Header Server-Timing cho mọi response /predict/*: validate, preprocess, inference, postprocess,
+    serialize, total (ms) và số ứng viên/cặp. ?debug_timing do route batch bật (timing.requested),
+    số liệu theo từng input nằm trong body. Streaming: header gửi trước khi chấm nên chỉ có phần đo được tới lúc đó.
+    """
+
+    def __init__(self, app: ASGIApp, prefix: str = "/predict/"):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        rt, token = timing.begin()
+
+        async def send_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", rt.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timing)
+        finally:
+            timing.end(token)
+
+def _mark_validated(endpoint):
+    # FastAPI đọc chữ ký qua __wrapped__ (functools.wraps), nên tham số/validate giữ nguyên
+    if inspect.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            rt = timing.current()
+            if rt is not None:
+                rt.mark_validated()
+            return await endpoint(*args, **kwargs)
+    else:
+        @wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            rt = timing.current()
+            if rt is not None:
+                rt.mark_validated()
+            return endpoint(*args, **kwargs)
+    return wrapper
+
+class TimedRoute(APIRoute):
+    """APIRoute ghi mốc vào endpoint: phần đọc body + parse + validate trước đó là stage "validate"."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _mark_validated(endpoint), **kwargs)
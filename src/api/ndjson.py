@@ -0,0 +1,113 @@
+from __future__ import annotations
+from typing import Any, AsyncIterator, Type
+import json
+
+import orjson
+
+from fastapi import Request
+from pydantic import BaseModel, ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from src.api.responses import ROWS
+from src.core import metrics
+from src.core.config import settings
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+NDJSON_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {NDJSON_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}}},
+        "description": "Mỗi dòng là một JSON object input; dòng trống được bỏ qua",
+    },
+}
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse đọc body request ngay trong generator: không chạy listen_for_disconnect
+    (nó cũng gọi receive() và sẽ nuốt mất các chunk body). Ngắt kết nối được phát hiện qua
+    http.disconnect khi đọc body hoặc lỗi khi ghi.
+    """
+    media_type = NDJSON_MEDIA_TYPE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+async def iter_ndjson_lines(request: Request, max_line_bytes: int) -> AsyncIterator[bytes | None]:
+    """Các dòng không rỗng của body; None thay cho dòng dài quá max_line_bytes."""
+    buf = bytearray()
+    skipping = False
+    async for chunk in request.stream():
+        start = 0
+        while True:
+            nl = chunk.find(b"\n", start)
+            part = chunk[start:] if nl < 0 else chunk[start:nl]
+            if not skipping:
+                buf += part
+                if len(buf) > max_line_bytes:
+                    buf.clear()
+                    skipping = True
+                    yield None
+            if nl < 0:
+                break
+            if not skipping and buf.strip():
+                yield bytes(buf)
+            buf.clear()
+            skipping = False
+            start = nl + 1
+    if not skipping and buf.strip():
+        yield bytes(buf)
+
+def _line(obj: dict) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+async def stream_predictions(request: Request, kind: str, schema: Type[BaseModel],
+                             top_k: int | None = None) -> AsyncIterator[bytes]:
+    """
+    Đọc input NDJSON từng dòng, chấm theo chunk STREAM_CHUNK_SIZE qua BatchExecutor và trả
+    mỗi input một dòng {"index": i, "result": [...]} hoặc {"index": i, "error": ...}, đúng thứ tự input.
+    Chỉ đọc tiếp body khi chunk trước đã được gửi đi, nên bộ nhớ chỉ phụ thuộc kích thước chunk
+    và client gửi chậm lại khi đọc kết quả chậm (backpressure qua TCP). top_k: chỉ trả k kết quả đầu mỗi input (L2).
+    """
+    executor = request.app.state.executor
+    rows = ROWS[kind]
+    chunk_size = max(1, settings.STREAM_CHUNK_SIZE)
+    pending: list[tuple[int, BaseModel | None, Any]] = []
+
+    async def flush() -> bytes:
+        valid = [(i, u) for i, u, err in pending if u is not None and u.is_tinh_tp_valid]
+        scored = dict(zip((i for i, _ in valid), await executor.run(kind, [u for _, u in valid], top_k))) if valid else {}
+        out = bytearray()
+        with metrics.stage(kind, "serialize"):
+            for i, u, err in pending:
+                if err is not None:
+                    out += _line({"index": i, "error": err})
+                else:
+                    out += _line({"index": i, "result": rows(scored.get(i, []))})
+        pending.clear()
+        return bytes(out)
+
+    index = 0
+    async for raw in iter_ndjson_lines(request, settings.STREAM_MAX_LINE_BYTES):
+        if raw is None:
+            pending.append((index, None, f"line exceeds {settings.STREAM_MAX_LINE_BYTES} bytes"))
+        else:
+            try:
+                pending.append((index, schema.model_validate_json(raw), None))
+            except ValidationError as e:
+                pending.append((index, None, json.loads(e.json(include_url=False))))
+            except (TypeError, ValueError) as e:
+                # lỗi không được pydantic bọc (validator tự viết): chỉ hỏng dòng này, không cắt stream
+                pending.append((index, None, str(e)))
+        index += 1
+        if len(pending) >= chunk_size:
+            yield await flush()
+    if pending:
+        yield await flush()
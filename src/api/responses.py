@@ -0,0 +1,92 @@
+"""
+Output của các route predict dựng thẳng thành dữ liệu thuần (dict/list) rồi serialize bằng orjson
+(ORJSONResponse). Trả Response trực tiếp nên FastAPI bỏ qua bước validate + serialize lại theo
+response_model; response_model của route chỉ còn dùng cho OpenAPI.
+
+Dạng "columnar" (batch, ?format=columnar): các mảng song song, mỗi phần tử một (input, mã):
+  l2: {"index": [...], "ma_xet_tuyen": [...], "score": [...]}
+  l1: {"index": [...], "loai_uu_tien": [...], "ma_xet_tuyen": [...], "score": [...]}
+index là vị trí học sinh trong items; loại ưu tiên không có mã nào thì không xuất hiện.
+
+?debug_timing=1 (batch): dạng columnar thêm khoá "timing"; dạng rows thành {"results": [...], "timing": {...}}.
+"""
+from __future__ import annotations
+from typing import Any, Literal, Sequence
+
+from fastapi.responses import ORJSONResponse
+
+from src.core import metrics
+from src.core.timing import RequestTiming
+
+BatchFormat = Literal["rows", "columnar"]
+
+def l2_rows(results: Sequence[Any]) -> list[dict]:
+    return [{"ma_xet_tuyen": r.ma_xet_tuyen, "score": r.score} for r in results]
+
+def l1_rows(results: Sequence[Any]) -> list[dict]:
+    return [{"loai_uu_tien": r.loai_uu_tien, "ma_xet_tuyen": r.ma_xet_tuyen} for r in results]
+
+ROWS = {"l1": l1_rows, "l2": l2_rows}
+
+def l2_columnar(batch: Sequence[Sequence[Any]], positions: Sequence[int] | None = None) -> dict:
+    # positions: index của từng phần tử batch (mặc định 0..n-1)
+    index, codes, scores = [], [], []
+    for i, results in zip(positions if positions is not None else range(len(batch)), batch):
+        for r in results:
+            index.append(i)
+            codes.append(r.ma_xet_tuyen)
+            scores.append(r.score)
+    return {"index": index, "ma_xet_tuyen": codes, "score": scores}
+
+def l1_columnar(batch: Sequence[Sequence[Any]]) -> dict:
+    index, loais, codes, scores = [], [], [], []
+    for i, results in enumerate(batch):
+        for r in results:
+            for code, score in r.ma_xet_tuyen.items():
+                index.append(i)
+                loais.append(r.loai_uu_tien)
+                codes.append(code)
+                scores.append(score)
+    return {"index": index, "loai_uu_tien": loais, "ma_xet_tuyen": codes, "score": scores}
+
+def predict_response(kind: str, results: Sequence[Any]) -> ORJSONResponse:
+    with metrics.stage(kind, "serialize"):
+        return ORJSONResponse(ROWS[kind](results))
+
+def timing_body(rt: RequestTiming | None, positions: Sequence[int]) -> dict | None:
+    """
+    Phần "timing" của ?debug_timing=1: tổng theo stage/nhóm và số liệu theo từng input đã chấm
+    (positions: index trong request của từng input gửi vào predictor). Các stage chạy một lần cho
+    cả batch nên theo từng input chỉ có số liệu đếm (ứng viên, cặp, lấy từ cache...).
+    Thời gian serialize của chính body này không có trong đó.
+    """
+    if rt is None:
+        return None
+    body = rt.summary()
+    if rt.items is not None:
+        cols = {k: v.tolist() for k, v in rt.items.items()}
+        body["items"] = [{"index": p, **{k: v[j] for k, v in cols.items()}} for j, p in enumerate(positions)]
+    return body
+
+def columnar_batch_response(batch: Sequence[Sequence[Any]], positions: Sequence[int],
+                            errors: list[dict], debug: dict | None = None) -> ORJSONResponse:
+    """Kết quả của /predict/l2/batch/columnar: dạng cột l2 kèm lỗi validate theo index."""
+    with metrics.stage("l2", "serialize"):
+        body = {**l2_columnar(batch, positions), "errors": errors}
+        if debug is not None:
+            body["timing"] = debug
+        return ORJSONResponse(body)
+
+def batch_response(kind: str, batch: Sequence[Sequence[Any]], fmt: BatchFormat = "rows",
+                   debug: dict | None = None) -> ORJSONResponse:
+    with metrics.stage(kind, "serialize"):
+        if fmt == "columnar":
+            body = l2_columnar(batch) if kind == "l2" else l1_columnar(batch)
+            if debug is not None:
+                body["timing"] = debug
+        else:
+            rows = ROWS[kind]
+            body = [rows(results) for results in batch]
+            if debug is not None:
+                body = {"results": body, "timing": debug}
+        return ORJSONResponse(body)
@@ -0,0 +1,101 @@
+from pathlib import Path
+from typing import Literal
+import shutil
+
+from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from src.core.config import settings
+from src.services.bulk import count_rows, input_format
+
+router = APIRouter(tags=["Job chấm điểm hàng loạt"])
+
+_WRITE_BUFFER = 1 << 20
+
+_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
+        "description": "Nội dung file CSV/Parquet/xlsx, mỗi dòng một input UserInputL1/UserInputL2 (tên cột = tên field)",
+    },
+}
+
+def _store(request: Request):
+    runner = getattr(request.app.state, "jobs", None)
+    if runner is None:
+        raise HTTPException(503, "Jobs are disabled (JOBS_ENABLED=0)")
+    return runner.store
+
+@router.post("/jobs/{kind}", status_code=202, openapi_extra=_UPLOAD_OPENAPI)
+async def submit_job(
+    kind: Literal["l1", "l2"],
+    request: Request,
+    format: Literal["csv", "parquet", "xlsx"] | None = Query(None, description="bỏ trống: đoán theo filename"),
+    filename: str | None = Query(None, description="tên file gốc, vd. lop12.xlsx"),
+):
+    """Upload file input (body thô), trả job id; tiến độ ở GET /jobs/{id}, kết quả ở GET /jobs/{id}/result."""
+    store = _store(request)
+    try:
+        fmt = input_format(filename or "", format)
+    except ValueError as e:
+        raise HTTPException(415, str(e))
+
+    job_id = store.new_id()
+    job_dir = store.job_dir(job_id)
+    path = job_dir / f"input.{fmt}"
+    # ghi file, đếm dòng (đọc hết CSV / mở xlsx) và ghi SQLite đều chạy trong threadpool
+    # để upload lớn không chặn event loop của các request /predict/* trên cùng worker
+    try:
+        await run_in_threadpool(job_dir.mkdir, parents=True)
+        size = await _save_upload(request, path)
+        if size == 0:
+            raise HTTPException(400, "Empty upload")
+        try:
+            total = await run_in_threadpool(count_rows, path, fmt)
+        except Exception as e:
+            raise HTTPException(400, f"Cannot read {fmt} file: {e}")
+        job = await run_in_threadpool(store.create, job_id, kind, fmt, total)
+    except BaseException:
+        await run_in_threadpool(shutil.rmtree, job_dir, ignore_errors=True)
+        raise
+    return job.to_dict()
+
+async def _save_upload(request: Request, path: Path) -> int:
+    """Ghi body vào path theo từng khối _WRITE_BUFFER byte; trả về số byte."""
+    size = 0
+    buf = bytearray()
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.JOBS_MAX_UPLOAD_BYTES:
+                raise HTTPException(413, f"Upload too large; max={settings.JOBS_MAX_UPLOAD_BYTES} bytes")
+            buf += chunk
+            if len(buf) >= _WRITE_BUFFER:
+                await run_in_threadpool(f.write, buf)
+                buf.clear()
+        if buf:
+            await run_in_threadpool(f.write, buf)
+    finally:
+        await run_in_threadpool(f.close)
+    return size
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, request: Request):
+    job = _store(request).get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str, request: Request):
+    """Kết quả Parquet dạng dài: index, (loai_uu_tien,) ma_xet_tuyen, score, error."""
+    store = _store(request)
+    job = store.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    if job.status != "done":
+        raise HTTPException(409, f"Job is {job.status}")
+    return FileResponse(store.result_path(job_id), media_type="application/vnd.apache.parquet",
+                        filename=f"{job.kind}_{job_id}.parquet")
@@ -1,43 +1,59 @@
-from typing import List
+from typing import List, Union
 from fastapi import APIRouter, Request, HTTPException, Query
-import asyncio
 from pydantic import BaseModel
 
+from src.core import timing
 from src.core.config import settings
-from src.services.l1.schema import UserInputL1, L1PredictResult
+from src.api.middleware import TimedRoute
+from src.api.ndjson import NDJSON_OPENAPI, NDJSONStreamingResponse, stream_predictions
+from src.api.responses import BatchFormat, batch_response, predict_response, timing_body
+from src.services.l1.schema import UserInputL1, L1PredictResult, L1ColumnarResult
 
-router = APIRouter(tags=["Gợi ý xét tuyển"])
+router = APIRouter(tags=["Gợi ý xét tuyển"], route_class=TimedRoute)
 
 @router.post("/predict/l1", response_model=List[L1PredictResult])
 def predict_major_l1(user: UserInputL1, request: Request):
     if not user.is_tinh_tp_valid:
-        return []
-    return request.app.state.l1.predict(user)
+        return predict_response("l1", [])
+    return predict_response("l1", request.app.state.l1.predict(user))
 
 # -------- BATCH L1 --------
 class L1BatchRequest(BaseModel):
     items: List[UserInputL1]
 
-@router.post("/predict/l1/batch", response_model=List[List[L1PredictResult]])
+@router.post("/predict/l1/batch", response_model=Union[List[List[L1PredictResult]], L1ColumnarResult])
 async def predict_major_l1_batch(
     payload: L1BatchRequest,
     request: Request,
-    concurrency: int | None = Query(None, ge=1),
+    concurrency: int | None = Query(None, ge=1, deprecated=True, description="không còn tác dụng: cả batch được chấm theo nhóm model trong một lần gọi"),
+    format: BatchFormat = Query("rows", description="columnar: các mảng song song index/loai_uu_tien/ma_xet_tuyen/score"),
+    debug_timing: bool = Query(False, description="thêm thời gian từng stage và số dòng ưu tiên (tổng và theo từng input) vào body"),
 ):
     items = payload.items
     if len(items) > settings.BATCH_MAX_ITEMS:
         raise HTTPException(413, f"Too many items; max={settings.BATCH_MAX_ITEMS}")
 
-    limit = concurrency or settings.MAX_BATCH_CONCURRENCY
-    sem = asyncio.Semaphore(limit)
-
-    async def worker(idx: int, user: UserInputL1):
-        if not user.is_tinh_tp_valid:
-            return idx, []
-        async with sem:
-            res = await asyncio.to_thread(request.app.state.l1.predict, user)
-            return idx, res
-
-    results = await asyncio.gather(*[worker(i, u) for i, u in enumerate(items)])
-    results.sort(key=lambda t: t[0])
-    return [res for _, res in results]
+    valid_idx = [i for i, u in enumerate(items) if u.is_tinh_tp_valid]
+    results: List[List[L1PredictResult]] = [[] for _ in items]
+    with timing.requested(debug_timing) as rt:
+        if valid_idx:
+            # thread hoặc process pool tuỳ BATCH_EXECUTOR
+            scored = await request.app.state.executor.run("l1", [items[i] for i in valid_idx])
+            for i, res in zip(valid_idx, scored):
+                results[i] = res
+        return batch_response("l1", results, format, timing_body(rt, valid_idx))
+
+# -------- STREAM L1 (NDJSON) --------
+@router.post("/predict/l1/stream", response_class=NDJSONStreamingResponse, openapi_extra=NDJSON_OPENAPI)
+async def predict_major_l1_stream(request: Request):
+    """
+    Body NDJSON, mỗi dòng một UserInputL1; không giới hạn số dòng (không áp BATCH_MAX_ITEMS).
+    Trả NDJSON theo thứ tự input, mỗi dòng {"index": i, "result": [...]} hoặc {"index": i, "error": ...},
+    gửi dần sau mỗi STREAM_CHUNK_SIZE dòng.
+    """
+    return NDJSONStreamingResponse(stream_predictions(request, "l1", UserInputL1))
+
+@router.get("/predict/l1/models")
+def l1_model_stats(request: Request):
+    """Thống kê kho model L1 theo nhóm (số nhóm đang nạp, load/evict...)."""
+    return request.app.state.l1.groups.snapshot()
@@ -1,45 +1,94 @@
-from typing import List
+from typing import List, Union
 from fastapi import APIRouter, Request, HTTPException, Query
-import asyncio
 from pydantic import BaseModel
 
+from src.core import metrics, timing
 from src.core.config import settings
-from src.services.l2.schema import UserInputL2, L2PredictResult
+from src.api.middleware import TimedRoute
+from src.api.ndjson import NDJSON_OPENAPI, NDJSONStreamingResponse, stream_predictions
+from src.api.responses import BatchFormat, batch_response, columnar_batch_response, predict_response, timing_body
+from src.services.l2.columnar import validate_columns
+from src.services.l2.schema import (
+    UserInputL2, L2PredictResult, L2ColumnarResult, L2ColumnarBatchRequest, L2ColumnarBatchResult,
+)
 
-router = APIRouter(tags=["Gợi ý xét tuyển"])
+router = APIRouter(tags=["Gợi ý xét tuyển"], route_class=TimedRoute)
+
+_TOP_K = Query(None, ge=1, description="chỉ trả k mã điểm cao nhất mỗi học sinh")
+_DEBUG_TIMING = Query(False, description="thêm thời gian từng stage và số ứng viên/cặp (tổng và theo từng input) vào body")
 
 @router.post("/predict/l2", response_model=List[L2PredictResult])
-def predict_major_l2(user: UserInputL2, request: Request):
+def predict_major_l2(user: UserInputL2, request: Request, top_k: int | None = _TOP_K):
     if not user.is_tinh_tp_valid:
-        return []
-    return request.app.state.l2.predict(user)
+        return predict_response("l2", [])
+    return predict_response("l2", request.app.state.l2.predict(user, top_k))
 
 # -------- BATCH L2 --------
 class L2BatchRequest(BaseModel):
     items: List[UserInputL2]
 
-@router.post("/predict/l2/batch", response_model=List[List[L2PredictResult]])
+@router.post("/predict/l2/batch", response_model=Union[List[List[L2PredictResult]], L2ColumnarResult])
 async def predict_major_l2_batch(
     payload: L2BatchRequest,
     request: Request,
-    concurrency: int | None = Query(None, ge=1, description="override mức đồng thời"),
+    concurrency: int | None = Query(None, ge=1, deprecated=True, description="không còn tác dụng: cả batch được chấm trong một lần gọi model"),
+    format: BatchFormat = Query("rows", description="columnar: các mảng song song index/ma_xet_tuyen/score"),
+    top_k: int | None = _TOP_K,
+    debug_timing: bool = _DEBUG_TIMING,
 ):
     items = payload.items
     if len(items) > settings.BATCH_MAX_ITEMS:
         raise HTTPException(413, f"Too many items; max={settings.BATCH_MAX_ITEMS}")
 
-    limit = concurrency or settings.MAX_BATCH_CONCURRENCY
-    sem = asyncio.Semaphore(limit)
-
-    async def worker(idx: int, user: UserInputL2):
-        if not user.is_tinh_tp_valid:
-            return idx, []
-        async with sem:
-            # chạy predict sync trong thread pool
-            res = await asyncio.to_thread(request.app.state.l2.predict, user)
-            return idx, res
-
-    tasks = [worker(i, u) for i, u in enumerate(items)]
-    done = await asyncio.gather(*tasks)
-    done.sort(key=lambda t: t[0]) 
-    return [res for _, res in done]
+    valid_idx = [i for i, u in enumerate(items) if u.is_tinh_tp_valid]
+    results: List[List[L2PredictResult]] = [[] for _ in items]
+    with timing.requested(debug_timing) as rt:
+        if valid_idx:
+            # thread hoặc process pool tuỳ BATCH_EXECUTOR
+            scored = await request.app.state.executor.run("l2", [items[i] for i in valid_idx], top_k)
+            for i, res in zip(valid_idx, scored):
+                results[i] = res
+        return batch_response("l2", results, format, timing_body(rt, valid_idx))
+
+# -------- BATCH L2 DẠNG CỘT --------
+@router.post("/predict/l2/batch/columnar", response_model=L2ColumnarBatchResult)
+async def predict_major_l2_batch_columnar(
+    payload: L2ColumnarBatchRequest,
+    request: Request,
+    top_k: int | None = _TOP_K,
+    debug_timing: bool = _DEBUG_TIMING,
+):
+    """
+    Input dạng cột (mỗi field một mảng), validate theo cột; dòng sai nằm trong "errors" theo index
+    và không làm hỏng cả request. Output dạng cột như /predict/l2/batch?format=columnar.
+    """
+    if len(payload) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"Too many items; max={settings.BATCH_MAX_ITEMS}")
+    with timing.requested(debug_timing) as rt:
+        with metrics.stage("l2", "validate"):
+            batch = validate_columns(dict(payload))
+        scored = await request.app.state.executor.run_students(batch.students, top_k)
+        positions = batch.index.tolist()
+        return columnar_batch_response(scored, positions, batch.errors, timing_body(rt, positions))
+
+# -------- STREAM L2 (NDJSON) --------
+@router.post("/predict/l2/stream", response_class=NDJSONStreamingResponse, openapi_extra=NDJSON_OPENAPI)
+async def predict_major_l2_stream(request: Request, top_k: int | None = _TOP_K):
+    """
+    Body NDJSON, mỗi dòng một UserInputL2; không giới hạn số dòng (không áp BATCH_MAX_ITEMS).
+    Trả NDJSON theo thứ tự input, mỗi dòng {"index": i, "result": [...]} hoặc {"index": i, "error": ...},
+    gửi dần sau mỗi STREAM_CHUNK_SIZE dòng.
+    """
+    return NDJSONStreamingResponse(stream_predictions(request, "l2", UserInputL2, top_k))
+
+@router.get("/predict/l2/cache")
+def l2_cache_stats(request: Request):
+    """Thống kê cache kết quả L2 (hit/miss/eviction...)."""
+    cache = request.app.state.l2.cache
+    return cache.snapshot() if cache is not None else {"enabled": False}
+
+@router.get("/predict/l2/prune")
+def l2_prune_stats(request: Request):
+    """Số cặp bị bỏ trước khi chấm theo từng luật lọc."""
+    prune = request.app.state.l2.prune
+    return prune.snapshot() if prune is not None else {"enabled": False}
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src.core.metrics import REGISTRY
+
+router = APIRouter(tags=["Health"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Metric dạng Prometheus text (tổng của mọi tiến trình dùng chung PROMETHEUS_MULTIPROC_DIR)."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
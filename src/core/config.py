@@ -4,12 +4,60 @@ import os
 
 class Settings(BaseSettings):
     MODEL_DIR: Path = Path("models")
+    # memory-map artifact không nén (l1_groups/, user_item_lightgbm/flat/) để các worker dùng chung
+    MODEL_MMAP: bool = True
     DATA_DIR: Path = Path("data")
     L2_THRESHOLD: float = 0.5
+    # giây giữa 2 lần kiểm tra file catalog L2 (mtime/checksum); < 0 để tắt hot reload
+    L2_CATALOG_RELOAD_INTERVAL: float = 5.0
+    # engine chấm điểm L2: "booster" (LightGBM), "numpy" (FlatTreeEngine) hoặc "auto"
+    # auto: dùng numpy khi số cặp <= L2_TREE_ENGINE_AUTO_MAX_ROWS (None: tự đo lúc load);
+    # numpy: như auto nếu vẫn phải dựng Booster (thiếu/cũ flat/), ngược lại mọi batch qua numpy
+    L2_TREE_ENGINE: str = "booster"
+    L2_TREE_ENGINE_AUTO_MAX_ROWS: int | None = None
+    # cache kết quả L2 (LRU + TTL); L2_CACHE_MAX_ENTRIES = 0 để tắt
+    L2_CACHE_MAX_ENTRIES: int = 10_000
+    L2_CACHE_MAX_BYTES: int = 64 * 2**20
+    L2_CACHE_TTL: float = 600.0
+    # làm tròn diem_chuan trong khoá cache (None: giữ nguyên giá trị)
+    L2_CACHE_SCORE_DECIMALS: int | None = None
+    # bỏ trước khi chấm các cặp mà luật đã quyết định (vd. mã UEF-THPTQG không đủ bậc ưu đãi)
+    L2_PRUNE: bool = True
+    # model L1 theo nhóm (models/l1_groups): giới hạn LRU (0 = không giới hạn) và
+    # danh sách nhóm load sẵn, dạng "cong_lap|tinh_tp|nhom_nganh"
+    L1_GROUP_CACHE_MAX_GROUPS: int = 0
+    L1_GROUP_CACHE_MAX_BYTES: int = 0
+    L1_GROUP_PRELOAD: list[str] = []
+
+    # server (python -m src.serve): WORKERS = 0 -> số CPU
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WORKERS: int = 0
+    LOG_LEVEL: str = "info"
+    # GET /metrics (Prometheus); 0 -> bỏ đo trên hot path
+    METRICS_ENABLED: bool = True
+    # header Server-Timing cho /predict/* (?debug_timing vẫn dùng được khi tắt)
+    SERVER_TIMING: bool = True
 
     # batch
+    # "thread": predict_many trong tiến trình API; "process": pool MAX_BATCH_CONCURRENCY tiến trình,
+    # mỗi lần gửi BATCH_CHUNK_SIZE item (dưới src.serve: MAX_BATCH_CONCURRENCY // WORKERS mỗi worker)
+    BATCH_EXECUTOR: str = "thread"
     MAX_BATCH_CONCURRENCY: int = max(1, (os.cpu_count() or 4))  # ví dụ: 8/12 tuỳ máy
+    BATCH_CHUNK_SIZE: int = 64
     BATCH_MAX_ITEMS: int = 1000
+    # stream NDJSON (/predict/*/stream): số dòng mỗi lần chấm và độ dài tối đa một dòng input
+    STREAM_CHUNK_SIZE: int = 256
+    STREAM_MAX_LINE_BYTES: int = 64 * 2**10
+
+    # job nền (/jobs): SQLite + file trong JOBS_DIR; số tiến trình = JOBS_CPU_SHARE * số CPU (tối thiểu 1)
+    JOBS_ENABLED: bool = True
+    JOBS_DIR: Path = Path("jobs")
+    JOBS_CPU_SHARE: float = 0.5
+    JOBS_NICE: int = 10
+    JOBS_CHUNK_SIZE: int = 1000
+    JOBS_POLL_INTERVAL: float = 1.0
+    JOBS_MAX_UPLOAD_BYTES: int = 512 * 2**20
     class Config:
         env_file = ".env"
     
@@ -0,0 +1,185 @@
+"""
+Metric Prometheus cho GET /metrics, dùng prometheus_client ở chế độ multiprocess.
+
+Mỗi tiến trình (worker của src.serve hay uvicorn --workers, tiến trình pool của BatchExecutor)
+ghi vào file mmap riêng trong PROMETHEUS_MULTIPROC_DIR; /metrics gộp mọi file nên worker nào
+trả lời cũng có tổng của cả server. Chưa đặt biến này thì tiến trình import module đầu tiên tạo
+thư mục tạm (xoá khi thoát) và tiến trình con (fork/spawn) kế thừa qua biến môi trường; với
+uvicorn --workers phải tự đặt một thư mục chung, rỗng lúc khởi động.
+
+Counter/histogram của tiến trình đã thoát vẫn được cộng (tổng không giảm khi worker bị thay);
+gauge chỉ cộng tiến trình chưa được mark_dead. Nhãn khai báo trước bằng declare() để series
+có mặt (bằng 0) ngay từ đầu.
+"""
+from __future__ import annotations
+from contextlib import nullcontext
+from pathlib import Path
+from time import perf_counter
+import atexit
+import os
+import shutil
+import tempfile
+
+import prometheus_client
+from prometheus_client import CollectorRegistry, generate_latest, values
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+from src.core import timing
+
+def _remove_dir(path: str, pid: int) -> None:
+    if os.getpid() == pid:      # tiến trình con fork ra kế thừa atexit
+        shutil.rmtree(path, ignore_errors=True)
+
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+    atexit.register(_remove_dir, os.environ["PROMETHEUS_MULTIPROC_DIR"], os.getpid())
+MULTIPROC_DIR = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+# prometheus_client chỉ chọn chế độ multiprocess theo biến môi trường lúc được import lần đầu
+if not getattr(values.ValueClass, "_multiprocess", False):
+    values.ValueClass = values.MultiProcessValue()
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+class Histogram(prometheus_client.Histogram):
+    def __init__(self, *args, registry=None, **kwargs):
+        super().__init__(*args, registry=registry, **kwargs)
+
+    def observe(self, amount: float, exemplar=None) -> None:
+        if REGISTRY.enabled:
+            super().observe(amount, exemplar)
+
+class Gauge(prometheus_client.Gauge):
+    # livesum: tổng các tiến trình chưa mark_dead (vd. batch đang chấm dở của worker đã chết bị bỏ)
+    def __init__(self, *args, registry=None, multiprocess_mode="livesum", **kwargs):
+        super().__init__(*args, registry=registry, multiprocess_mode=multiprocess_mode, **kwargs)
+
+    def inc(self, amount: float = 1) -> None:
+        if REGISTRY.enabled:
+            super().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        if REGISTRY.enabled:
+            super().dec(amount)
+
+def declare(metric, values) -> None:
+    """Tạo sẵn series cho các bộ nhãn (hiện 0 trên /metrics trước lần ghi đầu tiên)."""
+    for v in values:
+        metric.labels(*v)
+
+def mark_dead(pid: int) -> None:
+    """Tiến trình `pid` đã thoát: bỏ gauge của nó, giữ counter/histogram."""
+    mark_process_dead(pid, MULTIPROC_DIR)
+
+def clear_stale() -> None:
+    """Xoá file của các tiến trình khác (lần chạy trước) trong MULTIPROC_DIR; gọi lúc khởi động server."""
+    pid = f"_{os.getpid()}.db"
+    for f in Path(MULTIPROC_DIR).glob("*.db"):
+        if not f.name.endswith(pid):
+            f.unlink(missing_ok=True)
+
+class _ProcessCollector:
+    """RSS và CPU của từng tiến trình có file trong MULTIPROC_DIR, đọc /proc lúc scrape (không tốn gì trên hot path)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def collect(self):
+        rss = GaugeMetricFamily("process_resident_memory_bytes", "Resident memory of each serving process.", labels=("pid",))
+        cpu = CounterMetricFamily("process_cpu_seconds", "User+system CPU time of each serving process.", labels=("pid",))
+        tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        pids = {f.stem.rsplit("_", 1)[-1] for f in Path(self.path).glob("*.db")}
+        for pid in sorted(p for p in pids if p.isdigit()):
+            try:
+                pages = int(Path(f"/proc/{pid}/statm").read_text().split()[1])
+                stat = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+            except (OSError, IndexError, ValueError):
+                continue        # tiến trình đã thoát
+            rss.add_metric((pid,), pages * _PAGE)
+            cpu.add_metric((pid,), (int(stat[11]) + int(stat[12])) / tick)
+        yield rss
+        yield cpu
+
+class Registry:
+    """Bật/tắt ghi metric (METRICS_ENABLED) và render /metrics từ mọi file trong MULTIPROC_DIR."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.enabled = True
+
+    def render(self) -> bytes:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry, path=self.path)
+        registry.register(_ProcessCollector(self.path))
+        return generate_latest(registry)
+
+REGISTRY = Registry(MULTIPROC_DIR)
+
+# ---- metric của service ----
+KINDS = ("l1", "l2")
+STAGES = {
+    "l1": ("expand", "lookup", "encode", "predict", "postprocess", "serialize"),
+    "l2": ("validate", "catalog", "pairs", "encode", "predict", "postprocess", "serialize"),
+}
+
+HTTP_REQUESTS = Histogram(
+    "http_request_duration_seconds", "Request latency by route template and status class.",
+    ("method", "route", "status"), buckets=LATENCY_BUCKETS,
+)
+PREDICT_STAGE = Histogram(
+    "predict_stage_duration_seconds", "Time spent in each predictor stage per call.",
+    ("kind", "stage"), buckets=LATENCY_BUCKETS,
+)
+PREDICT_BATCH_SIZE = Histogram(
+    "predict_batch_size", "Students per predictor call.",
+    ("kind",), buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000),
+)
+L2_PAIRS = Histogram(
+    "l2_candidate_pairs", "Candidate pairs scored per L2 predictor call (after pruning).",
+    buckets=(10, 100, 1_000, 10_000, 30_000, 100_000, 300_000, 1_000_000, 3_000_000),
+)
+EXECUTOR_INFLIGHT = Gauge(
+    "executor_inflight_batches", "Batches submitted to the batch executor and not finished yet.", ("kind",),
+)
+EXECUTOR_PENDING = Gauge(
+    "executor_pending_items", "Students in batches submitted to the batch executor and not finished yet.", ("kind",),
+)
+declare(PREDICT_STAGE, [(k, s) for k in KINDS for s in STAGES[k]])
+for _m in (PREDICT_BATCH_SIZE, EXECUTOR_INFLIGHT, EXECUTOR_PENDING):
+    declare(_m, [(k,) for k in KINDS])
+
+_NOOP = nullcontext()
+
+class _StageTimer:
+    __slots__ = ("kind", "name", "rt", "t0")
+
+    def __init__(self, kind: str, name: str, rt: timing.RequestTiming | None):
+        self.kind, self.name, self.rt = kind, name, rt
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.kind, self.name, perf_counter() - self.t0, self.rt)
+
+def stage(kind: str, name: str):
+    """
+    with stage("l2", "encode"): ... -> ghi vào predict_stage_duration_seconds và vào
+    Server-Timing của request hiện tại (src.core.timing) nếu có.
+    """
+    rt = timing.current()
+    if not REGISTRY.enabled and rt is None:
+        return _NOOP
+    return _StageTimer(kind, name, rt)
+
+def observe_stage(kind: str, name: str, seconds: float, rt: timing.RequestTiming | None = None) -> None:
+    # gọi thẳng cho stage được cộng dồn qua nhiều đoạn trong một lần gọi (vd. các nhóm model L1)
+    PREDICT_STAGE.labels(kind, name).observe(seconds)
+    rt = rt or timing.current()
+    if rt is not None:
+        rt.add(name, seconds)
+
+def status_class(status: int) -> str:
+    return f"{status // 100}xx"
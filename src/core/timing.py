@@ -0,0 +1,114 @@
+"""
+Thời gian theo stage của request hiện tại (header Server-Timing, ?debug_timing=1).
+
+ServerTimingMiddleware tạo một RequestTiming cho mỗi request /predict/* và đặt vào contextvar
+(route bật thêm số liệu chi tiết bằng requested()); metrics.stage(...) cộng thời gian vào đó, predictor ghi thêm số ứng viên/cặp. Contextvar được
+copy sang thread của asyncio.to_thread / threadpool nên predictor chạy trong thread vẫn ghi
+được (cùng một object). Ngoài request (job, CLI, pool process) current() là None và mọi hàm ở
+đây không làm gì.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any
+
+# stage của predictor -> nhóm trong Server-Timing
+CATEGORIES = {
+    "validate": "validate",
+    "catalog": "preprocess", "pairs": "preprocess", "expand": "preprocess", "lookup": "preprocess",
+    "encode": "inference", "predict": "inference",
+    "postprocess": "postprocess",
+    "serialize": "serialize",
+}
+CATEGORY_ORDER = ("validate", "preprocess", "inference", "postprocess", "serialize")
+
+class RequestTiming:
+    __slots__ = ("start", "stages", "counts", "detail", "items")
+
+    def __init__(self, detail: bool = False):
+        self.start = perf_counter()
+        self.stages: dict[str, float] = {}      # stage -> giây (cộng dồn)
+        self.counts: dict[str, int] = {}        # vd. candidates, pairs
+        self.detail = detail                    # ?debug_timing=1: ghi thêm số liệu theo từng input
+        self.items: dict[str, Any] | None = None    # mảng theo input của lần gọi predictor
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, name: str, n: int) -> None:
+        self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def mark_validated(self) -> None:
+        """Gọi khi vào endpoint: phần trước đó (đọc body, parse, validate pydantic) tính là validate."""
+        if "validate" not in self.stages:
+            self.stages["validate"] = perf_counter() - self.start
+
+    def categories(self) -> dict[str, float]:
+        out: dict[str, float] = {}
+        for stage, sec in self.stages.items():
+            cat = CATEGORIES.get(stage, stage)
+            out[cat] = out.get(cat, 0.0) + sec
+        return out
+
+    def header(self) -> str:
+        cats = self.categories()
+        parts = [f"{c};dur={cats[c] * 1000:.3f}" for c in CATEGORY_ORDER if c in cats]
+        parts.append(f"total;dur={(perf_counter() - self.start) * 1000:.3f}")
+        parts += [f'{name};desc="{n}"' for name, n in self.counts.items()]
+        return ", ".join(parts)
+
+    def summary(self) -> dict:
+        ms = lambda s: round(s * 1000, 3)
+        cats = self.categories()
+        return {
+            "total_ms": ms(perf_counter() - self.start),
+            "categories_ms": {c: ms(cats[c]) for c in CATEGORY_ORDER if c in cats},
+            "stages_ms": {k: ms(v) for k, v in self.stages.items()},
+            "counts": dict(self.counts),
+        }
+
+_current: ContextVar[RequestTiming | None] = ContextVar("request_timing", default=None)
+
+def current() -> RequestTiming | None:
+    return _current.get()
+
+def begin(detail: bool = False):
+    """Bắt đầu đo cho request hiện tại; trả token để end()."""
+    rt = RequestTiming(detail)
+    return rt, _current.set(rt)
+
+def end(token) -> None:
+    _current.reset(token)
+
+@contextmanager
+def requested(detail: bool):
+    """
+    with requested(debug_timing) as rt: ... trong endpoint batch; tham số bool của route là nguồn
+    duy nhất của ?debug_timing. Bật số liệu chi tiết cho RequestTiming của request, hoặc tạo một
+    cái riêng khi không có middleware (SERVER_TIMING=0, khi đó không có stage validate).
+    rt là None khi không bật.
+    """
+    if not detail:
+        yield None
+        return
+    rt = _current.get()
+    if rt is not None:
+        rt.detail = True
+        yield rt
+        return
+    rt, token = begin(True)
+    try:
+        yield rt
+    finally:
+        end(token)
+
+def count(name: str, n: int) -> None:
+    rt = _current.get()
+    if rt is not None:
+        rt.count(name, n)
+
+def detail() -> RequestTiming | None:
+    """RequestTiming nếu request bật ?debug_timing=1, ngược lại None."""
+    rt = _current.get()
+    return rt if rt is not None and rt.detail else None
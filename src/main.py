@@ -1,9 +1,15 @@
 from fastapi import FastAPI
+import os
 from types import SimpleNamespace
 from src.core.config import settings
+from src.core import metrics
+from src.api.middleware import MetricsMiddleware, ServerTimingMiddleware, declare_routes
 from src.services.l1.predictor import L1Predictor
 from src.services.l2.predictor import L2Predictor
-from src.api.routers import l1 as l1_router, l2 as l2_router, health as health_router
+from src.services.batch_executor import BatchExecutor
+from src.services.jobs import JobRunner
+from src.api.routers import l1 as l1_router, l2 as l2_router, health as health_router, jobs as jobs_router
+from src.api.routers import metrics as metrics_router
 
 app = FastAPI(title="API", version="1.0.0")
 _state = SimpleNamespace()
@@ -11,11 +17,52 @@ _state = SimpleNamespace()
 def get_state():
     return _state
 
-@app.on_event("startup")
-def on_startup():
+def load_predictors(app: FastAPI) -> None:
     app.state.l1 = L1Predictor.load(settings.MODEL_DIR)
     app.state.l2 = L2Predictor.load(settings.MODEL_DIR, settings.L2_THRESHOLD)
 
+def make_job_runner() -> JobRunner:
+    return JobRunner(
+        settings.JOBS_DIR, settings.MODEL_DIR, settings.L2_THRESHOLD, cpu_share=settings.JOBS_CPU_SHARE,
+        nice=settings.JOBS_NICE, chunk_size=settings.JOBS_CHUNK_SIZE, poll_interval=settings.JOBS_POLL_INTERVAL,
+    )
+
+@app.on_event("startup")
+def on_startup():
+    # src.serve đã load sẵn trong tiến trình cha trước khi fork
+    if getattr(app.state, "l2", None) is None:
+        load_predictors(app)
+    # MAX_BATCH_CONCURRENCY là tổng cho cả server: dưới src.serve chia cho các worker,
+    # vì mỗi tiến trình pool load một bản L1 + L2 riêng
+    pool_workers = max(1, settings.MAX_BATCH_CONCURRENCY // getattr(app.state, "server_workers", 1))
+    app.state.executor = BatchExecutor(
+        app.state, mode=settings.BATCH_EXECUTOR, workers=pool_workers,
+        chunk_size=settings.BATCH_CHUNK_SIZE, model_dir=settings.MODEL_DIR, threshold=settings.L2_THRESHOLD,
+    )
+    app.state.executor.start()
+    # src.serve chạy job runner ở tiến trình cha; uvicorn --workers N: chỉ worker đầu tiên giữ
+    # được khoá runner của JOBS_DIR, các worker khác chỉ nhận job và trả trạng thái
+    if settings.JOBS_ENABLED and getattr(app.state, "jobs", None) is None:
+        app.state.jobs = make_job_runner()
+        app.state.jobs.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    executor = getattr(app.state, "executor", None)
+    if executor is not None:
+        executor.shutdown()
+    jobs = getattr(app.state, "jobs", None)
+    if jobs is not None and jobs.owner_pid == os.getpid():
+        jobs.shutdown()
+
 app.include_router(health_router.router)
 app.include_router(l1_router.router)
 app.include_router(l2_router.router)
+app.include_router(jobs_router.router)
+app.include_router(metrics_router.router)
+
+metrics.REGISTRY.enabled = settings.METRICS_ENABLED
+declare_routes(app)
+app.add_middleware(MetricsMiddleware)
+if settings.SERVER_TIMING:
+    app.add_middleware(ServerTimingMiddleware)
@@ -0,0 +1,170 @@
+"""
+Entry point nhiều worker kiểu pre-fork:
+
+    python -m src.serve
+
+Tiến trình cha load L1Predictor, L2Predictor (kèm catalog) đúng một lần, gc.freeze() rồi
+fork WORKERS tiến trình uvicorn dùng chung socket. Các worker dùng chung trang nhớ của model
+theo copy-on-write; gc.freeze() đưa các object đã load ra khỏi vùng GC quét để việc ghi
+refcount/GC header không làm tách trang.
+
+Polars không an toàn sau fork (thread pool của tiến trình cha không còn trong tiến trình con),
+nên worker không tự reload catalog: tiến trình cha theo dõi file catalog và khi có phiên bản
+mới thì load lại rồi thay lần lượt toàn bộ worker (fork thế hệ mới trước, dừng thế hệ cũ sau).
+Worker chết bất thường được fork lại.
+"""
+from __future__ import annotations
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from src.core.config import settings
+from src.core import metrics
+from src.main import app, load_predictors, make_job_runner
+
+logger = logging.getLogger("src.serve")
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def _run_worker(sock: socket.socket) -> None:
+    # tiến trình con: bỏ handler của cha, uvicorn tự cài SIGINT/SIGTERM để tắt êm
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    app.state.l2.catalog.check_interval = -1       # cha lo reload catalog
+    config = uvicorn.Config(app, log_level=settings.LOG_LEVEL, timeout_graceful_shutdown=30)
+    uvicorn.Server(config).run(sockets=[sock])
+
+class Arbiter:
+    """Quản lý các worker: fork, fork lại khi chết, thay thế khi catalog đổi, tắt khi nhận tín hiệu."""
+
+    def __init__(self, sock: socket.socket, workers: int):
+        self.sock = sock
+        self.n = workers
+        self.pids: set[int] = set()
+        self.retiring: set[int] = set()     # worker cũ đang được thay, không fork lại khi thoát
+        self.stopping = False
+
+    def _freeze(self) -> None:
+        gc.collect()
+        gc.freeze()
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                _run_worker(self.sock)
+                code = 0
+            finally:
+                os._exit(code)
+        self.pids.add(pid)
+        return pid
+
+    def spawn_generation(self) -> set[int]:
+        self._freeze()
+        return {self.spawn() for _ in range(self.n)}
+
+    def retire(self, pids: set[int]) -> None:
+        self.pids -= pids
+        self.retiring |= pids
+        self.stop(pids)
+
+    def stop(self, pids: set[int], sig: int = signal.SIGTERM) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def reap(self) -> list[int]:
+        dead = []
+        # chỉ đợi worker uvicorn: tiến trình job runner do multiprocessing tự quản lý
+        for child in list(self.pids | self.retiring):
+            try:
+                pid, status = os.waitpid(child, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = child, 0
+            if pid == 0:
+                continue
+            self.retiring.discard(pid)
+            metrics.mark_dead(pid)      # bỏ gauge (vd. batch đang chấm dở), giữ counter/histogram
+            if pid in self.pids:
+                self.pids.discard(pid)
+                dead.append(pid)
+                if not self.stopping:
+                    logger.warning("Worker %d exited (status %d), restarting", pid, status)
+        return dead
+
+    def run(self) -> None:
+        def _shutdown(signum, frame):
+            self.stopping = True
+        signal.signal(signal.SIGTERM, _shutdown)
+        signal.signal(signal.SIGINT, _shutdown)
+
+        self.spawn_generation()
+        logger.info("Serving on %s with %d workers", self.sock.getsockname(), self.n)
+        store = app.state.l2.catalog
+        interval = settings.L2_CATALOG_RELOAD_INTERVAL
+        next_check = time.monotonic() + interval if interval >= 0 else float("inf")
+        while not self.stopping:
+            time.sleep(0.5)
+            for _ in self.reap():
+                if not self.stopping:
+                    self.spawn()
+            jobs = getattr(app.state, "jobs", None)
+            if jobs is not None:
+                jobs.check()
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + interval
+                if store.maybe_reload():
+                    old = set(self.pids)
+                    self.spawn_generation()
+                    self.retire(old)
+                    logger.info("Catalog changed, replaced %d workers", len(old))
+
+        self.retire(set(self.pids))
+        deadline = time.monotonic() + 35
+        while self.retiring and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.stop(self.retiring, signal.SIGKILL)
+
+def main() -> None:
+    logging.basicConfig(level=settings.LOG_LEVEL.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    workers = settings.WORKERS or os.cpu_count() or 1
+    load_predictors(app)
+    app.state.server_workers = workers
+    if settings.BATCH_EXECUTOR == "process" and workers > 1:
+        per_worker = max(1, settings.MAX_BATCH_CONCURRENCY // workers)
+        logger.warning(
+            "BATCH_EXECUTOR=process with %d workers: %d pool process(es) per worker, %d private model copies "
+            "outside the shared pages; BATCH_EXECUTOR=thread keeps a single shared copy",
+            workers, per_worker, workers * per_worker,
+        )
+    # PROMETHEUS_MULTIPROC_DIR do người chạy đặt có thể còn file của lần chạy trước
+    metrics.clear_stale()
+    if settings.JOBS_ENABLED:
+        # một runner cho cả server; tiến trình con (spawn) không bị fork cùng worker
+        app.state.jobs = make_job_runner()
+        app.state.jobs.start(monitor=False)
+    sock = _bind(settings.HOST, settings.PORT)
+    Arbiter(sock, workers).run()
+    if settings.JOBS_ENABLED:
+        app.state.jobs.shutdown()
+    sock.close()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
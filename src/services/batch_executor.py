@@ -0,0 +1,185 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Sequence
+import asyncio
+import logging
+import multiprocessing as mp
+import threading
+
+from src.core import metrics
+from src.services.constants import plain_value
+from src.services.l1.schema import UserInputL1, L1PredictResult
+from src.services.l2.schema import UserInputL2, L2PredictResult
+
+logger = logging.getLogger(__name__)
+
+_SCHEMAS = {"l1": UserInputL1, "l2": UserInputL2}
+_FIELDS = {k: tuple(s.model_fields) for k, s in _SCHEMAS.items()}
+
+def encode_items(kind: str, users: Sequence[Any]) -> list[tuple]:
+    """Input đã validate -> tuple giá trị theo thứ tự field của schema."""
+    fields = _FIELDS[kind]
+    return [tuple(plain_value(getattr(u, f)) for f in fields) for u in users]
+
+def decode_items(kind: str, rows: Sequence[tuple]) -> list[Any]:
+    # dữ liệu đã qua validate ở tiến trình API, chỉ dựng lại object
+    schema, fields = _SCHEMAS[kind], _FIELDS[kind]
+    return [schema.model_construct(**dict(zip(fields, r))) for r in rows]
+
+def encode_results(kind: str, results: list[list]) -> list[list[tuple]]:
+    if kind == "l2":
+        return [[(r.ma_xet_tuyen, r.score) for r in res] for res in results]
+    return [[(r.loai_uu_tien, r.ma_xet_tuyen) for r in res] for res in results]
+
+def decode_results(kind: str, rows: list[list[tuple]]) -> list[list]:
+    if kind == "l2":
+        return [[L2PredictResult.model_construct(ma_xet_tuyen=m, score=s) for m, s in res] for res in rows]
+    return [[L1PredictResult.model_construct(loai_uu_tien=l, ma_xet_tuyen=m) for l, m in res] for res in rows]
+
+# ---- phía tiến trình con ----
+_worker_predictors: dict[str, Any] = {}
+
+def _init_worker(model_dir: str, threshold: float, metrics_enabled: bool = True) -> None:
+    from src.services.l1.predictor import L1Predictor
+    from src.services.l2.predictor import L2Predictor
+    _worker_predictors["l1"] = L1Predictor.load(Path(model_dir))
+    _worker_predictors["l2"] = L2Predictor.load(Path(model_dir), threshold)
+    metrics.REGISTRY.enabled = metrics_enabled
+
+# metric ghi trong pool (stage, batch size, số cặp) nằm trong file của tiến trình pool ở
+# PROMETHEUS_MULTIPROC_DIR (kế thừa qua biến môi trường), /metrics của API gộp cả phần này
+def _predict_chunk(kind: str, rows: list[tuple], top_k: int | None = None) -> list[list[tuple]]:
+    users = decode_items(kind, rows)
+    return encode_results(kind, _predict_many(_worker_predictors[kind], users, top_k))
+
+def _predict_students_chunk(students, top_k: int | None = None) -> list[list[tuple]]:
+    return encode_results("l2", _worker_predictors["l2"].predict_students(students, top_k))
+
+def _predict_many(predictor: Any, users: Sequence[Any], top_k: int | None) -> list[list]:
+    # top_k chỉ có ở L2 (chọn k mã trong predictor, không cắt sau khi sắp hết)
+    return predictor.predict_many(users) if top_k is None else predictor.predict_many(users, top_k)
+
+def _ping(_: int = 0) -> bool:
+    return True
+
+class _inflight:
+    """Gauge số batch/học sinh đang chờ hoặc đang chấm trong executor (executor_inflight_*)."""
+    __slots__ = ("batches", "items", "n")
+
+    def __init__(self, kind: str, n: int):
+        self.batches = metrics.EXECUTOR_INFLIGHT.labels(kind)
+        self.items = metrics.EXECUTOR_PENDING.labels(kind)
+        self.n = n
+
+    def __enter__(self):
+        self.batches.inc()
+        self.items.inc(self.n)
+
+    def __exit__(self, *exc):
+        self.batches.dec()
+        self.items.dec(self.n)
+
+class BatchExecutor:
+    """
+    Chạy predict_many cho endpoint batch theo BATCH_EXECUTOR:
+
+    - "thread": một lần predict_many của predictor trong tiến trình API, chạy trong thread pool.
+    - "process": batch được chia thành chunk BATCH_CHUNK_SIZE item, gửi tới pool tiến trình
+      (mỗi tiến trình tự load predictor lúc khởi tạo). Item và kết quả truyền dạng tuple giá trị
+      thay vì pickle object pydantic. Pool hỏng (worker chết) được dựng lại và chunk được chạy lại một lần.
+      Metric ghi trong pool process được gộp vào /metrics qua PROMETHEUS_MULTIPROC_DIR.
+    """
+
+    def __init__(self, state: Any, mode: str = "thread", workers: int = 2, chunk_size: int = 64,
+                 model_dir: Path | None = None, threshold: float = 0.5):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"BATCH_EXECUTOR must be 'thread' or 'process', got {mode!r}")
+        self.state = state
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.model_dir = model_dir
+        self.threshold = threshold
+        self.restarts = 0
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: polars/OpenMP không an toàn khi fork từ tiến trình đã có thread pool
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(str(self.model_dir), self.threshold, metrics.REGISTRY.enabled),
+                )
+            return self._pool
+
+    def _reset_pool(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+                self.restarts += 1
+                logger.warning("Batch process pool broken, restarting (restart #%d)", self.restarts)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def start(self) -> None:
+        """Khởi động pool và đợi các worker load xong (gọi lúc startup ở chế độ process)."""
+        if self.mode == "process":
+            pool = self._get_pool()
+            list(pool.map(_ping, range(self.workers)))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    async def _run_chunk(self, fn, *args) -> list[list[tuple]]:
+        loop = asyncio.get_running_loop()
+        for attempt in (0, 1):
+            pool = self._get_pool()
+            try:
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+    async def run(self, kind: str, users: Sequence[Any], top_k: int | None = None) -> list[list]:
+        """top_k (chỉ L2): mỗi item chỉ trả k kết quả điểm cao nhất."""
+        if not users:
+            return []
+        with _inflight(kind, len(users)):
+            return await self._run(kind, users, top_k)
+
+    async def _run(self, kind: str, users: Sequence[Any], top_k: int | None) -> list[list]:
+        if self.mode == "thread":
+            return await asyncio.to_thread(_predict_many, getattr(self.state, kind), users, top_k)
+        rows = encode_items(kind, users)
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+        parts = await asyncio.gather(*(self._run_chunk(_predict_chunk, kind, c, top_k) for c in chunks))
+        return decode_results(kind, [r for part in parts for r in part])
+
+    async def run_students(self, students, top_k: int | None = None) -> list[list]:
+        """Như run("l2", ...) với học sinh đã ở dạng cột (L2Students, xem src.services.l2.columnar)."""
+        n = len(students)
+        if not n:
+            return []
+        with _inflight("l2", n):
+            return await self._run_students(students, top_k)
+
+    async def _run_students(self, students, top_k: int | None) -> list[list]:
+        n = len(students)
+        if self.mode == "thread":
+            return await asyncio.to_thread(self.state.l2.predict_students, students, top_k)
+        chunks = [students.take(slice(i, i + self.chunk_size)) for i in range(0, n, self.chunk_size)]
+        parts = await asyncio.gather(*(self._run_chunk(_predict_students_chunk, c, top_k) for c in chunks))
+        return decode_results("l2", [r for part in parts for r in part])
+
+    def snapshot(self) -> dict:
+        return {"mode": self.mode, "workers": self.workers if self.mode == "process" else 0,
+                "chunk_size": self.chunk_size, "restarts": self.restarts}
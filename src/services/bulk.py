@@ -0,0 +1,292 @@
+"""
+Đọc file input (CSV/Parquet/xlsx) theo chunk, chấm bằng predict_many và ghi kết quả Parquet
+dần từng chunk. Dùng chung cho job nền (src.services.jobs) và CLI chấm offline:
+
+    python -m src.services.bulk score l2 hoc_sinh.xlsx ket_qua.parquet --workers 4
+
+Kết quả dạng dài, mỗi dòng một (input, ngành):
+  l2: index, ma_xet_tuyen, score, error
+  l1: index, loai_uu_tien, ma_xet_tuyen, score, error
+index là số thứ tự dòng trong file input (từ 0). Dòng không hợp lệ có đúng một dòng kết quả
+với cột error; dòng có tinh_tp ngoài danh sách không có dòng kết quả nào (như API trả []).
+"""
+from __future__ import annotations
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Iterator, Sequence
+import argparse
+import csv
+import itertools
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pydantic import ValidationError
+
+from src.services.l1.schema import UserInputL1
+from src.services.l2.schema import UserInputL2
+
+INPUT_FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet", ".xlsx": "xlsx"}
+SCHEMAS = {"l1": UserInputL1, "l2": UserInputL2}
+
+RESULT_SCHEMAS = {
+    "l2": pa.schema([("index", pa.int64()), ("ma_xet_tuyen", pa.string()),
+                     ("score", pa.float64()), ("error", pa.string())]),
+    "l1": pa.schema([("index", pa.int64()), ("loai_uu_tien", pa.string()), ("ma_xet_tuyen", pa.string()),
+                     ("score", pa.float64()), ("error", pa.string())]),
+}
+
+def input_format(path: Path, fmt: str | None = None) -> str:
+    if fmt is None:
+        fmt = INPUT_FORMATS.get(Path(path).suffix.lower())
+    if fmt not in ("csv", "parquet", "xlsx"):
+        raise ValueError(f"unsupported input format for {path} (expected csv, parquet or xlsx)")
+    return fmt
+
+def count_rows(path: Path, fmt: str | None = None) -> int | None:
+    """Số dòng dữ liệu (không tính header); None nếu không biết trước."""
+    fmt = input_format(path, fmt)
+    if fmt == "parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return max(0, sum(1 for row in csv.reader(f) if row) - 1)
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        n = wb.active.max_row
+        return None if n is None else max(0, n - 1)
+    finally:
+        wb.close()
+
+def _blank_to_none(row: dict) -> dict:
+    # ô trống trong CSV/xlsx = không có giá trị (để default của schema áp dụng)
+    return {k: v for k, v in row.items() if k is not None and v is not None and v != ""}
+
+def _iter_rows(path: Path, fmt: str) -> Iterator[dict]:
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                yield _blank_to_none(row)
+    elif fmt == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=4096):
+            for row in batch.to_pylist():
+                yield _blank_to_none(row)
+    else:
+        # read_only: openpyxl đọc từng dòng, không nạp cả sheet
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [None if h is None else str(h).strip() for h in next(rows, ())]
+            for values in rows:
+                if any(v is not None for v in values):
+                    yield _blank_to_none(dict(zip(header, values)))
+        finally:
+            wb.close()
+
+def iter_record_chunks(path: Path, chunk_size: int, fmt: str | None = None) -> Iterator[list[dict]]:
+    """Các dòng input (dict tên cột -> giá trị) theo chunk chunk_size dòng."""
+    rows = _iter_rows(Path(path), input_format(path, fmt))
+    while chunk := list(itertools.islice(rows, max(1, chunk_size))):
+        yield chunk
+
+def _error_text(e: ValidationError, max_msg: int = 120) -> str:
+    # lỗi enum liệt kê mọi giá trị hợp lệ -> cắt bớt
+    parts = []
+    for err in e.errors():
+        msg = err["msg"] if len(err["msg"]) <= max_msg else err["msg"][:max_msg] + "..."
+        parts.append(f"{'.'.join(map(str, err['loc'])) or 'input'}: {msg}")
+    return "; ".join(parts)
+
+def validate_records(kind: str, records: Sequence[dict]) -> tuple[list[tuple[int, Any]], dict[int, str]]:
+    """-> ([(vị trí, input hợp lệ cần chấm)], {vị trí: lỗi}); bỏ qua input có tinh_tp ngoài danh sách."""
+    schema = SCHEMAS[kind]
+    valid, errors = [], {}
+    for i, rec in enumerate(records):
+        try:
+            user = schema.model_validate(rec)
+        except ValidationError as e:
+            errors[i] = _error_text(e)
+            continue
+        if user.is_tinh_tp_valid:
+            valid.append((i, user))
+    return valid, errors
+
+def results_table(kind: str, start: int, n: int, valid: Sequence[tuple[int, Any]],
+                  results: Sequence[list], errors: dict[int, str]) -> pa.Table:
+    """Gộp kết quả predict_many của một chunk (bắt đầu ở dòng start, n dòng) thành bảng dạng dài."""
+    scored = {i: res for (i, _), res in zip(valid, results)}
+    cols: dict[str, list] = {name: [] for name in RESULT_SCHEMAS[kind].names}
+    for i in range(n):
+        if i in errors:
+            row_items = [(None, None, None, errors[i])]
+        elif kind == "l2":
+            row_items = [(None, r.ma_xet_tuyen, r.score, None) for r in scored.get(i, [])]
+        else:
+            row_items = [(r.loai_uu_tien, ma, p, None) for r in scored.get(i, []) for ma, p in r.ma_xet_tuyen.items()]
+        for loai, ma, score, err in row_items:
+            cols["index"].append(start + i)
+            if kind == "l1":
+                cols["loai_uu_tien"].append(loai)
+            cols["ma_xet_tuyen"].append(ma)
+            cols["score"].append(None if score is None else float(score))
+            cols["error"].append(err)
+    return pa.Table.from_pydict(cols, schema=RESULT_SCHEMAS[kind])
+
+def score_records(predictor: Any, kind: str, records: Sequence[dict], start: int = 0) -> tuple[pa.Table, int]:
+    """Chấm một chunk bằng predictor.predict_many -> (bảng kết quả, số dòng lỗi)."""
+    valid, errors = validate_records(kind, records)
+    results = predictor.predict_many([u for _, u in valid]) if valid else []
+    return results_table(kind, start, len(records), valid, results, errors), len(errors)
+
+class ResultWriter:
+    """Ghi kết quả Parquet dần từng chunk (một row group mỗi lần write)."""
+
+    def __init__(self, path: Path, kind: str):
+        self.path = Path(path)
+        self.rows = 0
+        self._writer = pq.ParquetWriter(self.path, RESULT_SCHEMAS[kind], compression="zstd")
+
+    def write(self, table: pa.Table) -> None:
+        if table.num_rows:
+            self._writer.write_table(table)
+            self.rows += table.num_rows
+
+    def close(self) -> None:
+        self._writer.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+# ---- CLI chấm offline ----
+_worker_predictor: Any = None
+
+def load_predictor(kind: str, model_dir: Path, threshold: float) -> Any:
+    if kind == "l1":
+        from src.services.l1.predictor import L1Predictor
+        return L1Predictor.load(Path(model_dir))
+    from src.services.l2.predictor import L2Predictor
+    return L2Predictor.load(Path(model_dir), threshold)
+
+def _init_worker(kind: str, model_dir: str, threshold: float) -> None:
+    global _worker_predictor
+    _worker_predictor = load_predictor(kind, Path(model_dir), threshold)
+
+def _score_chunk(kind: str, start: int, records: list[dict]) -> tuple[int, int, pa.Table, int]:
+    table, n_err = score_records(_worker_predictor, kind, records, start)
+    return start, len(records), table, n_err
+
+def _ping(_: int = 0) -> bool:
+    return True
+
+def score_file(kind: str, src: Path, out: Path, model_dir: Path, threshold: float = 0.5,
+               workers: int = 1, chunk_size: int = 1000, fmt: str | None = None,
+               progress_every: float = 5.0) -> dict:
+    """
+    Chấm toàn bộ file src, ghi kết quả Parquet out theo đúng thứ tự input.
+
+    workers = 0: chấm ngay trong tiến trình hiện tại; workers >= 1: pool tiến trình spawn, mỗi
+    tiến trình load predictor (kèm catalog) một lần. Tối đa 2 * workers chunk đang chấm cùng lúc,
+    chunk xong sớm được giữ lại đến lượt ghi, nên bộ nhớ không phụ thuộc kích thước file.
+    """
+    fmt = input_format(src, fmt)
+    total = count_rows(src, fmt)
+    t0 = time.perf_counter()
+    pool = None
+    if workers > 0:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(kind, str(model_dir), threshold))
+        list(pool.map(_ping, range(workers)))       # đợi các tiến trình load xong
+    else:
+        _init_worker(kind, str(model_dir), threshold)
+    t_loaded = time.perf_counter()
+
+    done = failed = 0
+    last_report = t_loaded
+    def report(final: bool = False) -> None:
+        elapsed = time.perf_counter() - t_loaded
+        rate = done / elapsed if elapsed > 0 else 0.0
+        of = f"/{total}" if total is not None else ""
+        print(f"{'done' if final else 'progress'}: {done}{of} rows, {rate:,.0f} rows/s", file=sys.stderr, flush=True)
+
+    try:
+        with ResultWriter(out, kind) as writer:
+            chunks = iter_record_chunks(src, chunk_size, fmt)
+            if pool is None:
+                start = 0
+                for records in chunks:
+                    _, n, table, n_err = _score_chunk(kind, start, records)
+                    writer.write(table)
+                    start += n
+                    done, failed = done + n, failed + n_err
+                    if time.perf_counter() - last_report >= progress_every:
+                        last_report = time.perf_counter()
+                        report()
+            else:
+                inflight: set[Future] = set()
+                ready: dict[int, tuple[int, pa.Table, int]] = {}
+                next_start = submit_start = 0
+                exhausted = False
+                while not exhausted or inflight:
+                    while not exhausted and len(inflight) < 2 * workers:
+                        records = next(chunks, None)
+                        if records is None:
+                            exhausted = True
+                            break
+                        inflight.add(pool.submit(_score_chunk, kind, submit_start, records))
+                        submit_start += len(records)
+                    finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        start, n, table, n_err = fut.result()
+                        ready[start] = (n, table, n_err)
+                    # ghi theo thứ tự input
+                    while next_start in ready:
+                        n, table, n_err = ready.pop(next_start)
+                        writer.write(table)
+                        next_start += n
+                        done, failed = done + n, failed + n_err
+                    if time.perf_counter() - last_report >= progress_every:
+                        last_report = time.perf_counter()
+                        report()
+            result_rows = writer.rows
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    report(final=True)
+    scoring_s = time.perf_counter() - t_loaded
+    return {
+        "rows": done, "failed_rows": failed, "result_rows": result_rows,
+        "load_s": round(t_loaded - t0, 3), "scoring_s": round(scoring_s, 3),
+        "rows_per_s": round(done / scoring_s, 1) if scoring_s > 0 else None,
+    }
+
+def main(argv: list[str] | None = None) -> None:
+    import json
+    from src.core.config import settings
+    parser = argparse.ArgumentParser(description="Chấm điểm hàng loạt từ file CSV/Parquet/xlsx")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sc = sub.add_parser("score", help="Chấm file input, ghi kết quả Parquet")
+    sc.add_argument("kind", choices=sorted(SCHEMAS))
+    sc.add_argument("input", type=Path)
+    sc.add_argument("output", type=Path)
+    sc.add_argument("--format", choices=["csv", "parquet", "xlsx"], default=None, help="mặc định: theo đuôi file")
+    sc.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="0: chấm trong tiến trình hiện tại")
+    sc.add_argument("--chunk-size", type=int, default=1000)
+    sc.add_argument("--model-dir", type=Path, default=settings.MODEL_DIR)
+    sc.add_argument("--threshold", type=float, default=settings.L2_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "score":
+        stats = score_file(args.kind, args.input, args.output, args.model_dir, args.threshold,
+                           workers=args.workers, chunk_size=args.chunk_size, fmt=args.format)
+        print(json.dumps({"output": str(args.output), **stats}, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
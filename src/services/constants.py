@@ -1,5 +1,7 @@
 from enum import IntEnum, StrEnum
 
+import numpy as np
+
 class TinhTP(StrEnum):
     AN_GIANG = "An Giang",
     BAC_LIEU = "Bạc Liêu",
@@ -236,4 +238,14 @@ class CEFRLevel(StrEnum):
     A1 = "A1"; A2 = "A2"; B1 = "B1"; B2 = "B2"; C1 = "C1"; C2 = "C2"
 
 class JLPTLevel(StrEnum):
-    N5 = "N5"; N4 = "N4"; N3 = "N3"; N2 = "N2"; N1 = "N1"
\ No newline at end of file
+    N5 = "N5"; N4 = "N4"; N3 = "N3"; N2 = "N2"; N1 = "N1"
+
+def plain_value(v):
+    """IntEnum/StrEnum/np.int64/np.bool_ -> int/str/bool thuần: cùng hash với giá trị gốc, ghi được JSON, pickle gọn."""
+    if isinstance(v, (bool, np.bool_)):
+        return bool(v)
+    if isinstance(v, (int, np.integer)):
+        return int(v)
+    if isinstance(v, str):
+        return str(v)
+    return v
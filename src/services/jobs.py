@@ -0,0 +1,389 @@
+"""
+Job chấm điểm hàng loạt chạy nền, không cần dịch vụ ngoài:
+
+  JOBS_DIR/jobs.db            SQLite: trạng thái và tiến độ các job
+  JOBS_DIR/<job_id>/input.*   file upload (csv/parquet/xlsx)
+  JOBS_DIR/<job_id>/result.parquet
+
+JobRunner chạy các tiến trình con (spawn), mỗi tiến trình load L1/L2 predictor một lần, lấy
+job "queued" từ SQLite, chấm theo chunk JOBS_CHUNK_SIZE dòng (src.services.bulk) và cập nhật
+tiến độ sau mỗi chunk. Để không tranh CPU với /predict/*, số tiến trình là
+max(1, JOBS_CPU_SHARE * số CPU), các tiến trình chạy với nice JOBS_NICE và được gắn vào đúng
+số CPU đó. Mỗi JOBS_DIR chỉ có một runner chạy tiến trình job (khoá file runner.lock), kể cả
+khi nhiều tiến trình server cùng gọi start() (vd. uvicorn --workers N).
+"""
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+import fcntl
+import logging
+import math
+import multiprocessing as mp
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_FILE = "jobs.db"
+RESULT_FILE = "result.parquet"
+RUNNER_LOCK_FILE = "runner.lock"
+JOB_KINDS = ("l1", "l2")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    input_format TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows_total INTEGER,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    rows_failed INTEGER NOT NULL DEFAULT 0,
+    result_rows INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    kind: str
+    input_format: str
+    status: str                 # queued | running | done | failed
+    rows_total: int | None
+    rows_done: int
+    rows_failed: int
+    result_rows: int
+    error: str | None
+    worker_pid: int | None
+    created_at: float
+    started_at: float | None
+    finished_at: float | None
+
+    @property
+    def progress(self) -> float | None:
+        if self.status == "done":
+            return 1.0
+        if not self.rows_total:
+            return None
+        return min(1.0, self.rows_done / self.rows_total)
+
+    def to_dict(self) -> dict:
+        out = asdict(self)
+        out.pop("worker_pid")
+        out["progress"] = self.progress
+        return out
+
+class JobStore:
+    """Trạng thái job trong SQLite; mỗi thao tác mở kết nối riêng nên dùng được từ nhiều tiến trình."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / JOB_DB_FILE
+        con = self._connect()
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+        finally:
+            con.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        con = self._connect()
+        try:
+            return con.execute(sql, params)
+        finally:
+            con.close()
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def input_path(self, job: Job) -> Path:
+        return self.job_dir(job.id) / f"input.{job.input_format}"
+
+    def result_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / RESULT_FILE
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def create(self, job_id: str, kind: str, input_format: str, rows_total: int | None) -> Job:
+        """Đăng ký job khi file input đã nằm ở job_dir(job_id)/input.<format>."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"kind must be one of {JOB_KINDS}, got {kind!r}")
+        self._execute(
+            "INSERT INTO jobs (id, kind, input_format, status, rows_total, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, kind, input_format, rows_total, time.time()),
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Job | None:
+        con = self._connect()
+        try:
+            row = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            con.close()
+        return Job(**dict(row)) if row is not None else None
+
+    def claim(self, worker_pid: int) -> Job | None:
+        """Lấy job queued cũ nhất và chuyển sang running (nguyên tử giữa các tiến trình)."""
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            row = con.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is not None:
+                con.execute(
+                    "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, rows_done = 0, "
+                    "rows_failed = 0, result_rows = 0, error = NULL WHERE id = ?",
+                    (worker_pid, time.time(), row["id"]),
+                )
+            con.execute("COMMIT")
+        finally:
+            con.close()
+        return self.get(row["id"]) if row is not None else None
+
+    def progress(self, job_id: str, rows_done: int, rows_failed: int, result_rows: int) -> None:
+        self._execute("UPDATE jobs SET rows_done = ?, rows_failed = ?, result_rows = ? WHERE id = ?",
+                      (rows_done, rows_failed, result_rows, job_id))
+
+    def finish(self, job_id: str, rows_total: int) -> None:
+        self._execute("UPDATE jobs SET status = 'done', rows_total = ?, finished_at = ? WHERE id = ?",
+                      (rows_total, time.time(), job_id))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                      (error, time.time(), job_id))
+
+    def requeue(self, job_id: str) -> None:
+        self._execute("UPDATE jobs SET status = 'queued', worker_pid = NULL, started_at = NULL WHERE id = ?", (job_id,))
+
+    def requeue_running(self) -> int:
+        """
+        Job đang running mà tiến trình chạy nó đã mất (runner khởi động lại) -> chạy lại từ đầu.
+        Job của tiến trình còn sống (vd. runner khác vẫn đang chạy) được giữ nguyên.
+        """
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            rows = con.execute("SELECT id, worker_pid FROM jobs WHERE status = 'running'").fetchall()
+            lost = [r["id"] for r in rows if not _pid_alive(r["worker_pid"])]
+            for job_id in lost:
+                con.execute("UPDATE jobs SET status = 'queued', worker_pid = NULL, started_at = NULL WHERE id = ?", (job_id,))
+            con.execute("COMMIT")
+        finally:
+            con.close()
+        return len(lost)
+
+    def fail_worker(self, worker_pid: int, error: str) -> int:
+        return self._execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE status = 'running' AND worker_pid = ?",
+            (error, time.time(), worker_pid),
+        ).rowcount
+
+    def counts(self) -> dict[str, int]:
+        con = self._connect()
+        try:
+            return {r["status"]: r["n"] for r in con.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+        finally:
+            con.close()
+
+def _pid_alive(pid: int | None) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def run_job(store: JobStore, job: Job, predictor: Any, chunk_size: int, stop: threading.Event | None = None) -> bool:
+    """Chấm toàn bộ file input của job, ghi result.parquet. False nếu bị dừng giữa chừng (job được xếp lại hàng đợi)."""
+    from src.services.bulk import ResultWriter, iter_record_chunks, score_records
+
+    out = store.result_path(job.id)
+    tmp = out.with_suffix(".parquet.tmp")
+    done = failed = 0
+    stopped = False
+    with ResultWriter(tmp, job.kind) as writer:
+        for records in iter_record_chunks(store.input_path(job), chunk_size, job.input_format):
+            if stop is not None and stop.is_set():
+                stopped = True
+                break
+            table, n_err = score_records(predictor, job.kind, records, start=done)
+            writer.write(table)
+            done += len(records)
+            failed += n_err
+            store.progress(job.id, done, failed, writer.rows)
+    if stopped:
+        tmp.unlink(missing_ok=True)
+        store.requeue(job.id)
+        return False
+    tmp.replace(out)
+    store.finish(job.id, done)
+    return True
+
+def _limit_cpu(cpus: list[int] | None, nice: int) -> None:
+    if nice:
+        os.nice(nice)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        # OpenMP (LightGBM) cũng chỉ dùng số luồng bằng số CPU được gán
+        os.sched_setaffinity(0, cpus)
+
+def _worker_main(root: str, model_dir: str, threshold: float, chunk_size: int, poll: float,
+                 cpus: list[int] | None, nice: int) -> None:
+    # tiến trình cha dừng worker bằng SIGTERM (xong chunk hiện tại rồi thoát), không qua Ctrl-C
+    # của cả process group; không dùng mp.Event vì nó kẹt khi một tiến trình đang đợi bị kill
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _limit_cpu(cpus, nice)
+    from src.services.l1.predictor import L1Predictor
+    from src.services.l2.predictor import L2Predictor
+
+    store = JobStore(Path(root))
+    predictors = {
+        "l1": L1Predictor.load(Path(model_dir)),
+        "l2": L2Predictor.load(Path(model_dir), threshold),
+    }
+    pid = os.getpid()
+    while not stop.is_set():
+        job = store.claim(pid)
+        if job is None:
+            stop.wait(poll)
+            continue
+        logger.info("Job %s (%s) started in worker %d", job.id, job.kind, pid)
+        try:
+            finished = run_job(store, job, predictors[job.kind], chunk_size, stop)
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            store.fail(job.id, f"{type(e).__name__}: {e}")
+            continue
+        if finished:
+            logger.info("Job %s done", job.id)
+
+def job_worker_count(cpu_share: float, cpu_count: int | None = None) -> int:
+    return max(1, math.floor((cpu_count or os.cpu_count() or 1) * cpu_share))
+
+class JobRunner:
+    """
+    Quản lý các tiến trình chạy job. check() chạy lại tiến trình chết (job nó đang chạy bị đánh
+    dấu failed để không lặp lại vô hạn khi job làm tiến trình chết, vd. hết bộ nhớ); start() mặc định
+    gọi check() định kỳ trong một thread, src.serve tự gọi check() trong vòng lặp của nó.
+    """
+
+    def __init__(self, root: Path, model_dir: Path, threshold: float = 0.5, cpu_share: float = 0.5,
+                 nice: int = 10, chunk_size: int = 1000, poll_interval: float = 1.0):
+        self.store = JobStore(root)
+        self.model_dir = model_dir
+        self.threshold = threshold
+        self.workers = job_worker_count(cpu_share)
+        self.nice = nice
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.restarts = 0
+        self.owner_pid = os.getpid()
+        self._lock_fd: int | None = None
+        self._ctx = mp.get_context("spawn")
+        self._stop = threading.Event()
+        self._procs: list[Any] = []
+        self._monitor: threading.Thread | None = None
+
+    def _cpus(self) -> list[int] | None:
+        if not hasattr(os, "sched_getaffinity"):
+            return None
+        avail = sorted(os.sched_getaffinity(0))
+        # gán các CPU cuối cho job, tránh CPU 0 nơi tiến trình API thường chạy
+        return avail[-self.workers:] if self.workers < len(avail) else None
+
+    def _spawn(self) -> Any:
+        p = self._ctx.Process(
+            target=_worker_main, name="job-worker", daemon=True,
+            args=(str(self.store.root), str(self.model_dir), self.threshold, self.chunk_size,
+                  self.poll_interval, self._cpus(), self.nice),
+        )
+        p.start()
+        return p
+
+    def _acquire(self) -> bool:
+        fd = os.open(self.store.root / RUNNER_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def start(self, monitor: bool = True) -> bool:
+        """
+        Chạy các tiến trình job; False (không chạy gì) nếu một runner khác đang giữ JOBS_DIR.
+        Runner không chạy vẫn dùng được store để nhận job và trả trạng thái.
+        """
+        if not self._acquire():
+            logger.info("Job runner already active for %s, not starting workers in process %d",
+                        self.store.root, os.getpid())
+            return False
+        n = self.store.requeue_running()
+        if n:
+            logger.warning("Requeued %d interrupted jobs", n)
+        self._procs = [self._spawn() for _ in range(self.workers)]
+        if monitor:
+            self._monitor = threading.Thread(target=self._watch, name="job-monitor", daemon=True)
+            self._monitor.start()
+        return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def check(self) -> None:
+        if self._stop.is_set():
+            return
+        for i, p in enumerate(self._procs):
+            if p.is_alive():
+                continue
+            p.join()
+            self.store.fail_worker(p.pid, f"job worker exited unexpectedly (exit code {p.exitcode})")
+            self.restarts += 1
+            logger.warning("Job worker %d exited (code %s), restarting", p.pid, p.exitcode)
+            self._procs[i] = self._spawn()
+
+    def shutdown(self, timeout: float = 30.0) -> None:
+        """Dừng các tiến trình; job đang chạy dừng sau chunk hiện tại và quay lại hàng đợi."""
+        self._stop.set()
+        for p in self._procs:
+            p.terminate()
+        deadline = time.monotonic() + timeout
+        for p in self._procs:
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                p.kill()
+                p.join()
+        self._procs = []
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def snapshot(self) -> dict:
+        # chỉ tiến trình đã tạo worker mới hỏi được trạng thái (worker uvicorn của src.serve
+        # hay tiến trình không giữ khoá runner thì không)
+        running = os.getpid() == self.owner_pid and self._lock_fd is not None
+        alive = sum(p.is_alive() for p in self._procs) if running else None
+        return {"workers": self.workers, "alive": alive,
+                "restarts": self.restarts, "jobs": self.store.counts()}
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Tuple
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pandas as pd
+
+from src.services.constants import HSGSubject
+from src.services.l1.preprocess import FLAG_COLS
+from src.services.l1.model_store import group_key
+
+if TYPE_CHECKING:
+    from src.services.l1.predictor import L1Predictor
+
+logger = logging.getLogger(__name__)
+
+L1_ANSWER_TABLE_FILE = "l1_answer_table.json"
+ANSWER_TABLE_FORMAT_VERSION = 1
+
+KEY_FEATURES = {"hsg_subject", *FLAG_COLS}
+
+def model_files_checksum(paths: List[Path]) -> str:
+    """sha256 trên nội dung các file artifact L1 (theo thứ tự), dùng làm phiên bản model."""
+    h = hashlib.sha256()
+    for p in paths:
+        h.update(Path(p).name.encode())
+        h.update(Path(p).read_bytes())
+    return h.hexdigest()
+
+def priority_rows() -> List[Tuple[str, Dict[str, object]]]:
+    """Mọi loại ưu tiên mà clean_and_cast_L1 có thể sinh ra: (loai_uu_tien, giá trị các cột ưu tiên)."""
+    base = {"hsg_subject": "0", **{c: 0 for c in FLAG_COLS}}
+    rows = [(f"HSG {s.value}", {**base, "hsg_subject": s.value}) for s in HSGSubject]
+    rows += [
+        ("AHLD", {**base, "ahld": 1}),
+        ("Dân tộc thiểu số", {**base, "dan_toc_thieu_so": 1}),
+        ("50 huyện nghèo/TNB", {**base, "haimuoi_huyen_ngheo_tnb": 1}),
+    ]
+    return rows
+
+@dataclass(frozen=True)
+class L1AnswerTable:
+    """
+    Bảng trả lời L1 tính sẵn: (khoá nhóm..., loai_uu_tien) -> {ma_xet_tuyen: xác suất}.
+
+    Đầu vào của model L1 chỉ gồm khoá nhóm (cong_lap, tinh_tp, nhom_nganh) và loại ưu tiên,
+    nên mọi tổ hợp đều liệt kê được offline. Bảng gắn với model_version (sha256 các file model);
+    khác phiên bản thì bị bỏ qua và predictor chạy model trực tiếp.
+    """
+    model_version: str
+    entries: Dict[Tuple, Dict[str, float]]
+
+    def lookup(self, gkey: Tuple, loai: str) -> Dict[str, float] | None:
+        hit = self.entries.get((*group_key(gkey), loai))
+        return dict(hit) if hit is not None else None
+
+    @classmethod
+    def build(cls, predictor: "L1Predictor") -> "L1AnswerTable":
+        feat_allowed = KEY_FEATURES | set(predictor.group_cols)
+        entries: Dict[Tuple, Dict[str, float]] = {}
+        skipped = 0
+        for gkey in predictor.groups:
+            enc = predictor.groups.get(gkey).encoder
+            names = getattr(enc, "feature_names_in_", None) if enc is not None else None
+            feat_in = list(names) if names is not None else predictor.ohe_cols
+            if not set(feat_in) <= feat_allowed:
+                raise ValueError(f"L1 model {gkey} dùng feature ngoài khoá nhóm/loại ưu tiên: {sorted(set(feat_in) - feat_allowed)}")
+            prio = priority_rows()
+            rows = pd.DataFrame([{**dict(zip(predictor.group_cols, gkey)), **r} for _, r in prio])
+            try:
+                res = predictor._predict_group(gkey, rows, [loai for loai, _ in prio])
+            except Exception:
+                # để predictor chạy model trực tiếp cho nhóm này
+                logger.exception("L1 answer table: skip group %s", gkey)
+                skipped += 1
+                continue
+            for r in res:
+                entries[(*group_key(gkey), r.loai_uu_tien)] = r.ma_xet_tuyen
+        if skipped:
+            logger.warning("L1 answer table: %d groups skipped", skipped)
+        return cls(model_version=predictor.model_version, entries=entries)
+
+    def save(self, path: Path) -> None:
+        # nhãn lưu 1 lần, mỗi entry là [khoá..., loai, [[chỉ số nhãn, xác suất], ...]]
+        labels: Dict[str, int] = {}
+        rows = []
+        for key, probs in self.entries.items():
+            rows.append([*key, [[labels.setdefault(lab, len(labels)), p] for lab, p in probs.items()]])
+        doc = {
+            "format_version": ANSWER_TABLE_FORMAT_VERSION,
+            "model_version": self.model_version,
+            "labels": list(labels),
+            "entries": rows,
+        }
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(doc, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "L1AnswerTable":
+        doc = json.loads(Path(path).read_text(encoding="utf-8"))
+        if doc.get("format_version") != ANSWER_TABLE_FORMAT_VERSION:
+            raise ValueError(f"unsupported L1 answer table format: {doc.get('format_version')}")
+        labels = doc["labels"]
+        entries = {tuple(row[:-1]): {labels[i]: p for i, p in row[-1]} for row in doc["entries"]}
+        return cls(model_version=doc["model_version"], entries=entries)
+
+    @classmethod
+    def load_if_fresh(cls, path: Path, model_version: str) -> "L1AnswerTable | None":
+        """Bảng nếu tồn tại và khớp model_version, ngược lại None (predictor dùng model trực tiếp)."""
+        if not Path(path).exists():
+            return None
+        try:
+            table = cls.load(path)
+        except Exception:
+            logger.exception("Cannot read L1 answer table %s", path)
+            return None
+        if table.model_version != model_version:
+            logger.warning("L1 answer table %s is stale (model changed), using live models", path)
+            return None
+        return table
+
+def main(argv: list[str] | None = None) -> None:
+    from src.core.config import settings
+    from src.services.l1.predictor import L1Predictor
+
+    parser = argparse.ArgumentParser(description="Tính sẵn bảng trả lời L1")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="liệt kê mọi khoá L1 và ghi bảng trả lời")
+    b.add_argument("--model-dir", type=Path, default=settings.MODEL_DIR)
+    b.add_argument("--out", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    predictor = L1Predictor.load(args.model_dir, use_answer_table=False)
+    table = L1AnswerTable.build(predictor)
+    out = args.out or Path(args.model_dir, L1_ANSWER_TABLE_FILE)
+    table.save(out)
+    print(f"{out}: {len(table.entries)} entries, model {table.model_version[:12]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import joblib
+
+from src.services.constants import plain_value
+
+logger = logging.getLogger(__name__)
+
+L1_GROUPS_DIR = "l1_groups"
+GROUP_INDEX_FILE = "index.json"
+GROUP_FORMAT_VERSION = 1
+
+@dataclass(frozen=True)
+class L1Group:
+    """Artifact của một nhóm (cong_lap, tinh_tp, nhom_nganh)."""
+    model: Any
+    encoder: Any
+    label_encoder: Any
+    class_list: List[str]
+
+def group_key(gkey: Tuple) -> Tuple:
+    """Khoá nhóm dạng giá trị thuần (plain_value): dùng cho index.json và bảng trả lời L1."""
+    return tuple(plain_value(v) for v in gkey)
+
+def parse_group_key(s: str) -> Tuple:
+    """'1|TP. Hồ Chí Minh|748' -> (1, 'TP. Hồ Chí Minh', 748); phần là số nguyên được đổi sang int."""
+    return tuple(int(p) if p.lstrip("-").isdigit() else p for p in s.split("|"))
+
+@dataclass
+class GroupStoreStats:
+    hits: int = 0
+    loads: int = 0
+    evictions: int = 0
+    load_seconds: float = 0.0
+
+class L1GroupStore:
+    """
+    Kho model L1 theo nhóm, tra như dict: `gkey in store`, `store.get(gkey)`, `iter(store)`.
+
+    - Bố cục l1_groups/ (index.json + mỗi nhóm một file joblib): nhóm được load khi dùng lần đầu
+      và giữ trong LRU giới hạn theo số nhóm (max_groups) và dung lượng ước lượng theo kích thước
+      file (max_bytes); 0 = không giới hạn. Các nhóm trong preload được load sẵn lúc khởi động.
+      File nhóm được kiểm sha256 theo index.json mỗi lần load; sai thì ValueError.
+    - Bundle cũ (l1_model.joblib / *.pkl): mọi nhóm đã nằm trong bộ nhớ, không evict.
+    """
+
+    def __init__(
+        self,
+        root: Path | None = None,
+        index: Dict[Tuple, dict] | None = None,
+        groups: Dict[Tuple, L1Group] | None = None,
+        max_groups: int = 0,
+        max_bytes: int = 0,
+        source_version: str = "",
+        mmap_mode: str | None = None,
+    ):
+        self.root = Path(root) if root is not None else None
+        self.source_version = source_version       # model_version của bundle lúc export
+        self.mmap_mode = mmap_mode                 # "r": mảng numpy trong model dùng chung qua page cache
+        self.index = index if index is not None else {k: {} for k in (groups or {})}
+        self.max_groups = max_groups
+        self.max_bytes = max_bytes
+        self.stats = GroupStoreStats()
+        self._pinned = dict(groups or {})       # nhóm không có file riêng (bundle cũ)
+        self._loaded: OrderedDict[Tuple, L1Group] = OrderedDict()
+        self._bytes = 0
+        self._loading: Dict[Tuple, Future] = {}     # nhóm đang được load
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_bundle(cls, models: Dict, encoders: Dict, label_encoders: Dict, class_lists: Dict) -> "L1GroupStore":
+        groups = {
+            k: L1Group(m, encoders.get(k), label_encoders.get(k), class_lists.get(k, []))
+            for k, m in models.items()
+        }
+        return cls(groups=groups)
+
+    @staticmethod
+    def read_index(root: Path) -> dict:
+        """Nội dung index.json; "model_version" là checksum của bundle lúc export (model_files_checksum)."""
+        return json.loads((Path(root) / GROUP_INDEX_FILE).read_text(encoding="utf-8"))
+
+    @classmethod
+    def open(cls, root: Path, max_groups: int = 0, max_bytes: int = 0, preload: Iterable[Tuple] = (), mmap_mode: str | None = None) -> "L1GroupStore":
+        root = Path(root)
+        doc = cls.read_index(root)
+        if doc.get("format_version") != GROUP_FORMAT_VERSION:
+            raise ValueError(f"unsupported L1 group layout: {doc.get('format_version')}")
+        index = {tuple(g["key"]): g for g in doc["groups"]}
+        store = cls(root=root, index=index, max_groups=max_groups, max_bytes=max_bytes,
+                    source_version=doc.get("model_version", ""), mmap_mode=mmap_mode)
+        for k in preload:
+            if k in store:
+                store.get(k)
+            else:
+                logger.warning("L1 preload group %s not found", k)
+        return store
+
+    def __contains__(self, gkey: Tuple) -> bool:
+        return gkey in self.index
+
+    def __iter__(self) -> Iterator[Tuple]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, gkey: Tuple) -> L1Group:
+        hit = self._pinned.get(gkey)
+        if hit is not None:
+            return hit
+        # khoá chỉ giữ khi tra/cập nhật LRU; load chạy ngoài khoá, mỗi nhóm chỉ một thread load
+        # (thread khác cùng nhóm đợi Future của nó)
+        with self._lock:
+            hit = self._loaded.get(gkey)
+            if hit is not None:
+                self._loaded.move_to_end(gkey)
+                self.stats.hits += 1
+                return hit
+            pending = self._loading.get(gkey)
+            if pending is None:
+                pending = self._loading[gkey] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+        try:
+            t0 = time.perf_counter()
+            group = self._load(self.index[gkey], gkey)
+            seconds = time.perf_counter() - t0
+        except BaseException as e:
+            with self._lock:
+                del self._loading[gkey]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[gkey]
+            self.stats.load_seconds += seconds
+            self.stats.loads += 1
+            self._loaded[gkey] = group
+            self._bytes += self.index[gkey].get("bytes", 0)
+            while len(self._loaded) > 1 and (
+                (self.max_groups and len(self._loaded) > self.max_groups)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                k, _ = self._loaded.popitem(last=False)
+                self._bytes -= self.index[k].get("bytes", 0)
+                self.stats.evictions += 1
+        pending.set_result(group)
+        return group
+
+    def _load(self, entry: dict, gkey: Tuple) -> L1Group:
+        path = self.root / entry["file"]
+        if entry.get("sha256") and hashlib.sha256(path.read_bytes()).hexdigest() != entry["sha256"]:
+            raise ValueError(f"Checksum mismatch for L1 group {gkey}: {path}")
+        return L1Group(*joblib.load(path, mmap_mode=self.mmap_mode))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "groups": len(self.index),
+                "resident": len(self._pinned) + len(self._loaded),
+                "resident_bytes": self._bytes,
+                "max_groups": self.max_groups,
+                "max_bytes": self.max_bytes,
+                **vars(self.stats),
+            }
+
+def export_groups(store: L1GroupStore, out_dir: Path, model_version: str = "") -> Path:
+    """
+    Ghi mỗi nhóm thành 1 file joblib (không nén) + index.json; trả về đường dẫn index.
+    model_version của bundle gốc được ghi lại để bảng trả lời L1 dựng từ bundle vẫn dùng được.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    groups = []
+    for i, gkey in enumerate(store):
+        g = store.get(gkey)
+        name = f"g{i:05d}.joblib"
+        joblib.dump((g.model, g.encoder, g.label_encoder, list(g.class_list)), out_dir / name)
+        data = (out_dir / name).read_bytes()
+        groups.append({
+            "key": list(group_key(gkey)), "file": name,
+            "bytes": len(data), "sha256": hashlib.sha256(data).hexdigest(),
+        })
+    doc = {"format_version": GROUP_FORMAT_VERSION, "model_version": model_version, "groups": groups}
+    tmp = out_dir / (GROUP_INDEX_FILE + ".tmp")
+    tmp.write_text(json.dumps(doc, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, out_dir / GROUP_INDEX_FILE)
+    return out_dir / GROUP_INDEX_FILE
+
+def main(argv: list[str] | None = None) -> None:
+    from src.core.config import settings
+    from src.services.l1.predictor import L1Predictor
+
+    parser = argparse.ArgumentParser(description="Tách model L1 thành file theo nhóm để load lười")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export", help="đọc bundle L1 hiện có và ghi l1_groups/")
+    e.add_argument("--model-dir", type=Path, default=settings.MODEL_DIR)
+    e.add_argument("--out", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    predictor = L1Predictor.load(args.model_dir, use_answer_table=False, use_group_layout=False)
+    out = args.out or Path(args.model_dir, L1_GROUPS_DIR)
+    index = export_groups(predictor.groups, out, predictor.model_version)
+    print(f"{index}: {len(predictor.groups)} groups")
+
+if __name__ == "__main__":
+    main()
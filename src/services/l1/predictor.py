@@ -1,39 +1,70 @@
 from __future__ import annotations
 from dataclasses import dataclass
+import logging
 from pathlib import Path
 import joblib
 import json
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, List, Tuple
+from time import perf_counter
+from typing import Dict, Any, List, Sequence, Tuple
 
+from src.core.config import settings
+from src.core import metrics, timing
 from src.services.l1.schema import UserInputL1, L1PredictResult
-from src.services.l1.preprocess import preprocess_input_data_L1
+from src.services.l1.preprocess import L1Row, expand_priority_rows_many
+from src.services.l1.model_store import GROUP_INDEX_FILE, L1_GROUPS_DIR, L1GroupStore, parse_group_key
+from src.services.l1.answer_table import L1_ANSWER_TABLE_FILE, L1AnswerTable, model_files_checksum
+
+logger = logging.getLogger(__name__)
 
 @dataclass
 class L1Predictor:
-    models: Dict[Tuple, Any]
-    encoders: Dict[Tuple, Any]
-    label_encoders: Dict[Tuple, Any]
-    class_lists: Dict[Tuple, List[str]]
+    groups: L1GroupStore
     group_cols: List[str]
     ohe_cols: List[str]
+    model_version: str = ""
+    answer_table: L1AnswerTable | None = None
 
     @classmethod
-    def load(cls, model_dir: Path) -> "L1Predictor":
+    def load(cls, model_dir: Path, use_answer_table: bool = True, use_group_layout: bool = True) -> "L1Predictor":
         root = Path(model_dir)
+        split_files = [root / f for f in ("models.pkl", "encoders.pkl", "label_encoders.pkl", "class_lists.pkl")]
+        bundle_files = split_files if all(p.exists() for p in split_files) else [root / "l1_model.joblib"]
+        meta_files = [p for p in (root / "group_cols.json", root / "ohe_cols.json") if p.exists()]
+        model_version = model_files_checksum(bundle_files + meta_files) if bundle_files[0].exists() else ""
+
         # Load artifacts
-        try:
-            models = joblib.load(root / "models.pkl")
-            encoders = joblib.load(root / "encoders.pkl")
-            label_encoders = joblib.load(root / "label_encoders.pkl")
-            class_lists = joblib.load(root / "class_lists.pkl")
-        except Exception:
-            bundle = joblib.load(root / "l1_model.joblib")
-            models = bundle["models"]
-            encoders = bundle["encoders"]
-            label_encoders = bundle["label_encoders"]
-            class_lists = bundle["class_lists"]
+        groups = None
+        group_index = root / L1_GROUPS_DIR / GROUP_INDEX_FILE
+        if use_group_layout and group_index.exists():
+            # mỗi nhóm một file, load khi cần (python -m src.services.l1.model_store export);
+            # bundle đã đổi sau lần export -> bỏ qua l1_groups/ và dùng bundle
+            source_version = L1GroupStore.read_index(group_index.parent).get("model_version", "")
+            if model_version and source_version != model_version:
+                logger.warning("%s was exported from another L1 bundle, using %s", group_index.parent, bundle_files[0].name)
+            else:
+                groups = L1GroupStore.open(
+                    group_index.parent,
+                    max_groups=settings.L1_GROUP_CACHE_MAX_GROUPS,
+                    max_bytes=settings.L1_GROUP_CACHE_MAX_BYTES,
+                    preload=[parse_group_key(k) for k in settings.L1_GROUP_PRELOAD],
+                    mmap_mode="r" if settings.MODEL_MMAP else None,
+                )
+                model_version = model_version or source_version
+        if groups is None:
+            try:
+                models = joblib.load(root / "models.pkl")
+                encoders = joblib.load(root / "encoders.pkl")
+                label_encoders = joblib.load(root / "label_encoders.pkl")
+                class_lists = joblib.load(root / "class_lists.pkl")
+            except Exception:
+                bundle = joblib.load(root / "l1_model.joblib")
+                models = bundle["models"]
+                encoders = bundle["encoders"]
+                label_encoders = bundle["label_encoders"]
+                class_lists = bundle["class_lists"]
+            groups = L1GroupStore.from_bundle(models, encoders, label_encoders, class_lists)
 
         try:
             group_cols = json.loads((root / "group_cols.json").read_text(encoding="utf-8"))
@@ -43,7 +74,12 @@ class L1Predictor:
             ohe_cols = json.loads((root / "ohe_cols.json").read_text(encoding="utf-8"))
         except Exception:
             ohe_cols = ["cong_lap","tinh_tp","nhom_nganh","hsg_subject","ahld","dan_toc_thieu_so","haimuoi_huyen_ngheo_tnb"]
-        return cls(models=models, encoders=encoders, label_encoders=label_encoders, class_lists=class_lists, group_cols=group_cols, ohe_cols=ohe_cols)
+
+        # Bảng trả lời tính sẵn (python -m src.services.l1.answer_table build); thiếu/cũ -> chạy model
+        answer_table = L1AnswerTable.load_if_fresh(root / L1_ANSWER_TABLE_FILE, model_version) if use_answer_table else None
+        return cls(
+            groups=groups, group_cols=group_cols, ohe_cols=ohe_cols, model_version=model_version, answer_table=answer_table,
+        )
     
     @staticmethod
     def infer_loai_uu_tien(row: pd.Series) -> str:
@@ -59,54 +95,123 @@ class L1Predictor:
         return "Không ưu tiên"
     
     def predict(self, user: UserInputL1) -> List[L1PredictResult]:
-        processed_data = preprocess_input_data_L1(user).reset_index(drop=True)
-        if processed_data.empty:
-            return [L1PredictResult(loai_uu_tien="Không ưu tiên", ma_xet_tuyen={})]
+        return self.predict_many([user])[0]
 
-        processed_data = processed_data.assign(row_id=lambda d: d.index)
-        results: List[L1PredictResult] = []
+    def predict_many(self, users: Sequence[UserInputL1]) -> List[List[L1PredictResult]]:
+        """
+        Dự đoán cho nhiều học sinh: tách dòng ưu tiên của tất cả (expand_priority_rows), gom các dòng
+        theo khoá nhóm rồi encode một lần cho mỗi nhóm và chấm các dòng khác nhau (xem _predict_group),
+        sau đó trả kết quả về từng học sinh theo thứ tự dòng. Kết quả giống gọi predict từng người.
+        """
+        if not users: return []
+        metrics.PREDICT_BATCH_SIZE.labels("l1").observe(len(users))
+        with metrics.stage("l1", "expand"):
+            rows = expand_priority_rows_many(users)
+            loais = [self.infer_loai_uu_tien(r) for r in rows]
 
-        for _, r in processed_data.iterrows():
+        t0 = perf_counter()
+        row_results: List[L1PredictResult | None] = [None] * len(rows)
+        groups: Dict[Tuple, List[int]] = {}
+        for i, (r, loai) in enumerate(zip(rows, loais)):
             gkey = tuple(r[c] for c in self.group_cols)
-            loai = self.infer_loai_uu_tien(r)
-            if loai == "Không ưu tiên":
-                results.append(L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen={}))
+            if loai == "Không ưu tiên" or gkey not in self.groups:
+                row_results[i] = L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen={})
                 continue
+            if self.answer_table is not None:
+                hit = self.answer_table.lookup(gkey, loai)
+                if hit is not None:
+                    row_results[i] = L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen=hit)
+                    continue
+            groups.setdefault(gkey, []).append(i)
+        metrics.observe_stage("l1", "lookup", perf_counter() - t0)
 
-            if gkey not in self.models:
-                results.append(L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen={}))
-                continue
+        stage_time = {"encode": 0.0, "predict": 0.0, "postprocess": 0.0}
+        for gkey, idx in groups.items():
+            res = self._predict_group(gkey, self._rows_frame([rows[i] for i in idx], gkey), [loais[i] for i in idx], stage_time)
+            for i, r in zip(idx, res):
+                row_results[i] = r
+        if groups:
+            for name, sec in stage_time.items():
+                metrics.observe_stage("l1", name, sec)
+        model_rows = [i for idx in groups.values() for i in idx]
+        timing.count("rows", len(rows))
+        timing.count("model_rows", len(model_rows))
+        rt = timing.detail()
+        if rt is not None:
+            uid = np.fromiter((r.uid for r in rows), dtype=np.int64, count=len(rows))
+            rt.items = {"rows": np.bincount(uid, minlength=len(users)),
+                        "model_rows": np.bincount(uid[model_rows], minlength=len(users))}
 
-            clf = self.models[gkey]
-            enc = self.encoders.get(gkey)
-            le = self.label_encoders.get(gkey)
-            cls_list = self.class_lists.get(gkey, [])
+        results: List[List[L1PredictResult]] = [[] for _ in users]
+        for row, r in zip(rows, row_results):
+            results[row.uid].append(r)
+        for out in results:
+            if not out:
+                out.append(L1PredictResult(loai_uu_tien="Không ưu tiên", ma_xet_tuyen={}))
+        return results
 
-            if clf is None:
-                if cls_list:
-                    results.append(L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen={cls_list[0]: 1.0}))
-                else:
-                    results.append(L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen={}))
-                    continue
+    def _feature_names(self, enc) -> List[str]:
+        return list(enc.feature_names_in_) if hasattr(enc, 'feature_names_in_') and enc.feature_names_in_ is not None else self.ohe_cols
 
-            feat_in = list(enc.feature_names_in_) if hasattr(enc, 'feature_names_in_') and enc.feature_names_in_ is not None else ohe_cols
+    def _rows_frame(self, rows: List[L1Row], gkey: Tuple) -> pd.DataFrame:
+        # chỉ dựng DataFrame với các cột model của nhóm cần
+        g = self.groups.get(gkey)
+        if g.model is None:
+            return pd.DataFrame(index=range(len(rows)))
+        return pd.DataFrame({c: [r[c] for r in rows] for c in self._feature_names(g.encoder)})
 
-            x_df = r[feat_in].astype(str).to_frame().T
-            X = enc.transform(x_df) if enc is not None else x_df
+    def _predict_group(self, gkey: Tuple, rows: pd.DataFrame, loais: List[str],
+                       stage_time: Dict[str, float] | None = None) -> List[L1PredictResult]:
+        """
+        Chấm các dòng cùng khoá nhóm gkey: encode một lần các dòng khác nhau, rồi gọi model cho từng
+        dòng khác nhau trên ma trận 1 dòng như bản gốc. predict_proba trên ma trận ghép nhiều dòng
+        (gemm) lệch vài ULP so với 1 dòng (gemv) với model tuyến tính + input dense, nên điểm sẽ phụ
+        thuộc vào các học sinh khác trong batch; trong một nhóm các dòng chỉ khác nhau ở loại ưu tiên
+        nên số dòng khác nhau nhỏ.
+        stage_time: cộng thêm thời gian encode/predict/postprocess (giây) vào dict này.
+        """
+        t0 = perf_counter()
+        g = self.groups.get(gkey)
+        clf, enc, le, cls_list = g.model, g.encoder, g.label_encoder, g.class_list or []
 
-            if hasattr(clf, 'predict_proba'):
-                p = clf.predict_proba(X)[0]
+        if clf is None:
+            # nhóm chỉ có 1 lớp lúc train
+            return [L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen=({cls_list[0]: 1.0} if cls_list else {})) for loai in loais]
+
+        x_df = rows[self._feature_names(enc)].astype(str)
+        slot: Dict[tuple, int] = {}
+        first: List[int] = []
+        inv: List[int] = []
+        for i, key in enumerate(x_df.itertuples(index=False, name=None)):
+            if key not in slot:
+                slot[key] = len(first)
+                first.append(i)
+            inv.append(slot[key])
+        x_df = x_df.iloc[first]
+        X = enc.transform(x_df) if enc is not None else x_df
+        t1 = perf_counter()
+
+        maps: List[Dict[str, float]] = []
+        if hasattr(clf, 'predict_proba'):
+            proba = [clf.predict_proba(X[j:j + 1])[0] for j in range(len(first))]
+            t2 = perf_counter()
+            for p in proba:
                 s = float(p.sum())
                 if s <= 0:
-                    results.append(L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen={}))
+                    maps.append({})
                     continue
                 order = np.argsort(p)[::-1]
                 labels_sorted = le.classes_[order] if le is not None else np.array(cls_list)[order]
                 probs_sorted = (p[order] / s).astype(float)
-                out_map = {str(lab): float(pr) for lab, pr in zip(labels_sorted, probs_sorted)}
-                results.append(L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen=out_map))
-            else:
-                yhat = clf.predict(X)[0]
-                pred = le.inverse_transform([yhat])[0] if le is not None else (cls_list[int(yhat)] if cls_list else None)
-                results.append(L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen=({str(pred): 1.0} if pred is not None else {})))
+                maps.append({str(lab): float(pr) for lab, pr in zip(labels_sorted, probs_sorted)})
+        else:
+            yhat = [clf.predict(X[j:j + 1])[0] for j in range(len(first))]
+            t2 = perf_counter()
+            preds = le.inverse_transform(yhat) if le is not None else [cls_list[int(y)] if cls_list else None for y in yhat]
+            maps = [{str(pred): 1.0} if pred is not None else {} for pred in preds]
+        results = [L1PredictResult(loai_uu_tien=loai, ma_xet_tuyen=maps[j]) for loai, j in zip(loais, inv)]
+        if stage_time is not None:
+            stage_time["encode"] += t1 - t0
+            stage_time["predict"] += t2 - t1
+            stage_time["postprocess"] += perf_counter() - t2
         return results
@@ -1,3 +1,4 @@
+from typing import Sequence
 import pandas as pd
 
 from src.services.l1.schema import UserInputL1
@@ -48,4 +49,47 @@ def pick_hsg(row):
             return v.strip()
         if isinstance(v, (int, float)) and v != 0:
             return str(v)
-    return "0"
\ No newline at end of file
+    return "0"
+
+FLAG_COLS = ['ahld', 'dan_toc_thieu_so', 'haimuoi_huyen_ngheo_tnb']
+
+class L1Row:
+    """
+    Một dòng ưu tiên của học sinh (tương đương 1 dòng của clean_and_cast_L1) không qua pandas.
+    Các cột suy ra (hsg_subject + cờ) lưu trong slot, cột còn lại đọc thẳng từ input.
+    """
+    __slots__ = ('uid', 'user', 'hsg_subject', 'ahld', 'dan_toc_thieu_so', 'haimuoi_huyen_ngheo_tnb')
+
+    def __init__(self, uid: int, user: UserInputL1, hsg_subject: str = "0", ahld: int = 0, dan_toc_thieu_so: int = 0, haimuoi_huyen_ngheo_tnb: int = 0):
+        self.uid = uid
+        self.user = user
+        self.hsg_subject = hsg_subject
+        self.ahld = ahld
+        self.dan_toc_thieu_so = dan_toc_thieu_so
+        self.haimuoi_huyen_ngheo_tnb = haimuoi_huyen_ngheo_tnb
+
+    def __getitem__(self, k: str):
+        return getattr(self, k) if k in L1Row.__slots__[2:] else getattr(self.user, k)
+
+    def get(self, k: str, default=None):
+        try:
+            return self[k]
+        except AttributeError:
+            return default
+
+def expand_priority_rows(user: UserInputL1, uid: int = 0) -> list[L1Row]:
+    """Các dòng ưu tiên giống clean_and_cast_L1 (cùng thứ tự: HSG, AHLD, DTTS, 50 huyện, không ưu tiên)."""
+    hsg = pick_hsg({k: getattr(user, k) for k in ('hsg_1', 'hsg_2', 'hsg_3')})
+    flags = [int(getattr(user, c) or 0) for c in FLAG_COLS]
+    rows = []
+    if hsg != "0":
+        rows.append(L1Row(uid, user, hsg_subject=hsg))
+    for c, v in zip(FLAG_COLS, flags):
+        if v == 1:
+            rows.append(L1Row(uid, user, **{c: 1}))
+    if hsg == "0" and not any(flags):
+        rows.append(L1Row(uid, user))
+    return rows
+
+def expand_priority_rows_many(users: Sequence[UserInputL1]) -> list[L1Row]:
+    return [r for i, u in enumerate(users) for r in expand_priority_rows(u, i)]
@@ -37,7 +37,10 @@ class UserInputL1(BaseModel):
     def _coerce_cong_lap(cls, v):
         if v is None or str(v).strip() == "":
             raise ValueError("cong_lap is required (0 or 1)")
-        iv = int(v)
+        try:
+            iv = int(v)
+        except (TypeError, OverflowError):  # list, dict, inf: pydantic chỉ bọc ValueError thành lỗi validate
+            raise ValueError("cong_lap must be 0 or 1") from None
         if iv not in (0, 1):
             raise ValueError("cong_lap must be 0 or 1")
         return iv
@@ -45,7 +48,10 @@ class UserInputL1(BaseModel):
     @field_validator("hoc_phi", mode="before")
     @classmethod
     def _coerce_hoc_phi(cls, v):
-        fv = float(v)
+        try:
+            fv = float(v)
+        except TypeError:
+            raise ValueError("hoc_phi must be a number") from None
         if fv < 0:
             raise ValueError("hoc_phi must be >= 0")
         return fv
@@ -63,7 +69,10 @@ class UserInputL1(BaseModel):
     @field_validator("ahld", "dan_toc_thieu_so", "haimuoi_huyen_ngheo_tnb", mode="before")
     @classmethod
     def _coerce_flag(cls, v):
-        iv = int(v)
+        try:
+            iv = int(v)
+        except (TypeError, OverflowError):
+            raise ValueError("flag must be 0 or 1") from None
         if iv not in (0, 1):
             raise ValueError("flag must be 0 or 1")
         return iv
@@ -73,5 +82,12 @@ class L1PredictResult(BaseModel):
     loai_uu_tien: str
     ma_xet_tuyen: Dict[str, float]
 
+class L1ColumnarResult(BaseModel):
+    """Kết quả batch dạng cột (?format=columnar): mỗi vị trí là một (học sinh, loại ưu tiên, mã)."""
+    index: List[int]
+    loai_uu_tien: List[str]
+    ma_xet_tuyen: List[str]
+    score: List[float]
+
 class L1BatchRequest(BaseModel):
     items: List[UserInputL1]
\ No newline at end of file
@@ -0,0 +1,154 @@
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass
+import sys
+import threading
+import time
+
+from src.services.constants import plain_value
+from src.services.l2.features import HB
+
+# Ước lượng bộ nhớ cho 1 entry (key + list) và 1 L2PredictResult (model + str mã + float)
+_ENTRY_OVERHEAD = 512
+_RESULT_BYTES = 400
+
+def normalize_key(user, score_decimals: int | None = None) -> tuple:
+    """
+    Khoá cache đã chuẩn hoá của UserInputL2.
+
+    - diem_chuan: giữ nguyên float (model và bậc ưu đãi UEF dùng giá trị thực); chỉ làm tròn
+      khi cấu hình score_decimals, chấp nhận sai khác nhỏ để tăng tỉ lệ hit.
+    - hoc_phi: lấy phần nguyên. Model dùng int(hoc_phi), các ngưỡng ưu đãi UEF
+      đều là số nguyên và hoc_phi >= 0, nên hai giá trị cùng phần nguyên cho cùng kết quả.
+    """
+    diem = float(user.diem_chuan)
+    if score_decimals is not None:
+        diem = round(diem, score_decimals)
+    return (
+        plain_value(user.cong_lap), plain_value(user.tinh_tp), plain_value(user.to_hop_mon),
+        diem, int(user.hoc_phi),
+        plain_value(user.ten_ccta), plain_value(user.diem_ccta), plain_value(user.nhom_nganh),
+        *(plain_value(getattr(user, c)) for c in HB),
+    )
+
+def normalize_keys(students, score_decimals: int | None = None) -> list[tuple]:
+    """normalize_key cho từng học sinh của L2Students (cùng khoá như khi dựng từ UserInputL2)."""
+    rnd = (lambda d: d) if score_decimals is None else (lambda d: round(d, score_decimals))
+    return [
+        (cl, tp, thm, rnd(d), b, ten, lvl, nn, *hb)
+        for cl, tp, thm, d, b, ten, lvl, nn, hb in zip(
+            students.cong_lap, students.tinh_tp, students.to_hop_mon,
+            students.diem_chuan.tolist(), students.budget_max.tolist(),
+            students.ten_ccta, students.diem_ccta, students.nhom_nganh, students.hb.tolist(),
+        )
+    ]
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+class L2ResultCache:
+    """
+    LRU + TTL cho kết quả L2Predictor theo (phiên bản model, phiên bản catalog, input chuẩn hoá).
+
+    Khi phiên bản model/catalog khác với lần trước (reload), toàn bộ cache bị xoá.
+    Giới hạn theo số entry và theo dung lượng ước lượng; vượt thì bỏ entry cũ nhất.
+    """
+
+    def __init__(self, max_entries: int = 10_000, max_bytes: int = 64 * 2**20, ttl: float | None = 600.0,
+                 score_decimals: int | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.score_decimals = score_decimals
+        self.stats = CacheStats()
+        self._data: OrderedDict[tuple, tuple[float, int, list]] = OrderedDict()   # key -> (hạn, bytes, kết quả)
+        self._bytes = 0
+        self._version: tuple | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def key(self, user) -> tuple:
+        return normalize_key(user, self.score_decimals)
+
+    def keys(self, students) -> list[tuple]:
+        return normalize_keys(students, self.score_decimals)
+
+    def _check_version(self, version: tuple) -> None:
+        if version != self._version:
+            if self._data:
+                self.stats.invalidations += 1
+            self._data.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get_many(self, version: tuple, keys: list[tuple]) -> list[list | None]:
+        """Kết quả đã cache (bản sao list) hoặc None cho từng khoá."""
+        out: list[list | None] = [None] * len(keys)
+        if not self.enabled:
+            return out
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            for i, k in enumerate(keys):
+                hit = self._data.get(k)
+                if hit is not None and self.ttl is not None and hit[0] < now:
+                    self._pop(k)
+                    self.stats.expirations += 1
+                    hit = None
+                if hit is None:
+                    self.stats.misses += 1
+                    continue
+                self._data.move_to_end(k)
+                self.stats.hits += 1
+                out[i] = list(hit[2])
+        return out
+
+    def put_many(self, version: tuple, items: list[tuple[tuple, list]]) -> None:
+        if not self.enabled:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._check_version(version)
+            for k, results in items:
+                size = _ENTRY_OVERHEAD + sys.getsizeof(k) + _RESULT_BYTES * len(results)
+                if size > self.max_bytes:
+                    continue
+                if k in self._data:
+                    self._pop(k)
+                self._data[k] = (expires, size, list(results))
+                self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                self._pop(next(iter(self._data)))
+                self.stats.evictions += 1
+
+    def _pop(self, k: tuple) -> None:
+        _, size, _ = self._data.pop(k)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self._version = None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                **vars(self.stats),
+            }
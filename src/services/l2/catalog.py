@@ -0,0 +1,330 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from src.services.l2.features import CandidateFeatures
+
+logger = logging.getLogger(__name__)
+
+L2_CATALOG_FILE = "L2_uni_requirement.xlsx"
+# Bản biên dịch dạng Arrow IPC (không nén) + manifest; build bằng:
+#   python -m src.services.l2.catalog build
+L2_COMPILED_CATALOG_FILE = "L2_uni_requirement.arrow"
+CATALOG_FORMAT_VERSION = 1
+
+# Kiểu dữ liệu cuối cùng của từng cột trong catalog (các cột còn lại giữ Utf8)
+L2_CATALOG_DTYPES: dict[str, pl.DataType] = {
+    "cong_lap": pl.Int64,
+    "tinh_tp": pl.Utf8,
+    "to_hop_mon": pl.Utf8,
+    "diem_chuan": pl.Float64,
+    "hoc_phi": pl.Int64,
+    "ten_ccta": pl.Utf8,
+    "diem_ccta": pl.Utf8,
+    "diem_quy_doi": pl.Float64,
+    "hk10": pl.Int64,
+    "hk11": pl.Int64,
+    "hk12": pl.Int64,
+    "hl10": pl.Int64,
+    "hl11": pl.Int64,
+    "hl12": pl.Float64,
+    "nhom_nganh": pl.Int64,
+    "ma_xet_tuyen": pl.Utf8,
+}
+
+# Các khoá lọc cứng: ứng viên phải khớp chính xác cả 4 khoá với học sinh
+HARD_FILTER_KEYS = ("tinh_tp", "to_hop_mon", "cong_lap", "nhom_nganh")
+
+def file_checksum(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def manifest_path(path: Path) -> Path:
+    return Path(path).with_name(Path(path).name + ".json")
+
+def read_l2_catalog(path: Path) -> pl.DataFrame:
+    raw = pd.read_excel(path).astype(str)
+    return pl.from_pandas(raw).with_columns([pl.col(c).cast(t) for c, t in L2_CATALOG_DTYPES.items()])
+
+def validate_l2_catalog(frame: pl.DataFrame) -> None:
+    missing = [c for c in L2_CATALOG_DTYPES if c not in frame.columns]
+    if missing:
+        raise ValueError(f"L2 catalog thiếu cột: {missing}")
+    wrong = {c: str(frame.schema[c]) for c, t in L2_CATALOG_DTYPES.items() if frame.schema[c] != t}
+    if wrong:
+        raise ValueError(f"L2 catalog sai kiểu dữ liệu: {wrong}")
+    n_null = frame["ma_xet_tuyen"].null_count()
+    if n_null:
+        raise ValueError(f"L2 catalog có {n_null} dòng thiếu ma_xet_tuyen")
+
+def partition_l2_catalog(frame: pl.DataFrame) -> pl.DataFrame:
+    """Sắp xếp (ổn định) theo HARD_FILTER_KEYS để mỗi bộ khoá là một khối dòng liên tiếp."""
+    keys = list(HARD_FILTER_KEYS)
+    n_runs = frame.select(pl.struct(keys).rle_id().max()).item()
+    n_groups = frame.select(pl.struct(keys).n_unique()).item()
+    if frame.height == 0 or n_runs + 1 == n_groups:
+        return frame
+    return frame.sort(keys, maintain_order=True)
+
+@dataclass(frozen=True)
+class L2PartitionIndex:
+    """Bảng băm (tinh_tp, to_hop_mon, cong_lap, nhom_nganh) -> [start, stop) trên catalog đã phân khối."""
+    slices: dict[tuple, tuple[int, int]]
+    n_rows: int
+
+    @classmethod
+    def build(cls, frame: pl.DataFrame) -> "L2PartitionIndex":
+        keys = list(HARD_FILTER_KEYS)
+        groups = (
+            frame.select(keys).with_row_index("_row")
+            .group_by(keys, maintain_order=True)
+            .agg(pl.col("_row").first().alias("start"), pl.col("_row").last().alias("last"), pl.len().alias("n"))
+        )
+        slices = {}
+        for tp, thm, cl, nn, start, last, n in groups.iter_rows():
+            if last - start + 1 != n:
+                raise ValueError("catalog is not partitioned by HARD_FILTER_KEYS")
+            slices[(tp, thm, cl, nn)] = (start, start + n)
+        return cls(slices=slices, n_rows=frame.height)
+
+    def lookup(self, tinh_tp: str, to_hop_mon: str, cong_lap: int, nhom_nganh: int) -> tuple[int, int]:
+        return self.slices.get((tinh_tp, to_hop_mon, cong_lap, nhom_nganh), (0, 0))
+
+    def stats(self, top: int = 10) -> dict:
+        """Thống kê kích thước partition để theo dõi lệch (vd: VNUHCM rất lớn)."""
+        sizes = np.array([b - a for a, b in self.slices.values()], dtype=np.int64)
+        if sizes.size == 0:
+            return {"partitions": 0, "rows": 0}
+        largest = sorted(self.slices.items(), key=lambda kv: kv[1][0] - kv[1][1])[:top]
+        return {
+            "partitions": int(sizes.size),
+            "rows": int(sizes.sum()),
+            "min": int(sizes.min()),
+            "mean": float(sizes.mean()),
+            "p50": float(np.percentile(sizes, 50)),
+            "p90": float(np.percentile(sizes, 90)),
+            "p99": float(np.percentile(sizes, 99)),
+            "max": int(sizes.max()),
+            "largest": [{"key": list(k), "rows": b - a} for k, (a, b) in largest],
+        }
+
+def build_compiled_catalog(source: Path, out: Path) -> dict:
+    """Đọc xlsx, kiểm tra schema, ghi Arrow IPC không nén + manifest (checksum) một cách atomic."""
+    source, out = Path(source), Path(out)
+    frame = read_l2_catalog(source)
+    validate_l2_catalog(frame)
+    # ghi sẵn theo thứ tự partition để lúc load không phải sort (giữ nguyên mmap)
+    frame = partition_l2_catalog(frame)
+
+    tmp = out.with_name(out.name + ".tmp")
+    frame.write_ipc(tmp, compression="uncompressed")
+    manifest = {
+        "format_version": CATALOG_FORMAT_VERSION,
+        "source": source.name,
+        "source_sha256": file_checksum(source),
+        "sha256": file_checksum(tmp),
+        "rows": frame.height,
+        "schema": {c: str(t) for c, t in frame.schema.items()},
+    }
+    os.replace(tmp, out)
+    mtmp = manifest_path(out).with_name(manifest_path(out).name + ".tmp")
+    mtmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(mtmp, manifest_path(out))
+    return manifest
+
+def read_compiled_catalog(path: Path, checksum: str | None = None) -> tuple[pl.DataFrame, dict]:
+    """Memory-map file Arrow đã biên dịch; các worker dùng chung page cache của file."""
+    manifest = json.loads(manifest_path(path).read_text(encoding="utf-8"))
+    if manifest.get("format_version") != CATALOG_FORMAT_VERSION:
+        raise ValueError(f"Unsupported catalog format_version={manifest.get('format_version')}")
+    if checksum is not None and checksum != manifest["sha256"]:
+        raise ValueError(f"Checksum mismatch for {path}")
+    frame = pl.read_ipc(path, memory_map=True, rechunk=False)
+    validate_l2_catalog(frame)
+    return frame, manifest
+
+def compiled_is_fresh(compiled: Path, source: Path) -> bool:
+    """Bản biên dịch có manifest và còn khớp với file xlsx gốc (nếu file gốc có mặt)."""
+    if not (compiled.exists() and manifest_path(compiled).exists()):
+        return False
+    if not source.exists():
+        return True
+    try:
+        manifest = json.loads(manifest_path(compiled).read_text(encoding="utf-8"))
+        return manifest.get("source_sha256") == file_checksum(source)
+    except (OSError, ValueError):
+        return False
+
+def choose_catalog_path(compiled: Path, source: Path) -> Path:
+    if compiled_is_fresh(compiled, source):
+        return compiled
+    if manifest_path(compiled).exists():
+        logger.warning("Compiled L2 catalog %s is stale, falling back to %s", compiled, source)
+    return source
+
+def catalog_pair(path: Path) -> tuple[Path, Path]:
+    """(bản .arrow, xlsx gốc) ứng với path; xlsx gốc lấy theo manifest nếu có."""
+    path = Path(path)
+    if path.suffix != ".arrow":
+        return path.with_suffix(".arrow"), path
+    try:
+        name = json.loads(manifest_path(path).read_text(encoding="utf-8")).get("source") or L2_CATALOG_FILE
+    except (OSError, ValueError):
+        name = L2_CATALOG_FILE
+    return path, path.with_name(name)
+
+def resolve_catalog_path(data_dir: Path) -> Path:
+    """Ưu tiên bản biên dịch nếu có và còn khớp với file xlsx gốc (nếu file gốc có mặt)."""
+    data_dir = Path(data_dir)
+    return choose_catalog_path(data_dir / L2_COMPILED_CATALOG_FILE, data_dir / L2_CATALOG_FILE)
+
+def _stat_key(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+@dataclass(frozen=True)
+class L2Catalog:
+    """Danh sách ngành/trường L2 đã ép kiểu và phân khối theo khoá lọc cứng, bất biến sau khi load."""
+    frame: pl.DataFrame
+    index: L2PartitionIndex
+    features: CandidateFeatures
+    version: str    # sha256 của file xlsx gốc
+    checksum: str   # sha256 của file đã load (xlsx hoặc .arrow)
+    path: Path
+    mtime_ns: int
+    size: int
+
+    @classmethod
+    def load(cls, path: Path) -> "L2Catalog":
+        path = Path(path)
+        st = path.stat()
+        checksum = file_checksum(path)
+        if path.suffix == ".arrow":
+            frame, manifest = read_compiled_catalog(path, checksum)
+            version = manifest["source_sha256"]
+        else:
+            frame, version = read_l2_catalog(path), checksum
+        frame = partition_l2_catalog(frame)
+        return cls(
+            frame=frame, index=L2PartitionIndex.build(frame), features=CandidateFeatures.build(frame), version=version,
+            checksum=checksum, path=path, mtime_ns=st.st_mtime_ns, size=st.st_size,
+        )
+
+    def candidates(self, tinh_tp: str, to_hop_mon: str, cong_lap: int, nhom_nganh: int) -> pl.DataFrame:
+        """Khối ứng viên khớp 4 khoá lọc cứng (slice zero-copy, không quét toàn bảng)."""
+        start, stop = self.index.lookup(tinh_tp, to_hop_mon, cong_lap, nhom_nganh)
+        return self.frame.slice(start, stop - start)
+
+    def locate(self, tinh_tp: str, to_hop_mon: str, cong_lap: int, nhom_nganh: int) -> tuple[int, int]:
+        return self.index.lookup(tinh_tp, to_hop_mon, cong_lap, nhom_nganh)
+
+class L2CatalogStore:
+    """
+    Giữ catalog hiện hành trong bộ nhớ và tự reload khi file thay đổi.
+    Request lấy catalog một lần qua `get()` rồi dùng đến hết, nên khi reload
+    (swap tham chiếu) các request đang chạy vẫn dùng bản cũ.
+
+    Theo dõi cả bản .arrow lẫn xlsx gốc: khi một trong hai đổi thì chọn lại như resolve_catalog_path
+    (sửa xlsx mà chưa build lại -> .arrow hết hạn, dùng xlsx; build lại xong -> quay về .arrow).
+    """
+
+    def __init__(self, path: Path, check_interval: float = 5.0):
+        self.path = Path(path)
+        self.compiled, self.source = catalog_pair(self.path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._catalog = L2Catalog.load(self.path)
+        self._stat = self._watched()
+        self._last_check = time.monotonic()
+
+    @property
+    def version(self) -> str:
+        return self._catalog.version
+
+    def _watched(self) -> tuple:
+        return _stat_key(self.compiled), _stat_key(self.source)
+
+    def get(self) -> L2Catalog:
+        if self.check_interval >= 0 and time.monotonic() - self._last_check >= self.check_interval:
+            self.maybe_reload()
+        return self._catalog
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        # chỉ một thread reload; các thread khác tiếp tục dùng bản hiện tại
+        if not self._lock.acquire(blocking=force):
+            return False
+        try:
+            self._last_check = time.monotonic()
+            stat = self._watched()
+            if not force and stat == self._stat:
+                return False
+            path = choose_catalog_path(self.compiled, self.source)
+            if not path.exists():
+                return False
+            if not force and path == self.path and file_checksum(path) == self._catalog.checksum:
+                self._stat = stat
+                return False
+            try:
+                catalog = L2Catalog.load(path)
+            except Exception:
+                # giữ _stat cũ để lần kiểm tra sau thử lại (vd: file đang được ghi dở)
+                logger.exception("Reload L2 catalog failed, keeping version %s", self._catalog.version[:12])
+                return False
+            if path != self.path:
+                logger.info("L2 catalog now served from %s (was %s)", path, self.path)
+            self.path, self._catalog, self._stat = path, catalog, stat
+            logger.info("Reloaded L2 catalog %s (version %s)", path, catalog.version[:12])
+            return True
+        finally:
+            self._lock.release()
+
+_default_store: L2CatalogStore | None = None
+_default_lock = threading.Lock()
+
+def default_catalog_store() -> L2CatalogStore:
+    """Store dùng chung cho các lời gọi không truyền catalog (vd: notebook)."""
+    global _default_store
+    if _default_store is None:
+        from src.core.config import settings
+        with _default_lock:
+            if _default_store is None:
+                _default_store = L2CatalogStore(resolve_catalog_path(settings.DATA_DIR), settings.L2_CATALOG_RELOAD_INTERVAL)
+    return _default_store
+
+def main(argv: list[str] | None = None) -> None:
+    from src.core.config import settings
+    parser = argparse.ArgumentParser(description="Công cụ cho catalog L2")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Biên dịch xlsx sang Arrow IPC (kèm manifest + checksum)")
+    b.add_argument("--source", type=Path, default=Path(settings.DATA_DIR, L2_CATALOG_FILE))
+    b.add_argument("--out", type=Path, default=Path(settings.DATA_DIR, L2_COMPILED_CATALOG_FILE))
+    st = sub.add_parser("stats", help="Thống kê kích thước partition theo khoá lọc cứng")
+    st.add_argument("--data-dir", type=Path, default=settings.DATA_DIR)
+    st.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        manifest = build_compiled_catalog(args.source, args.out)
+        print(f"Wrote {args.out} ({manifest['rows']} rows, sha256={manifest['sha256']})")
+    elif args.cmd == "stats":
+        catalog = L2Catalog.load(resolve_catalog_path(args.data_dir))
+        print(json.dumps(catalog.index.stats(args.top), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Batch L2 dạng cột (L2ColumnarBatchRequest): mỗi field của UserInputL2 là một mảng cùng độ dài.
+
+validate_columns kiểm tra theo cả cột bằng pandas/numpy với cùng luật như các validator của
+UserInputL2 (strip/upper to_hop_mon, chuẩn hoá ten_ccta/diem_ccta rồi kiểm tra cặp chứng chỉ,
+ràng buộc ge/le, ép kiểu lax của pydantic). Dòng sai được báo theo index, các dòng đúng dựng
+thẳng thành L2Students để chấm bằng L2Predictor.predict_students, không dựng model pydantic nào.
+
+Chuỗi số được ép bằng chính TypeAdapter của pydantic nên nhận/từ chối giống hệt endpoint rows.
+Khác biệt duy nhất: pydantic nhận diem_chuan = inf còn ở đây báo lỗi.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Sequence
+
+import numpy as np
+import pandas as pd
+from pydantic import TypeAdapter, ValidationError
+
+from src.services.constants import TinhTP, ToHopMon, CCTA, CEFRLevel, JLPTLevel, NhomNganh
+from src.services.l2.features import HB, L2Students
+
+_VALID_TINH_TP = np.array([e.value for e in TinhTP], dtype=object)
+_TO_HOP_MON = np.array([e.value for e in ToHopMon], dtype=object)
+_NHOM_NGANH = np.array([e.value for e in NhomNganh], dtype='int64')
+_CEFR = np.array([e.value for e in CEFRLevel], dtype=object)
+_JLPT = np.array([e.value for e in JLPTLevel], dtype=object)
+_NO_CCTA = ["", "0", "NONE", "NO"]
+
+_INT, _FLOAT = TypeAdapter(int), TypeAdapter(float)
+_BUDGET_LIMIT = 2.0**63      # hoc_phi ép sang int64 (budget_max), như Field(lt=...) của UserInputL2
+
+@dataclass
+class L2ColumnarBatch:
+    """Kết quả validate: học sinh hợp lệ (theo thứ tự index) và lỗi theo dòng."""
+    students: L2Students        # chỉ các dòng hợp lệ và có tinh_tp hợp lệ
+    index: np.ndarray           # vị trí trong request của từng học sinh trong students
+    errors: list[dict]          # [{"index": i, "error": [{"loc": [...], "msg": ..., "type": ...}]}]
+
+class _Errors:
+    def __init__(self, n: int):
+        self.bad = np.zeros(n, dtype=bool)
+        self._by_row: dict[int, list[dict]] = {}
+
+    def add(self, mask: np.ndarray, loc: list, msg: str, type_: str = "value_error") -> None:
+        for i in np.flatnonzero(mask).tolist():
+            self._by_row.setdefault(i, []).append({"loc": loc, "msg": msg, "type": type_})
+        self.bad |= mask
+
+    def rows(self) -> list[dict]:
+        return [{"index": i, "error": self._by_row[i]} for i in sorted(self._by_row)]
+
+def _series(values: Sequence[Any]) -> pd.Series:
+    return pd.Series(list(values), dtype=object)
+
+def _types(s: pd.Series) -> pd.Series:
+    return s.map(type)
+
+def _text(s: pd.Series) -> pd.Series:
+    # str(v) như validator mode="before"; None giữ nguyên
+    return s.map(str, na_action="ignore").where(s.notna(), None)
+
+def _lax(adapter: TypeAdapter, x: str):
+    """Ép chuỗi bằng chính pydantic (luật '_', khoảng trắng, '2.0'... giống hệt); None nếu pydantic báo lỗi."""
+    try:
+        return adapter.validate_python(x)
+    except ValidationError:
+        return None
+
+def _py_int(x):
+    try:
+        return int(x)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+def _numbers(s: pd.Series, ok_type: np.ndarray, convert) -> np.ndarray:
+    return pd.to_numeric(s.where(ok_type, None).map(convert, na_action="ignore"),
+                         errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+def _float_col(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Ép float lax của pydantic: bool/int/float, chuỗi ép qua pydantic."""
+    t = _types(s)
+    ok_type = t.isin([bool, int, float, str]).to_numpy()
+    v = _numbers(s, ok_type, lambda x: _lax(_FLOAT, x) if isinstance(x, str) else x)
+    return v, ok_type & np.isfinite(v)
+
+def _int_col(s: pd.Series, allow_bool: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """Ép int lax của pydantic: int, float không có phần lẻ, chuỗi ép qua pydantic ('2', ' 2.0 ', '7_48')."""
+    t = _types(s)
+    ok_type = t.isin([bool, int, float, str] if allow_bool else [int, float, str]).to_numpy()
+    v = _numbers(s, ok_type, lambda x: _lax(_INT, x) if isinstance(x, str) else x)
+    ok = ok_type & np.isfinite(v) & (v == np.trunc(v))
+    # giá trị ngoài int64 vẫn sai ở bước kiểm khoảng/enum sau đó
+    return np.where(ok, np.clip(v, -2.0**62, 2.0**62), 0).astype("int64"), ok
+
+def _py_int_col(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """int(v) của Python (validator cong_lap): float bị cắt phần lẻ, chuỗi theo luật của int()."""
+    v = _numbers(s, np.ones(len(s), dtype=bool), _py_int)
+    ok = np.isfinite(v)
+    return np.where(ok, np.clip(v, -2.0**62, 2.0**62), 0).astype("int64"), ok
+
+def validate_columns(cols: dict[str, Sequence[Any]]) -> L2ColumnarBatch:
+    """cols: tên field UserInputL2 -> mảng giá trị (cùng độ dài, đã kiểm ở L2ColumnarBatchRequest)."""
+    n = len(cols["diem_chuan"])
+    err = _Errors(n)
+
+    cong_lap, ok = _py_int_col(_series(cols["cong_lap"]))
+    err.add(~ok, ["cong_lap"], "cong_lap must be 0 or 1 (integer)", "int_parsing")
+    err.add(ok & ~np.isin(cong_lap, (0, 1)), ["cong_lap"], "cong_lap must be 0 or 1")
+
+    tinh_tp = _text(_series(cols["tinh_tp"]))
+    err.add(tinh_tp.isna().to_numpy(), ["tinh_tp"], "Input should be a valid string", "string_type")
+    tinh_tp = tinh_tp.str.strip()
+
+    to_hop_mon = _text(_series(cols["to_hop_mon"])).str.strip().str.upper()
+    err.add(~to_hop_mon.isin(_TO_HOP_MON).to_numpy(), ["to_hop_mon"], "Input should be a valid ToHopMon", "enum")
+
+    num = {}
+    for f in ("diem_chuan", "hoc_phi"):
+        v, ok = _float_col(_series(cols[f]))
+        err.add(~ok, [f], "Input should be a valid finite number", "float_parsing")
+        err.add(ok & (v < 0), [f], "Input should be greater than or equal to 0", "greater_than_equal")
+        num[f] = np.where(ok, v, 0.0)
+    err.add(num["hoc_phi"] >= _BUDGET_LIMIT, ["hoc_phi"], "Input should be less than 9223372036854776000", "less_than")
+
+    ten_ccta = _text(_series(cols["ten_ccta"])).fillna("0").str.strip().str.upper()
+    ten_ccta = ten_ccta.mask(ten_ccta.isin(_NO_CCTA), "0")
+    err.add(~ten_ccta.isin(["0", CCTA.CEFR.value, CCTA.JLPT.value]).to_numpy(), ["ten_ccta"],
+            "Value error, ten_ccta must be '0', 'CEFR' or 'JLPT'")
+    diem_ccta = _text(_series(cols["diem_ccta"])).fillna("0").str.strip().str.upper()
+    diem_ccta = diem_ccta.mask(diem_ccta.eq(""), "0")
+
+    hb = np.empty((n, len(HB)), dtype="int64")
+    for j, f in enumerate(HB):
+        v, ok = _int_col(_series(cols[f]))
+        err.add(~ok, [f], "Input should be a valid integer", "int_parsing")
+        err.add(ok & ((v < 1) | (v > 4)), [f], "Input should be between 1 and 4", "less_than_equal")
+        hb[:, j] = v
+
+    nhom_nganh, ok = _int_col(_series(cols["nhom_nganh"]), allow_bool=False)
+    err.add(~(ok & np.isin(nhom_nganh, _NHOM_NGANH)), ["nhom_nganh"], "Input should be a valid NhomNganh", "enum")
+
+    # _pair_ccta_check: như model_validator, chỉ chạy cho dòng không có lỗi field
+    fields_ok = ~err.bad
+    ten, lvl = ten_ccta.to_numpy(dtype=object), diem_ccta.to_numpy(dtype=object)
+    err.add(fields_ok & (ten == "0") & (lvl != "0"), [], "Value error, diem_ccta must be '0' when ten_ccta is '0'")
+    err.add(fields_ok & (ten == CCTA.CEFR.value) & ~np.isin(lvl, _CEFR), [],
+            "Value error, diem_ccta must be one of CEFR levels: A1,A2,B1,B2,C1,C2")
+    err.add(fields_ok & (ten == CCTA.JLPT.value) & ~np.isin(lvl, _JLPT), [],
+            "Value error, diem_ccta must be one of JLPT levels: N5,N4,N3,N2,N1")
+
+    # tinh_tp ngoài danh sách: không lỗi, kết quả rỗng (như is_tinh_tp_valid)
+    keep = ~err.bad & tinh_tp.isin(_VALID_TINH_TP).to_numpy()
+    idx = np.flatnonzero(keep)
+    obj = lambda a: np.asarray(a, dtype=object)[idx]
+    students = L2Students(
+        cong_lap=cong_lap[idx].astype(object),
+        tinh_tp=obj(tinh_tp),
+        to_hop_mon=obj(to_hop_mon),
+        ten_ccta=ten[idx],
+        diem_ccta=lvl[idx],
+        nhom_nganh=nhom_nganh[idx].astype(object),
+        diem_chuan=num["diem_chuan"][idx],
+        budget_max=num["hoc_phi"][idx].astype("int64"),     # đã chặn >= 2**63 ở trên
+        hb=hb[idx],
+    )
+    return L2ColumnarBatch(students=students, index=idx, errors=err.rows())
@@ -0,0 +1,73 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+import threading
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+UNK = "__UNK__"
+
+@dataclass
+class FeatureEncoder:
+    """
+    Mã hoá bảng cặp thành ma trận float64 theo đúng thứ tự feature_names, biên dịch
+    1 lần lúc load từ cat_vocab.json + feature_names.json (+ pandas_categorical của booster).
+
+    Giá trị phân loại được ánh xạ sang mã category mà booster thấy khi dự đoán từ
+    DataFrame: giá trị ngoài vocab -> __UNK__ (mã 0 khi vocab trùng thứ tự lúc train),
+    category booster chưa từng thấy -> NaN. Bảng ánh xạ cho từng danh sách category
+    (vd: category cố định của catalog) được cache nên mỗi lần gọi chỉ còn gather theo mã.
+    """
+    feature_names: list[str]
+    cat_codes: dict[str, dict[str, float]]      # cột -> {giá trị (str): mã}
+    cat_unk: dict[str, float]
+    _tables: dict = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    MAX_CACHED_TABLES = 256
+
+    @classmethod
+    def compile(cls, feature_names: list[str], cat_vocab: dict[str, list[str]], pandas_categorical: list | None = None) -> "FeatureEncoder":
+        # LightGBM gán pandas_categorical theo thứ tự các cột category trong feature_names
+        cat_features = [f for f in feature_names if f in cat_vocab]
+        cat_codes, cat_unk = {}, {}
+        for j, c in enumerate(cat_features):
+            train_cats = [str(x) for x in pandas_categorical[j]] if pandas_categorical else list(cat_vocab[c])
+            pos = {v: float(i) for i, v in enumerate(train_cats)}
+            cat_codes[c] = {v: pos.get(v, np.nan) for v in cat_vocab[c]}
+            cat_unk[c] = pos.get(UNK, np.nan)
+        return cls(feature_names=list(feature_names), cat_codes=cat_codes, cat_unk=cat_unk)
+
+    def _table(self, col: str, categories: pd.Index) -> np.ndarray:
+        """Mã cho từng category (+ phần tử cuối cho giá trị thiếu, tức mã pandas -1)."""
+        key = (col, id(categories))
+        hit = self._tables.get(key)
+        if hit is not None and hit[0] is categories:
+            return hit[1]
+        m, unk = self.cat_codes[col], self.cat_unk[col]
+        table = np.fromiter((m.get(str(v), unk) for v in categories), dtype=np.float64, count=len(categories))
+        table = np.append(table, m.get("nan", unk))   # astype(str) của giá trị thiếu là "nan"
+        with self._lock:
+            if len(self._tables) >= self.MAX_CACHED_TABLES:
+                self._tables.clear()
+            self._tables[key] = (categories, table)
+        return table
+
+    def encode(self, df: pd.DataFrame) -> np.ndarray:
+        X = np.empty((len(df), len(self.feature_names)), dtype=np.float64, order="F")
+        for j, f in enumerate(self.feature_names):
+            if f not in df.columns:
+                X[:, j] = np.nan
+                continue
+            s = df[f]
+            if f in self.cat_codes:
+                if isinstance(s.dtype, pd.CategoricalDtype):
+                    X[:, j] = self._table(f, s.cat.categories)[s.cat.codes.to_numpy()]
+                else:
+                    m, unk = self.cat_codes[f], self.cat_unk[f]
+                    X[:, j] = [m.get(v, unk) for v in s.astype(str)]
+            elif is_numeric_dtype(s.dtype):
+                X[:, j] = s.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                X[:, j] = pd.to_numeric(s, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        return X
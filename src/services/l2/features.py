@@ -0,0 +1,137 @@
+from __future__ import annotations
+from dataclasses import dataclass, fields
+import re
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from src.services.constants import plain_value
+
+HB = ['hk10', 'hk11', 'hk12', 'hl10', 'hl11', 'hl12']
+STUDENT_CAT_KEYS = ['cong_lap', 'tinh_tp', 'to_hop_mon', 'ten_ccta', 'diem_ccta', 'nhom_nganh']
+CAND_CAT_KEYS = ['cong_lap', 'tinh_tp', 'to_hop_mon', 'nhom_nganh', 'ma_xet_tuyen']
+
+COLS_NUM = [
+    'student_diem_chuan', 'student_budget_max',
+    'cand_diem_chuan_final', 'cand_hoc_phi', 'cand_y_base',
+    'diff_hk10', 'diff_hk11', 'diff_hk12', 'diff_hl10', 'diff_hl11', 'diff_hl12'
+]
+COLS_CAT = [
+    'student_cong_lap', 'student_tinh_tp', 'student_to_hop_mon', 'student_ten_ccta', 'student_diem_ccta', 'student_nhom_nganh',
+    'cand_cong_lap', 'cand_tinh_tp', 'cand_to_hop_mon', 'cand_nhom_nganh', 'cand_ma_xet_tuyen', 'cand_is_base_row'
+]
+PAIR_COLUMNS = COLS_NUM + COLS_CAT
+
+_NUM_RE = re.compile(r'(\d+\.?\d*)')
+
+def _to_float(s: pd.Series | None, n: int) -> np.ndarray:
+    if s is None:
+        return np.full(n, np.nan, dtype='float64')
+    return pd.to_numeric(s, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+def student_hb_value(val) -> int:
+    """Điểm HB của học sinh như trong filter_candidates_per_student_L2 (thiếu/0 -> 10)."""
+    if val is None or (isinstance(val, float) and np.isnan(val)):
+        return 10
+    m = _NUM_RE.search(str(val))
+    sv = float(m.group(1)) if m else 10
+    if np.isnan(sv) or sv == 0:
+        sv = 10
+    return int(sv)
+
+@dataclass(frozen=True)
+class CandidateFeatures:
+    """
+    Các cột cand_* (không phụ thuộc học sinh) tính sẵn 1 lần cho mỗi phiên bản catalog,
+    dạng mảng numpy cùng thứ tự dòng với catalog đã phân khối (L2PartitionIndex).
+    Cột phân loại lưu dạng mã (factorize, -1 = thiếu) + danh sách category.
+    """
+    diem_chuan_final: np.ndarray     # float64
+    hoc_phi: np.ndarray              # int64
+    y_base: np.ndarray               # float64
+    hb: np.ndarray                   # (n, 6) int64, theo thứ tự HB
+    cat_codes: dict[str, np.ndarray]     # cand_cong_lap, ..., cand_is_base_row
+    cat_categories: dict[str, pd.Index]
+    # theo mã category của cand_ma_xet_tuyen, thêm 1 phần tử cuối cho mã -1 (thiếu giá trị):
+    ma_xet_tuyen: np.ndarray         # object, str(mã) như astype(str) của pandas
+    uef_thptqg: np.ndarray           # bool, mã UEF...THPTQG (áp bậc ưu đãi, xem src.services.l2.prune)
+
+    @classmethod
+    def build(cls, frame: pl.DataFrame) -> "CandidateFeatures":
+        n = frame.height
+        cand = frame.to_pandas()
+
+        diem_chuan_final = _to_float(cand.get('diem_chuan_final'), n)
+        hoc_phi = pd.to_numeric(cand['hoc_phi'], errors='coerce').fillna(0).astype('int64').to_numpy() \
+            if 'hoc_phi' in cand.columns else np.zeros(n, dtype='int64')
+        if 'y_base' in cand.columns:
+            y_base = _to_float(cand['y_base'], n)
+        elif 'diem_chuan' in cand.columns:
+            y_base = _to_float(cand['diem_chuan'], n)
+        else:
+            y_base = diem_chuan_final
+
+        hb = np.full((n, len(HB)), 10, dtype='int64')
+        for i, c in enumerate(HB):
+            if c in cand.columns:
+                v = cand[c].astype(str).str.extract(r'(\d+\.?\d*)')[0].astype(float)
+                hb[:, i] = v.fillna(10).replace(0, 10).astype('int64').to_numpy()
+
+        raw = {}
+        for k in CAND_CAT_KEYS:
+            raw[f'cand_{k}'] = cand[k].to_numpy() if k in cand.columns else np.full(n, pd.NA, dtype=object)
+        raw['cand_is_base_row'] = cand['is_base_row'].to_numpy() if 'is_base_row' in cand.columns \
+            else np.full(n, False, dtype=object)
+        cat_codes, cat_categories = {}, {}
+        for c, arr in raw.items():
+            cat_codes[c], cat_categories[c] = pd.factorize(arr, sort=True)
+        names = pd.Series([*map(str, cat_categories['cand_ma_xet_tuyen']), "nan"], dtype=object)
+        ma_xet_tuyen = names.to_numpy(dtype=object)
+        uef_thptqg = (names.str.startswith("UEF") & names.str.endswith("THPTQG")).to_numpy(dtype=bool)
+
+        for a in (diem_chuan_final, hoc_phi, y_base, hb, ma_xet_tuyen, uef_thptqg, *cat_codes.values()):
+            a.setflags(write=False)
+        return cls(
+            diem_chuan_final=diem_chuan_final, hoc_phi=hoc_phi, y_base=y_base, hb=hb,
+            cat_codes=cat_codes, cat_categories=cat_categories, ma_xet_tuyen=ma_xet_tuyen, uef_thptqg=uef_thptqg,
+        )
+
+@dataclass(frozen=True)
+class L2Students:
+    """N học sinh dạng cột, đầu vào của build_pairs_L2."""
+    cong_lap: np.ndarray        # object (int)
+    tinh_tp: np.ndarray         # object (str)
+    to_hop_mon: np.ndarray      # object (str)
+    ten_ccta: np.ndarray        # object (str)
+    diem_ccta: np.ndarray       # object (str)
+    nhom_nganh: np.ndarray      # object (int)
+    diem_chuan: np.ndarray      # float64
+    budget_max: np.ndarray      # int64
+    hb: np.ndarray              # (N, 6) int64
+
+    def __len__(self) -> int:
+        return len(self.diem_chuan)
+
+    def take(self, idx) -> "L2Students":
+        """Các học sinh theo chỉ số/slice idx."""
+        return L2Students(**{f.name: getattr(self, f.name)[idx] for f in fields(self)})
+
+    @classmethod
+    def from_users(cls, users) -> "L2Students":
+        cols = {k: [] for k in STUDENT_CAT_KEYS}
+        diem, budget, hb = [], [], []
+        for u in users:
+            for k in STUDENT_CAT_KEYS:
+                cols[k].append(plain_value(getattr(u, k, None)))
+            score = pd.to_numeric(getattr(u, 'diem_chuan', np.nan), errors='coerce')
+            diem.append(float(score) if pd.notna(score) else np.nan)
+            b = pd.to_numeric(getattr(u, 'hoc_phi', np.nan), errors='coerce')
+            budget.append(0 if pd.isna(b) else int(b))
+            hb.append([student_hb_value(getattr(u, c, np.nan)) for c in HB])
+        obj = lambda xs: np.array(xs + [None], dtype=object)[:-1]   # tránh numpy tự đổi kiểu
+        return cls(
+            **{k: obj(v) for k, v in cols.items()},
+            diem_chuan=np.array(diem, dtype='float64'),
+            budget_max=np.array(budget, dtype='int64'),
+            hb=np.array(hb, dtype='int64').reshape(-1, len(HB)),
+        )
@@ -1,26 +1,59 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
-import json, lightgbm as lgb
-import pandas as pd
-from pandas.api.types import CategoricalDtype
-import re
-from typing import List, Iterable
+import hashlib, json, lightgbm as lgb
+import numpy as np
+import sys
+from typing import Sequence
 
 from src.services.l2.schema import UserInputL2, L2PredictResult
-from src.services.l2.preprocess import preprocess_input_data_L2
+from src.services.l2.preprocess import build_pairs_L2
+from src.services.l2.features import CandidateFeatures, L2Students
+from src.services.l2.encoder import FeatureEncoder
+from src.services.l2.tree_engine import FLAT_MODEL_DIR, FlatTreeEngine, calibrate_max_rows, model_checksum
+from src.services.l2.cache import L2ResultCache
+from src.services.l2.prune import PruneStage, uef_discount_eligible_many
+from src.services.l2.catalog import L2CatalogStore, resolve_catalog_path
+from src.core.config import settings
+from src.core import metrics, timing
 
 @dataclass
 class L2Predictor:
-    booster: lgb.Booster
+    booster: lgb.Booster | None     # None khi chỉ dùng FlatTreeEngine đã parse sẵn
     feature_names: list[str]
     cat_vocab: dict[str, list[str]]
     threshold: float
+    catalog: L2CatalogStore
+    encoder: FeatureEncoder
+    tree_engine: FlatTreeEngine | None = None
+    tree_engine_max_rows: int = 0
+    model_version: str = ""
+    cache: L2ResultCache | None = None
+    prune: PruneStage | None = None
 
     @classmethod
-    def load(cls, model_dir: Path, threshold: float) -> "L2Predictor":
+    def load(cls, model_dir: Path, threshold: float, data_dir: Path | None = None) -> "L2Predictor":
         mroot = Path(model_dir, "user_item_lightgbm")
-        booster = lgb.Booster(model_file=str(mroot / "l2_lightgbm.txt"))
+        model_file = mroot / "l2_lightgbm.txt"
+        model_version = hashlib.sha256(
+            b"".join((mroot / f).read_bytes() for f in ("l2_lightgbm.txt", "feature_names.json", "cat_vocab.json"))
+        ).hexdigest()
+        mode = settings.L2_TREE_ENGINE.lower()
+
+        # Dạng đã parse (python -m src.services.l2.tree_engine export): mmap, không parse text;
+        # engine "numpy" khi đó không cần dựng Booster
+        tree_engine, flat_meta = None, None
+        if mode in ("numpy", "auto"):
+            flat_meta = FlatTreeEngine.read_meta(mroot / FLAT_MODEL_DIR)
+            if flat_meta is not None and flat_meta.get("source_sha256") == model_checksum(model_file):
+                tree_engine = FlatTreeEngine.load(mroot / FLAT_MODEL_DIR, mmap=settings.MODEL_MMAP)
+            else:
+                flat_meta = None
+        if mode == "numpy" and flat_meta is not None:
+            booster, pandas_categorical = None, flat_meta["pandas_categorical"]
+        else:
+            booster = lgb.Booster(model_file=str(model_file))
+            pandas_categorical = booster.pandas_categorical
         feature_names = json.loads((mroot / "feature_names.json").read_text(encoding="utf-8"))
         cat_vocab = json.loads((mroot / "cat_vocab.json").read_text(encoding="utf-8"))
 
@@ -33,85 +66,180 @@ class L2Predictor:
                     seen.add(v); vs.append(v)
             if "__UNK__" in vs: vs.remove("__UNK__")
             cat_vocab[c] = ["__UNK__"] + vs
-        return cls(booster=booster, feature_names=feature_names, cat_vocab=cat_vocab, threshold=threshold)
-
-    def _prep_df_for_predict(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
-        for c, vocab in self.cat_vocab.items():
-            if c in df.columns:
-                s = df[c].astype(str)
-                s.loc[~s.isin(vocab)] = "__UNK__"
-                df[c] = s.astype(CategoricalDtype(categories=vocab, ordered=False))
-        for f in self.feature_names:
-            if f not in df.columns: df[f] = pd.NA
-        cat_keys = set(self.cat_vocab.keys())
-        for f in self.feature_names:
-            if f not in cat_keys: df[f] = pd.to_numeric(df[f], errors="coerce")
-        return df.reindex(columns=self.feature_names)
-
-    def predict(self, user: UserInputL2) -> list[L2PredictResult]:
-        processed = preprocess_input_data_L2(user)
-        if isinstance(processed, pd.DataFrame) and processed.empty: return []
-        X = self._prep_df_for_predict(processed)
-        if X.shape[0] == 0: return []
 
-        niter = self.booster.best_iteration or self.booster.current_iteration() or -1
-        score = self.booster.predict(X, num_iteration=niter)
-        out = processed.copy(); out["score"] = score
-
-        top = (
-            out.loc[out["score"] >= self.threshold, ["cand_ma_xet_tuyen", "score"]]
-              .assign(cand_ma_xet_tuyen=lambda df: df["cand_ma_xet_tuyen"].astype(str))
-              .sort_values("score", ascending=False)
-              .drop_duplicates(subset="cand_ma_xet_tuyen", keep="first")
-              .reset_index(drop=True)
+        # Catalog ứng viên load 1 lần lúc khởi động, tự reload khi file đổi
+        catalog = L2CatalogStore(resolve_catalog_path(data_dir or settings.DATA_DIR), settings.L2_CATALOG_RELOAD_INTERVAL)
+        encoder = FeatureEncoder.compile(feature_names, cat_vocab, pandas_categorical)
+
+        # Engine NumPy tuỳ chọn cho batch nhỏ (xem FlatTreeEngine)
+        max_rows = 0
+        if mode in ("numpy", "auto"):
+            if tree_engine is None:
+                niter = booster.best_iteration or booster.current_iteration() or -1
+                tree_engine = FlatTreeEngine.from_model_file(model_file, niter)
+            if mode == "numpy" and booster is None:
+                max_rows = sys.maxsize      # không có Booster: mọi batch qua engine (chấm theo khối, xem predict_raw)
+            elif settings.L2_TREE_ENGINE_AUTO_MAX_ROWS is not None:
+                max_rows = settings.L2_TREE_ENGINE_AUTO_MAX_ROWS
+            else:
+                max_rows = calibrate_max_rows(tree_engine, booster, len(feature_names))
+
+        cache = L2ResultCache(
+            max_entries=settings.L2_CACHE_MAX_ENTRIES, max_bytes=settings.L2_CACHE_MAX_BYTES,
+            ttl=settings.L2_CACHE_TTL, score_decimals=settings.L2_CACHE_SCORE_DECIMALS,
         )
-        result = [L2PredictResult(ma_xet_tuyen=r["cand_ma_xet_tuyen"], score=r["score"]) for _, r in top.iterrows()]
-        return discount_fee(user, result)
-
-_CEFR_RE = re.compile(r"\b(A1|A2|B1|B2|C1|C2)\b", re.I)
-
-def _has_cefr(val: str | None, targets: Iterable[str]) -> bool:
-    """Kiểm tra 'A2', 'B1'... có xuất hiện (case-insensitive) trong chuỗi."""
-    if not val:
-        return False
-    s = str(val).upper()
-    # tìm đúng token CEFR
-    m = _CEFR_RE.search(s)
-    if m:
-        return m.group(1) in {t.upper() for t in targets}
-    return any(t.upper() in s for t in targets)
-
-def discount_fee(input: UserInputL2, results: List["L2PredictResult"]) -> List["L2PredictResult"]:
+        return cls(
+            booster=booster, feature_names=feature_names, cat_vocab=cat_vocab, threshold=threshold,
+            catalog=catalog, encoder=encoder, tree_engine=tree_engine, tree_engine_max_rows=max_rows,
+            model_version=model_version, cache=cache, prune=PruneStage() if settings.L2_PRUNE else None,
+        )
+
+    def _score(self, X: np.ndarray) -> np.ndarray:
+        if self.tree_engine is not None and X.shape[0] <= self.tree_engine_max_rows:
+            return self.tree_engine.predict(X)
+        niter = self.booster.best_iteration or self.booster.current_iteration() or -1
+        return self.booster.predict(X, num_iteration=niter)
+
+    def predict(self, user: UserInputL2, top_k: int | None = None) -> list[L2PredictResult]:
+        return self.predict_many([user], top_k)[0]
+
+    def predict_many(self, users: Sequence[UserInputL2], top_k: int | None = None) -> list[list[L2PredictResult]]:
+        if not users: return []
+        return self.predict_students(L2Students.from_users(users), top_k)
+
+    def predict_students(self, students: L2Students, top_k: int | None = None) -> list[list[L2PredictResult]]:
+        """
+        Dự đoán cho nhiều học sinh (dạng cột) qua cache kết quả; phần miss được chấm chung
+        bằng _predict_uncached rồi ghi lại vào cache. top_k: chỉ chọn k mã điểm cao nhất
+        (cache theo từng top_k).
+        """
+        if not len(students): return []
+        metrics.PREDICT_BATCH_SIZE.labels("l2").observe(len(students))
+        with metrics.stage("l2", "catalog"):
+            catalog = self.catalog.get()
+        rt = timing.detail()
+        stats = {} if rt is not None else None
+        if self.cache is None or not self.cache.enabled:
+            idx = list(range(len(students)))
+            results = self._predict_uncached(students, catalog, stats, top_k)
+        else:
+            version = (self.model_version, catalog.version)
+            keys = self.cache.keys(students)
+            if top_k is not None:
+                keys = [k + (top_k,) for k in keys]
+            results = self.cache.get_many(version, keys)
+            # học sinh trùng khoá trong cùng batch chỉ chấm 1 lần
+            pending: dict[tuple, list[int]] = {}
+            for i, r in enumerate(results):
+                if r is None:
+                    pending.setdefault(keys[i], []).append(i)
+            idx = [ix[0] for ix in pending.values()]
+            if pending:
+                scored = self._predict_uncached(students.take(np.asarray(idx)), catalog, stats, top_k)
+                for ix, res in zip(pending.values(), scored):
+                    for i in ix:
+                        results[i] = list(res)
+                self.cache.put_many(version, [(keys[i], res) for i, res in zip(idx, scored)])
+        if rt is not None:
+            rt.items = _item_stats(len(students), np.asarray(idx, dtype=np.int64), stats)
+        return results
+
+    def _predict_uncached(self, students: L2Students, catalog, stats: dict | None = None,
+                          top_k: int | None = None) -> list[list[L2PredictResult]]:
+        """
+        Ghép cặp của tất cả học sinh trong một bảng (bỏ trước các cặp mà luật đã quyết định, xem
+        PruneStage), gọi booster.predict đúng một lần, rồi hậu xử lý chung bằng _top_results.
+        Kết quả giống gọi predict từng người.
+        """
+        with metrics.stage("l2", "pairs"):
+            processed, item = build_pairs_L2(students, catalog, self.prune, stats)
+        metrics.L2_PAIRS.observe(len(processed))
+        timing.count("pairs", len(processed))
+        if processed.empty: return [[] for _ in range(len(students))]
+        with metrics.stage("l2", "encode"):
+            X = self.encoder.encode(processed)
+        with metrics.stage("l2", "predict"):
+            score = self._score(X)
+        with metrics.stage("l2", "postprocess"):
+            codes = processed["cand_ma_xet_tuyen"].cat.codes.to_numpy()
+            return self._top_results(students, item, codes, score, catalog.features, top_k)
+
+    def _top_results(self, students: L2Students, item: np.ndarray, codes: np.ndarray, score: np.ndarray,
+                     features: CandidateFeatures, top_k: int | None = None) -> list[list[L2PredictResult]]:
+        """
+        Hậu xử lý trên mảng cho cả batch: lọc ngưỡng, bỏ mã UEF...THPTQG của học sinh không
+        thỏa bậc ưu đãi, sắp theo điểm giảm dần và giữ mỗi mã một lần với điểm cao nhất.
+        Cùng điểm: theo ma_xet_tuyen tăng dần (bản gốc dùng sort không ổn định nên thứ tự này
+        không cố định; ở đây cố ý chọn một thứ tự xác định, không phụ thuộc batch hay prune).
+        top_k: chỉ chọn (argpartition) rồi sắp k mã đầu của mỗi học sinh thay vì sắp tất cả.
+        """
+        n = len(students)
+        results: list[list[L2PredictResult]] = [[] for _ in range(n)]
+        keep = score >= self.threshold
+        uef = features.uef_thptqg[codes]     # mã -1 -> phần tử cuối (False)
+        if (uef & keep).any():
+            keep &= ~uef | uef_discount_eligible_many(students)[item]
+        idx = np.flatnonzero(keep)
+        if idx.size == 0: return results
+
+        it, cd, sc = item[idx], codes[idx], score[idx]
+        width = len(features.ma_xet_tuyen)
+        if top_k is None:
+            # mã category sắp theo giá trị (factorize sort=True) nên thứ tự mã là thứ tự ma_xet_tuyen
+            order = np.lexsort((cd, -sc, it))
+            it, cd, sc = it[order], cd[order], sc[order]
+            # lần xuất hiện đầu của (học sinh, mã) trong thứ tự trên là dòng điểm cao nhất
+            _, first = np.unique(it.astype(np.int64) * width + cd + 1, return_index=True)
+            first.sort()
+            it, cd, sc = it[first], cd[first], sc[first]
+        else:
+            it, cd, sc = _best_per_code(it, cd, sc, width)
+            order = _top_k_order(it, cd, sc, n, top_k)
+            it, cd, sc = it[order], cd[order], sc[order]
+        names = features.ma_xet_tuyen[cd].tolist()
+        scores = sc.tolist()
+        bounds = np.searchsorted(it, np.arange(n + 1)).tolist()
+        for i in range(n):
+            a, b = bounds[i], bounds[i + 1]
+            results[i] = [L2PredictResult.model_construct(ma_xet_tuyen=m, score=s)
+                          for m, s in zip(names[a:b], scores[a:b])]
+        return results
+
+def _best_per_code(it: np.ndarray, cd: np.ndarray, sc: np.ndarray, width: int):
+    """Mỗi (học sinh, mã) một dòng với điểm cao nhất, theo học sinh rồi mã tăng dần (sort khoá int, không sort điểm)."""
+    key = it.astype(np.int64) * width + cd + 1
+    o = np.argsort(key, kind="stable")
+    key = key[o]
+    start = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    key = key[start]
+    return key // width, key % width - 1, np.maximum.reduceat(sc[o], start)
+
+def _top_k_order(it: np.ndarray, cd: np.ndarray, sc: np.ndarray, n: int, k: int) -> np.ndarray:
     """
-    Giữ lại các kết quả UEF-THPTQG nếu thỏa 1 trong 3 bậc ưu đãi sau:
-      - Tier1: (21 ≤ điểm < 24) hoặc CEFR A2, và ngân sách ≥ 60,000,000
-      - Tier2: (24 ≤ điểm < 27) hoặc CEFR B1/B2, và ngân sách ≥ 40,000,000
-      - Tier3: (27 ≤ điểm ≤ 30) hoặc CEFR C1/C2, và ngân sách ≥ 0
-    Các mã khác (không phải UEF…THPTQG) giữ nguyên.
+    Chỉ số k dòng đầu của mỗi học sinh theo (điểm giảm dần, mã tăng dần), đã sắp.
+    Dòng vào theo học sinh rồi mã tăng dần (_best_per_code): học sinh có hơn k mã chọn bằng
+    argpartition, phần được chọn mới được sắp.
     """
-    try:
-        score = float(input.diem_chuan)
-    except Exception:
-        score = 0.0
-
-    try:
-        budget = float(input.hoc_phi)
-    except Exception:
-        budget = 0.0
-
-    out: List["L2PredictResult"] = []
-    for r in results:
-        code = str(r.ma_xet_tuyen)
-
-        # Chỉ áp dụng rule cho mã UEF...THPTQG
-        if code.startswith("UEF") and code.endswith("THPTQG"):
-            tier1 = ((21 <= score < 24) or _has_cefr(input.diem_ccta, {"A2"})) and (budget >= 60_000_000)
-            tier2 = ((24 <= score < 27) or _has_cefr(input.diem_ccta, {"B1", "B2"})) and (budget >= 40_000_000)
-            tier3 = ((27 <= score <= 30) or _has_cefr(input.diem_ccta, {"C1", "C2"})) and (budget >= 0)
-
-            if tier1 or tier2 or tier3:
-                out.append(r)
-        else:
-            out.append(r)
+    bounds = np.searchsorted(it, np.arange(n + 1))
+    keep = np.ones(it.size, dtype=bool)
+    for i in np.flatnonzero(np.diff(bounds) > k).tolist():
+        a, b = int(bounds[i]), int(bounds[i + 1])
+        seg = sc[a:b]
+        kth = seg[np.argpartition(-seg, k - 1)[k - 1]]
+        gt = np.flatnonzero(seg > kth)
+        eq = np.flatnonzero(seg == kth)[:k - gt.size]   # cùng điểm ở biên: mã nhỏ trước
+        keep[a:b] = False
+        keep[a + gt] = True
+        keep[a + eq] = True
+    sel = np.flatnonzero(keep)
+    return sel[np.lexsort((cd[sel], -sc[sel], it[sel]))]
+
+def _item_stats(n: int, scored: np.ndarray, stats: dict | None) -> dict:
+    """Số liệu theo học sinh cho ?debug_timing=1: học sinh không nằm trong scored lấy từ cache (hoặc trùng khoá trong batch)."""
+    out = {"cached": np.ones(n, dtype=bool), "candidates": np.zeros(n, dtype=np.int64),
+           "pairs": np.zeros(n, dtype=np.int64)}
+    out["cached"][scored] = False
+    for k in ("candidates", "pairs"):
+        if stats and k in stats:
+            out[k][scored] = stats[k]
     return out
@@ -1,36 +1,64 @@
-import os
 import re
 import numpy as np
 import pandas as pd
 import polars as pl
 
+from src.core import timing
 from src.services.l2.schema import UserInputL2
-from src.core.config import settings
-
-def preprocess_input_data_L2(data: UserInputL2) -> pd.DataFrame:
-    df = pd.DataFrame([data.model_dump()])
-    l2_uni = pd.read_excel(os.path.join(settings.DATA_DIR, "L2_uni_requirement.xlsx")).astype(str)
-    l2_uni = pl.from_pandas(l2_uni).with_columns([
-        pl.col("cong_lap").cast(pl.Int64),
-        pl.col("tinh_tp").cast(pl.Utf8),
-        pl.col("to_hop_mon").cast(pl.Utf8),
-        pl.col("diem_chuan").cast(pl.Float64),
-        pl.col("hoc_phi").cast(pl.Int64),
-        pl.col("ten_ccta").cast(pl.Utf8),
-        pl.col("diem_ccta").cast(pl.Utf8),
-        pl.col("diem_quy_doi").cast(pl.Float64),
-        pl.col("hk10").cast(pl.Int64),
-        pl.col("hk11").cast(pl.Int64),
-        pl.col("hk12").cast(pl.Int64),
-        pl.col("hl10").cast(pl.Int64),
-        pl.col("hl11").cast(pl.Int64),
-        pl.col("hl12").cast(pl.Float64),
-        pl.col("nhom_nganh").cast(pl.Int64),
-        pl.col("ma_xet_tuyen").cast(pl.Utf8)
-    ])
-    test_df = input_to_pairs_L2(pl.from_pandas(df), l2_uni)
+from src.services.l2.catalog import L2Catalog, default_catalog_store
+from src.services.l2.features import HB, PAIR_COLUMNS, STUDENT_CAT_KEYS, L2Students
+from src.services.l2.prune import PruneStage
+
+def preprocess_input_data_L2(data: UserInputL2, catalog: L2Catalog | None = None) -> pd.DataFrame:
+    if catalog is None:
+        catalog = default_catalog_store().get()
+    test_df, _ = build_pairs_L2(L2Students.from_users([data]), catalog)
     return test_df
 
+def build_pairs_L2(students: L2Students, catalog: L2Catalog, prune: PruneStage | None = None,
+                   stats: dict | None = None) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Ghép N học sinh với ứng viên trong một lượt: tra partition index theo 4 khoá lọc cứng
+    (hash join), rồi gather các cột cand_* tính sẵn và broadcast student_* theo chỉ số.
+    Trả về (bảng cặp, mảng chỉ số học sinh của từng cặp); cột và dtype giống
+    filter_candidates_per_student_L2. prune: bỏ trước các cặp chắc chắn không có trong kết quả.
+    stats: nếu có, ghi số ứng viên (trước prune) và số cặp (sau prune) của từng học sinh.
+    """
+    n = len(students)
+    bounds = np.array(
+        [catalog.locate(tp, thm, cl, nn) for tp, thm, cl, nn in
+         zip(students.tinh_tp, students.to_hop_mon, students.cong_lap, students.nhom_nganh)],
+        dtype=np.int64,
+    ).reshape(n, 2)
+    counts = bounds[:, 1] - bounds[:, 0]
+    item = np.repeat(np.arange(n), counts)
+    offsets = np.cumsum(counts) - counts
+    rows = np.arange(item.size) - offsets[item] + bounds[item, 0]
+    timing.count("candidates", item.size)
+    if prune is not None:
+        item, rows = prune.apply(students, item, rows, catalog.features)
+    if stats is not None:
+        stats["candidates"] = counts
+        stats["pairs"] = np.bincount(item, minlength=n)
+
+    f = catalog.features
+    cols = {
+        'student_diem_chuan': students.diem_chuan[item],
+        'student_budget_max': students.budget_max[item],
+        'cand_diem_chuan_final': f.diem_chuan_final[rows],
+        'cand_hoc_phi': f.hoc_phi[rows],
+        'cand_y_base': f.y_base[rows],
+    }
+    diffs = f.hb[rows] - students.hb[item]
+    for i, c in enumerate(HB):
+        cols[f'diff_{c}'] = diffs[:, i]
+    for k in STUDENT_CAT_KEYS:
+        codes, uniq = pd.factorize(getattr(students, k), sort=True)
+        cols[f'student_{k}'] = pd.Categorical.from_codes(codes[item], categories=uniq)
+    for c, codes in f.cat_codes.items():
+        cols[c] = pd.Categorical.from_codes(codes[rows], categories=f.cat_categories[c])
+    return pd.DataFrame(cols, columns=PAIR_COLUMNS), item
+
 def input_to_pairs_L2(input_data: pl.DataFrame, candidate_list: pl.DataFrame) -> pd.DataFrame:
     cand_tp = input_data['tinh_tp'].unique().to_list()
     cand_thm = input_data['to_hop_mon'].unique().to_list()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Iterable, Protocol, Sequence
+import re
+import threading
+
+import numpy as np
+
+from src.services.l2.features import CandidateFeatures, L2Students
+
+_CEFR_RE = re.compile(r"\b(A1|A2|B1|B2|C1|C2)\b", re.I)
+
+def _has_cefr(val: str | None, targets: Iterable[str]) -> bool:
+    """Kiểm tra 'A2', 'B1'... có xuất hiện (case-insensitive) trong chuỗi."""
+    if not val:
+        return False
+    s = str(val).upper()
+    # tìm đúng token CEFR
+    m = _CEFR_RE.search(s)
+    if m:
+        return m.group(1) in {t.upper() for t in targets}
+    return any(t.upper() in s for t in targets)
+
+def uef_discount_eligible(score: float, budget: float, diem_ccta: str | None) -> bool:
+    """
+    Học sinh có được giữ các mã UEF-THPTQG không (thỏa 1 trong 3 bậc ưu đãi):
+      - Tier1: (21 ≤ điểm < 24) hoặc CEFR A2, và ngân sách ≥ 60,000,000
+      - Tier2: (24 ≤ điểm < 27) hoặc CEFR B1/B2, và ngân sách ≥ 40,000,000
+      - Tier3: (27 ≤ điểm ≤ 30) hoặc CEFR C1/C2, và ngân sách ≥ 0
+    """
+    tier1 = ((21 <= score < 24) or _has_cefr(diem_ccta, {"A2"})) and (budget >= 60_000_000)
+    tier2 = ((24 <= score < 27) or _has_cefr(diem_ccta, {"B1", "B2"})) and (budget >= 40_000_000)
+    tier3 = ((27 <= score <= 30) or _has_cefr(diem_ccta, {"C1", "C2"})) and (budget >= 0)
+    return tier1 or tier2 or tier3
+
+def uef_discount_eligible_many(students: L2Students) -> np.ndarray:
+    """uef_discount_eligible cho từng học sinh. budget_max = int(hoc_phi) cho cùng kết quả
+    với hoc_phi thực vì các ngưỡng ngân sách là số nguyên và hoc_phi >= 0."""
+    return np.fromiter(
+        (uef_discount_eligible(float(s), float(b), c)
+         for s, b, c in zip(students.diem_chuan, students.budget_max, students.diem_ccta)),
+        dtype=bool, count=len(students),
+    )
+
+class PruneRule(Protocol):
+    """
+    Luật lọc trước khi chấm. keep() trả mask bool theo từng cặp (False = bỏ), hoặc None nếu giữ tất.
+    Chỉ được bỏ những cặp mà kết quả cuối chắc chắn không chứa (vd. bị bước hậu xử lý loại),
+    để kết quả giống hệt khi không lọc: điểm của mỗi cặp không phụ thuộc các cặp khác.
+    """
+    name: str
+
+    def keep(self, students: L2Students, item: np.ndarray, rows: np.ndarray,
+             features: CandidateFeatures) -> np.ndarray | None: ...
+
+@dataclass(frozen=True)
+class UEFDiscountRule:
+    """Bỏ các mã UEF...THPTQG của học sinh không thỏa bậc ưu đãi nào (hậu xử lý sẽ loại chúng sau khi chấm)."""
+    name: str = "uef_thptqg_discount"
+
+    def keep(self, students, item, rows, features):
+        uef = features.uef_thptqg[features.cat_codes["cand_ma_xet_tuyen"][rows]]
+        if not uef.any():
+            return None
+        return ~uef | uef_discount_eligible_many(students)[item]
+
+DEFAULT_RULES: tuple[PruneRule, ...] = (UEFDiscountRule(),)
+
+@dataclass
+class PruneStats:
+    rows_in: int = 0
+    rows_out: int = 0
+    pruned: dict[str, int] = field(default_factory=dict)
+
+class PruneStage:
+    """Áp lần lượt các PruneRule lên chỉ số cặp (item, rows) trước khi dựng bảng feature, kèm đếm số cặp bị bỏ theo luật."""
+
+    def __init__(self, rules: Sequence[PruneRule] = DEFAULT_RULES):
+        self.rules = tuple(rules)
+        self.stats = PruneStats(pruned={r.name: 0 for r in self.rules})
+        self._lock = threading.Lock()
+
+    def apply(self, students: L2Students, item: np.ndarray, rows: np.ndarray,
+              features: CandidateFeatures) -> tuple[np.ndarray, np.ndarray]:
+        n_in = item.size
+        counts = {}
+        for rule in self.rules:
+            if item.size == 0:
+                break
+            keep = rule.keep(students, item, rows, features)
+            if keep is None:
+                continue
+            counts[rule.name] = int(item.size - np.count_nonzero(keep))
+            item, rows = item[keep], rows[keep]
+        with self._lock:
+            self.stats.rows_in += n_in
+            self.stats.rows_out += item.size
+            for name, n in counts.items():
+                self.stats.pruned[name] += n
+        return item, rows
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"rules": [r.name for r in self.rules], "rows_in": self.stats.rows_in,
+                    "rows_out": self.stats.rows_out, "pruned": dict(self.stats.pruned)}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator, model_validator
-from typing import List, Literal, Optional, Set, ClassVar, Union
+from typing import Any, Dict, List, Literal, Optional, Set, ClassVar, Union
 
 from src.services.constants import TinhTP, ToHopMon, CCTA, CEFRLevel, JLPTLevel, NhomNganh
 
@@ -11,7 +11,7 @@ class UserInputL2(BaseModel):
     tinh_tp: str = Field(..., description="Tỉnh/Thành phố (vd: TP. Hồ Chí Minh, ...)")
     to_hop_mon: ToHopMon = Field(..., description="Tổ hợp môn (vd: D01, A00, VNUHCM, ...)")
     diem_chuan: float = Field(..., ge=0, description="Điểm thi thực tế hoặc điểm chuẩn user đạt được")
-    hoc_phi: float = Field(..., ge=0, description="Mức học phí dự kiến (VNĐ/năm)")
+    hoc_phi: float = Field(..., ge=0, lt=2**63, description="Mức học phí dự kiến (VNĐ/năm)")     # ép sang int64
     ten_ccta: str = Field(..., description="Tên chứng chỉ tiếng anh (nếu có)")
     diem_ccta: str = Field(..., description="Điểm chứng chỉ tiếng anh (nếu có)")
     hk10: int = Field(..., ge=1, le=4, description="Điểm rèn luyện năm lớp 10 (1: Tốt, 2: Khá, 3: Đạt, 4: Chưa đạt)")
@@ -35,7 +35,10 @@ class UserInputL2(BaseModel):
     @field_validator("cong_lap", mode="before")
     @classmethod
     def _v_cong_lap(cls, v):
-        iv = int(v)
+        try:
+            iv = int(v)
+        except (TypeError, OverflowError):  # None, list, inf: pydantic chỉ bọc ValueError thành lỗi validate
+            raise ValueError("cong_lap must be 0 or 1") from None
         if iv not in (0, 1):
             raise ValueError("cong_lap must be 0 or 1")
         return iv
@@ -90,5 +93,48 @@ class L2PredictResult(BaseModel):
     ma_xet_tuyen: str = Field(..., description="Mã xét tuyển")
     score: float = Field(..., description="Điểm xác suất model dự đoán mức độ phù hợp cho lựa chọn này")
 
+class L2ColumnarResult(BaseModel):
+    """Kết quả batch dạng cột (?format=columnar): mỗi vị trí là một (học sinh, mã)."""
+    index: List[int]
+    ma_xet_tuyen: List[str]
+    score: List[float]
+
 class L2BatchRequest(BaseModel):
     items: List[UserInputL2]
+
+class L2ColumnarBatchRequest(BaseModel):
+    """
+    Batch dạng cột: mỗi field của UserInputL2 là một mảng, phần tử thứ i thuộc học sinh i.
+    Giá trị được validate theo cột (src.services.l2.columnar), dòng sai báo lỗi theo index.
+    """
+    cong_lap: List[Any]
+    tinh_tp: List[Any]
+    to_hop_mon: List[Any]
+    diem_chuan: List[Any]
+    hoc_phi: List[Any]
+    ten_ccta: List[Any]
+    diem_ccta: List[Any]
+    hk10: List[Any]
+    hk11: List[Any]
+    hk12: List[Any]
+    hl10: List[Any]
+    hl11: List[Any]
+    hl12: List[Any]
+    nhom_nganh: List[Any]
+
+    def __len__(self) -> int:
+        return len(self.diem_chuan)
+
+    @model_validator(mode="after")
+    def _same_length(self):
+        lengths = {f: len(getattr(self, f)) for f in type(self).model_fields}
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f"all columns must have the same length, got {lengths}")
+        return self
+
+class L2RowError(BaseModel):
+    index: int = Field(..., description="Vị trí học sinh trong batch")
+    error: List[Dict[str, Any]] = Field(..., description="Lỗi validate dạng pydantic (loc, msg, type)")
+
+class L2ColumnarBatchResult(L2ColumnarResult):
+    errors: List[L2RowError]
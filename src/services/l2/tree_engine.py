@@ -0,0 +1,326 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+
+FLAT_MODEL_DIR = "flat"
+FLAT_FORMAT_VERSION = 1
+_ARRAY_FIELDS = ("split_feature", "threshold", "decision_type", "left", "right",
+                 "cat_start", "cat_len", "cat_bits", "leaf_value", "roots")
+
+# Hằng số và bit của decision_type theo LightGBM (include/LightGBM/tree.h)
+_K_ZERO_THRESHOLD = 1e-35
+_MAX_CELLS = 1 << 20         # (dòng × cây) tối đa mỗi khối của predict_raw, ~24 MiB mảng tạm
+_CATEGORICAL_MASK = 1
+_DEFAULT_LEFT_MASK = 2
+_MISSING_ZERO, _MISSING_NAN = 1, 2
+
+def _parse_blocks(text: str) -> tuple[dict, list[dict]]:
+    header, trees = {}, []
+    cur = header
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("Tree="):
+            cur = {}
+            trees.append(cur)
+            continue
+        if line == "end of trees":
+            break
+        if "=" in line:
+            k, v = line.split("=", 1)
+            cur[k] = v
+        elif line and cur is header:
+            header[line] = ""   # cờ không có giá trị, vd: average_output
+    return header, trees
+
+def _arr(block: dict, key: str, dtype) -> np.ndarray:
+    v = block.get(key, "")
+    return np.array(v.split(), dtype=dtype) if v else np.empty(0, dtype=dtype)
+
+@dataclass(frozen=True)
+class FlatTreeEngine:
+    """
+    Dự đoán LightGBM bằng NumPy thuần trên các mảng node đã làm phẳng.
+
+    Toàn bộ cây được duyệt đồng thời theo từng tầng cho cả ma trận đầu vào; phù hợp với
+    batch nhỏ (vài chục - vài trăm cặp) nơi chi phí cố định của Booster.predict chiếm phần lớn.
+    Hỗ trợ split số (kể cả missing Zero/NaN, default_left) và split phân loại dạng bitset.
+    Chỉ hỗ trợ mô hình 1 output (binary/cross_entropy/regression), không hỗ trợ linear tree.
+    """
+    split_feature: np.ndarray    # int32, theo node trong (toàn cục)
+    threshold: np.ndarray        # float64
+    decision_type: np.ndarray    # uint8
+    left: np.ndarray             # int64: >= 0 node trong, < 0 là ~chỉ số lá (toàn cục)
+    right: np.ndarray
+    cat_start: np.ndarray        # int64, vị trí bitset trong cat_bits (node phân loại)
+    cat_len: np.ndarray          # int64, số word 32-bit của bitset
+    cat_bits: np.ndarray         # uint32
+    leaf_value: np.ndarray       # float64 (toàn cục)
+    roots: np.ndarray            # int64, node gốc (hoặc ~lá nếu cây chỉ có 1 lá)
+    objective: str
+    sigmoid: float
+    average_output: bool
+
+    @classmethod
+    def from_model_file(cls, path: Path, num_iteration: int | None = None) -> "FlatTreeEngine":
+        return cls.from_model_string(Path(path).read_text(encoding="utf-8"), num_iteration)
+
+    @classmethod
+    def from_model_string(cls, text: str, num_iteration: int | None = None) -> "FlatTreeEngine":
+        header, trees = _parse_blocks(text)
+        if int(header.get("num_tree_per_iteration", 1)) != 1:
+            raise NotImplementedError("FlatTreeEngine chỉ hỗ trợ mô hình 1 output")
+        obj = header.get("objective", "regression").split()
+        objective, sigmoid = obj[0], 1.0
+        for tok in obj[1:]:
+            if tok.startswith("sigmoid:"):
+                sigmoid = float(tok.split(":", 1)[1])
+        if objective not in ("binary", "cross_entropy") and not objective.startswith("regression"):
+            raise NotImplementedError(f"objective {objective!r} chưa được hỗ trợ")
+        if num_iteration is not None and num_iteration > 0:
+            trees = trees[:num_iteration]
+
+        feats, thrs, dts, lefts, rights, cstarts, clens, bits, leaves, roots = ([] for _ in range(10))
+        n_nodes = n_leaves = n_bits = 0
+        for t in trees:
+            if t.get("is_linear", "0") != "0":
+                raise NotImplementedError("linear tree chưa được hỗ trợ")
+            num_leaves = int(t["num_leaves"])
+            leaf_value = _arr(t, "leaf_value", np.float64)
+            leaves.append(leaf_value)
+            if num_leaves == 1:
+                roots.append(~n_leaves)
+                n_leaves += 1
+                continue
+
+            left, right = _arr(t, "left_child", np.int64), _arr(t, "right_child", np.int64)
+            # đổi chỉ số cục bộ sang toàn cục: node trong += n_nodes, lá ~i -> ~(i + n_leaves)
+            lefts.append(np.where(left >= 0, left + n_nodes, ~(~left + n_leaves)))
+            rights.append(np.where(right >= 0, right + n_nodes, ~(~right + n_leaves)))
+            threshold = _arr(t, "threshold", np.float64)
+            decision = _arr(t, "decision_type", np.int64).astype(np.uint8)
+            feats.append(_arr(t, "split_feature", np.int32))
+            thrs.append(threshold)
+            dts.append(decision)
+
+            cat_bounds = _arr(t, "cat_boundaries", np.int64)
+            cat_thr = _arr(t, "cat_threshold", np.uint32)
+            is_cat = (decision & _CATEGORICAL_MASK).astype(bool)
+            cat_idx = np.where(is_cat, threshold, 0).astype(np.int64)
+            cstart = np.zeros(num_leaves - 1, dtype=np.int64)
+            clen = np.zeros(num_leaves - 1, dtype=np.int64)
+            if is_cat.any():
+                cstart[is_cat] = cat_bounds[cat_idx[is_cat]] + n_bits
+                clen[is_cat] = cat_bounds[cat_idx[is_cat] + 1] - cat_bounds[cat_idx[is_cat]]
+            cstarts.append(cstart)
+            clens.append(clen)
+            bits.append(cat_thr)
+
+            roots.append(n_nodes)
+            n_nodes += num_leaves - 1
+            n_leaves += num_leaves
+            n_bits += cat_thr.size
+
+        cat = lambda xs, dt: np.concatenate(xs).astype(dt) if xs else np.empty(0, dtype=dt)
+        return cls(
+            split_feature=cat(feats, np.int32), threshold=cat(thrs, np.float64),
+            decision_type=cat(dts, np.uint8), left=cat(lefts, np.int64), right=cat(rights, np.int64),
+            cat_start=cat(cstarts, np.int64), cat_len=cat(clens, np.int64), cat_bits=cat(bits, np.uint32),
+            leaf_value=cat(leaves, np.float64), roots=np.array(roots, dtype=np.int64),
+            objective=objective, sigmoid=sigmoid, average_output="average_output" in header,
+        )
+
+    @property
+    def num_trees(self) -> int:
+        return int(self.roots.size)
+
+    def _go_left(self, x: np.ndarray, nd: np.ndarray) -> np.ndarray:
+        dt = self.decision_type[nd]
+        is_nan = np.isnan(x)
+        go_left = np.zeros(x.shape, dtype=bool)
+
+        num = (dt & _CATEGORICAL_MASK) == 0
+        if num.any():
+            xv, d = x[num], dt[num]
+            mt = (d >> 2) & 3
+            xv = np.where(np.isnan(xv) & (mt != _MISSING_NAN), 0.0, xv)
+            use_default = ((mt == _MISSING_ZERO) & (xv >= -_K_ZERO_THRESHOLD) & (xv <= _K_ZERO_THRESHOLD)) | \
+                          ((mt == _MISSING_NAN) & np.isnan(xv))
+            go_left[num] = np.where(use_default, (d & _DEFAULT_LEFT_MASK) != 0, xv <= self.threshold[nd[num]])
+
+        cat = ~num
+        if cat.any():
+            xv, node = x[cat], nd[cat]
+            nan = is_nan[cat]
+            # NaN hoặc mã âm luôn đi nhánh phải
+            iv = np.trunc(np.where(nan, 0.0, xv)).astype(np.int64)     # static_cast<int>
+            ok = ~nan & (iv >= 0)
+            word = np.where(ok, iv >> 5, 0)
+            ok &= word < self.cat_len[node]
+            w = self.cat_bits[np.where(ok, self.cat_start[node] + word, 0)] if self.cat_bits.size else np.zeros(xv.shape, np.uint32)
+            go_left[cat] = ok & (((w >> (iv & 31).astype(np.uint32)) & 1) == 1)
+        return go_left
+
+    def predict_raw(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        n, t = X.shape[0], self.roots.size
+        # mảng tạm cỡ n × số cây: batch lớn chấm theo khối để bộ nhớ không tăng theo batch
+        step = max(1, _MAX_CELLS // max(t, 1))
+        if n > step:
+            return np.concatenate([self.predict_raw(X[i:i + step]) for i in range(0, n, step)])
+        node = np.broadcast_to(self.roots, (n, t)).reshape(-1).copy()
+        rows = np.repeat(np.arange(n), t)
+        pos = np.flatnonzero(node >= 0)
+        while pos.size:
+            nd = node[pos]
+            x = X[rows[pos], self.split_feature[nd]]
+            nxt = np.where(self._go_left(x, nd), self.left[nd], self.right[nd])
+            node[pos] = nxt
+            pos = pos[nxt >= 0]
+        leaf = self.leaf_value[~node].reshape(n, t)
+        raw = np.zeros(n, dtype=np.float64)
+        for j in range(t):      # cộng tuần tự theo thứ tự cây như LightGBM
+            raw += leaf[:, j]
+        if self.average_output and t:
+            raw /= t
+        return raw
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        raw = self.predict_raw(X)
+        if self.objective in ("binary", "cross_entropy"):
+            return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+        return raw
+
+    def save(self, out_dir: Path, meta: dict | None = None) -> None:
+        """
+        Ghi dạng đã parse: mỗi mảng một file .npy (không nén, load được bằng mmap) + meta.json.
+        meta bổ sung (vd: sha256 model gốc, pandas_categorical) được ghi kèm.
+        """
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for f in _ARRAY_FIELDS:
+            np.save(out_dir / f"{f}.npy", np.ascontiguousarray(getattr(self, f)))
+        doc = {
+            "format_version": FLAT_FORMAT_VERSION,
+            "objective": self.objective, "sigmoid": self.sigmoid, "average_output": self.average_output,
+            **(meta or {}),
+        }
+        tmp = out_dir / "meta.json.tmp"
+        tmp.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, out_dir / "meta.json")
+
+    @staticmethod
+    def read_meta(path: Path) -> dict | None:
+        try:
+            doc = json.loads(Path(path, "meta.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return doc if doc.get("format_version") == FLAT_FORMAT_VERSION else None
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> "FlatTreeEngine":
+        """Đọc dạng đã parse; mmap=True để các worker dùng chung trang nhớ qua page cache."""
+        path = Path(path)
+        meta = cls.read_meta(path)
+        if meta is None:
+            raise ValueError(f"no flat model at {path}")
+        arrays = {f: np.load(path / f"{f}.npy", mmap_mode="r" if mmap else None) for f in _ARRAY_FIELDS}
+        return cls(**arrays, objective=meta["objective"], sigmoid=meta["sigmoid"], average_output=meta["average_output"])
+
+def model_checksum(model_file: Path) -> str:
+    return hashlib.sha256(Path(model_file).read_bytes()).hexdigest()
+
+def export_flat_model(model_file: Path, out_dir: Path | None = None) -> Path:
+    """
+    Parse l2_lightgbm.txt một lần và ghi dạng phẳng cạnh model (user_item_lightgbm/flat/),
+    kèm num_iteration và pandas_categorical để predictor không cần dựng Booster.
+    """
+    import lightgbm as lgb
+    model_file = Path(model_file)
+    booster = lgb.Booster(model_file=str(model_file))
+    niter = booster.best_iteration or booster.current_iteration() or -1
+    engine = FlatTreeEngine.from_model_file(model_file, niter)
+    out_dir = Path(out_dir) if out_dir is not None else model_file.parent / FLAT_MODEL_DIR
+    engine.save(out_dir, meta={
+        "source_sha256": model_checksum(model_file),
+        "num_iteration": niter,
+        "num_feature": booster.num_feature(),
+        "pandas_categorical": booster.pandas_categorical,
+    })
+    return out_dir
+
+def calibrate_max_rows(engine: FlatTreeEngine, booster, n_features: int, sizes=(1, 4, 16, 64, 256), repeat: int = 5) -> int:
+    """Số dòng lớn nhất mà FlatTreeEngine nhanh hơn Booster.predict trên máy hiện tại (0 nếu không có)."""
+    import time
+    rng = np.random.default_rng(0)
+    best = 0
+    for n in sizes:
+        X = rng.normal(size=(n, n_features))
+        timings = []
+        for fn in (lambda: engine.predict(X), lambda: booster.predict(X)):
+            fn()
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            timings.append(time.perf_counter() - t0)
+        if timings[0] >= timings[1]:
+            break
+        best = n
+    return best
+
+def verify_against_booster(model_file: Path, rows: int = 5000, seed: int = 0) -> float:
+    """Sinh đầu vào ngẫu nhiên (có NaN, 0, mã phân loại ngoài miền) và trả về sai số lớn nhất so với Booster.predict."""
+    import lightgbm as lgb
+    booster = lgb.Booster(model_file=str(model_file))
+    niter = booster.best_iteration or booster.current_iteration() or -1
+    engine = FlatTreeEngine.from_model_file(model_file, niter)
+
+    rng = np.random.default_rng(seed)
+    n_feat = booster.num_feature()
+    dump = booster.dump_model()
+    infos = dump.get("feature_infos", {})
+    X = np.empty((rows, n_feat), dtype=np.float64)
+    for j, name in enumerate(booster.feature_name()):
+        info = infos.get(name, {})
+        if info.get("values"):                       # feature phân loại
+            vals = np.array(info["values"] + [-1, max(info["values"]) + 5], dtype=np.float64)
+            X[:, j] = rng.choice(vals, size=rows)
+        else:
+            lo, hi = info.get("min_value", -10.0), info.get("max_value", 10.0)
+            span = (hi - lo) or 1.0
+            X[:, j] = rng.uniform(lo - 0.1 * span, hi + 0.1 * span, size=rows)
+            X[rng.random(rows) < 0.05, j] = 0.0
+        X[rng.random(rows) < 0.05, j] = np.nan
+    expected = booster.predict(X, num_iteration=niter)
+    return float(np.max(np.abs(engine.predict(X) - expected))) if rows else 0.0
+
+def main(argv: list[str] | None = None) -> None:
+    from src.core.config import settings
+    default_model = Path(settings.MODEL_DIR, "user_item_lightgbm", "l2_lightgbm.txt")
+    parser = argparse.ArgumentParser(description="Kiểm tra FlatTreeEngine khớp với Booster.predict / xuất dạng đã parse")
+    parser.add_argument("--model", type=Path, default=default_model)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tol", type=float, default=1e-9)
+    sub = parser.add_subparsers(dest="cmd")
+    sub.add_parser("verify", help="so sánh với Booster.predict (mặc định)")
+    e = sub.add_parser("export", help="ghi dạng phẳng .npy (mmap) cạnh model")
+    e.add_argument("--out", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "export":
+        out = export_flat_model(args.model, args.out)
+        print(f"{out}: {FlatTreeEngine.load(out).num_trees} trees")
+        return
+
+    err = verify_against_booster(args.model, args.rows, args.seed)
+    print(f"max |numpy - booster| = {err:.3e} on {args.rows} rows")
+    if err > args.tol:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
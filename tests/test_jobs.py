@@ -0,0 +1,55 @@
+"""JobRunner với nhiều tiến trình server: một runner mỗi JOBS_DIR, không xếp lại job của tiến trình còn sống."""
+import os
+
+from src.services import jobs
+from src.services.jobs import JobRunner, JobStore
+
+class _Proc:
+    pid = 0
+    exitcode = None
+
+    def __init__(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.alive = False
+
+    def join(self, timeout=None):
+        pass
+
+def _dead_pid() -> int:
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+def test_requeue_running_keeps_jobs_of_live_workers(tmp_path):
+    store = JobStore(tmp_path)
+    for job_id in ("a", "b"):
+        store.create(job_id, "l2", "csv", 10)
+    store.claim(os.getpid())            # a: tiến trình còn sống (runner khác)
+    store.claim(_dead_pid())            # b: tiến trình đã mất
+    assert store.requeue_running() == 1
+    assert store.get("a").status == "running" and store.get("a").worker_pid == os.getpid()
+    assert store.get("b").status == "queued" and store.get("b").worker_pid is None
+
+def test_one_runner_per_jobs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(JobRunner, "_spawn", lambda self: _Proc())
+    store = JobStore(tmp_path)
+    store.create("a", "l1", "csv", 10)
+    store.claim(os.getpid())
+
+    first, second = JobRunner(tmp_path, tmp_path), JobRunner(tmp_path, tmp_path)
+    assert first.start(monitor=False)
+    assert not second.start(monitor=False)      # vd. worker thứ hai của uvicorn --workers 2
+    assert second._procs == [] and second.snapshot()["alive"] is None
+    assert store.get("a").status == "running"
+
+    first.shutdown()
+    assert second.start(monitor=False)          # khoá được trả khi runner đầu dừng
+    second.shutdown()
+    assert (tmp_path / jobs.RUNNER_LOCK_FILE).exists()
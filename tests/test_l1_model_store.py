@@ -0,0 +1,81 @@
+"""Bố cục l1_groups/: khoá nhóm thuần và kiểm sha256 khi load."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+from src.services.constants import NhomNganh, TinhTP
+from src.services.l1.model_store import L1GroupStore, export_groups, group_key
+
+KEY = (np.int64(1), TinhTP.CAN_THO, NhomNganh(int(list(NhomNganh)[0])))
+
+def _store() -> L1GroupStore:
+    le = LabelEncoder().fit(["A"])
+    return L1GroupStore.from_bundle({KEY: None}, {}, {KEY: le}, {KEY: ["A"]})
+
+def test_group_key_is_plain():
+    key = group_key(KEY)
+    assert key == KEY and hash(key) == hash(KEY)
+    assert [type(v) for v in key] == [int, str, int]
+
+def test_lazy_store_verifies_checksum(tmp_path):
+    export_groups(_store(), tmp_path)
+    store = L1GroupStore.open(tmp_path)
+    assert KEY in store
+    assert store.get(KEY).class_list == ["A"]
+
+    corrupted = L1GroupStore.open(tmp_path)
+    path = tmp_path / corrupted.index[group_key(KEY)]["file"]
+    path.write_bytes(path.read_bytes() + b"\0")
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        corrupted.get(KEY)
+
+def test_predictor_ignores_groups_of_another_bundle(tmp_path):
+    from src.services.l1 import model_store
+    from src.services.l1.predictor import L1Predictor
+
+    def write_bundle(classes):
+        le = LabelEncoder().fit(classes)
+        joblib.dump({"models": {KEY: None}, "encoders": {}, "label_encoders": {KEY: le},
+                     "class_lists": {KEY: classes}}, tmp_path / "l1_model.joblib")
+
+    write_bundle(["A"])
+    model_store.main(["export", "--model-dir", str(tmp_path)])
+    p = L1Predictor.load(tmp_path, use_answer_table=False)
+    assert p.groups.root is not None and p.model_version == p.groups.source_version
+
+    write_bundle(["A", "B"])
+    p = L1Predictor.load(tmp_path, use_answer_table=False)
+    assert p.groups.root is None        # bundle đổi sau lần export
+    assert p.groups.get(KEY).class_list == ["A", "B"]
+    assert p.model_version != L1GroupStore.read_index(tmp_path / "l1_groups")["model_version"]
+
+def test_cold_load_does_not_block_other_groups(tmp_path, monkeypatch):
+    from src.services.l1 import model_store
+    other = (np.int64(0), TinhTP.CAN_THO, KEY[2])
+    le = LabelEncoder().fit(["A"])
+    export_groups(L1GroupStore.from_bundle({KEY: None, other: None}, {}, {KEY: le, other: le},
+                                           {KEY: ["A"], other: ["B"]}), tmp_path)
+    store = L1GroupStore.open(tmp_path)
+    store.get(other)
+
+    started, release = threading.Event(), threading.Event()
+    real_load = model_store.joblib.load
+
+    def slow_load(*args, **kwargs):
+        started.set()
+        assert release.wait(5)
+        return real_load(*args, **kwargs)
+
+    monkeypatch.setattr(model_store.joblib, "load", slow_load)
+    with ThreadPoolExecutor(3) as pool:
+        loads = [pool.submit(store.get, KEY) for _ in range(2)]
+        assert started.wait(5)
+        # nhóm đã trong cache trả ngay khi nhóm khác đang load
+        assert pool.submit(store.get, other).result(timeout=1).class_list == ["B"]
+        release.set()
+        assert [f.result(timeout=5).class_list for f in loads] == [["A"], ["A"]]
+    assert store.stats.loads == 2       # other + KEY một lần
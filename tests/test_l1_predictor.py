@@ -0,0 +1,114 @@
+"""L1Predictor.predict_many: điểm không phụ thuộc vào các học sinh khác trong batch và khớp bản gốc."""
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import LabelEncoder, OneHotEncoder
+from sklearn.svm import LinearSVC
+from sklearn.tree import DecisionTreeClassifier
+
+from src.services.constants import HSGSubject, NhomNganh, TinhTP
+from src.services.l1.model_store import L1GroupStore
+from src.services.l1.predictor import L1Predictor
+from src.services.l1.preprocess import preprocess_input_data_L1
+from src.services.l1.schema import UserInputL1
+
+OHE_COLS = ["cong_lap", "tinh_tp", "nhom_nganh", "hsg_subject", "ahld", "dan_toc_thieu_so", "haimuoi_huyen_ngheo_tnb"]
+GROUP_COLS = ["cong_lap", "tinh_tp", "nhom_nganh"]
+FLAGS = ["ahld", "dan_toc_thieu_so", "haimuoi_huyen_ngheo_tnb"]
+SUBJECTS = [e.value for e in HSGSubject]
+TINH = [e.value for e in TinhTP][:4]
+NGANH = [int(e) for e in NhomNganh][:3]
+
+def _make_model(kind: str, rnd: random.Random):
+    if kind == "lr":
+        return LogisticRegression(max_iter=500)
+    if kind == "svc":
+        return LinearSVC()
+    return DecisionTreeClassifier(max_depth=4, random_state=rnd.randint(0, 99))
+
+@pytest.fixture(scope="module")
+def predictor() -> L1Predictor:
+    rnd = random.Random(0)
+    models, encoders, les, classes = {}, {}, {}, {}
+    kinds = ["lr", "lr", "lr", "svc", "tree", "single"]
+    for g, gkey in enumerate((cl, tp, nn) for cl in (0, 1) for tp in TINH for nn in NGANH):
+        rows, ys = [], []
+        labels = [f"M{g}{i}" for i in range(rnd.randint(2, 7))]
+        for _ in range(80):
+            r = dict(zip(GROUP_COLS, map(str, gkey)), hsg_subject="0", ahld="0", dan_toc_thieu_so="0", haimuoi_huyen_ngheo_tnb="0")
+            kind = rnd.randint(0, 3)
+            if kind == 0:
+                r["hsg_subject"] = rnd.choice(SUBJECTS)
+            else:
+                r[FLAGS[kind - 1]] = "1"
+            rows.append(r)
+            ys.append(rnd.choice(labels))
+        kind = kinds[g % len(kinds)]
+        le = LabelEncoder().fit(ys)
+        if kind == "single":
+            models[gkey], les[gkey], classes[gkey] = None, le, [labels[0]]
+            continue
+        X = pd.DataFrame(rows)[OHE_COLS]
+        # input dense: chỗ predict_proba trên ma trận ghép lệch ULP so với từng dòng
+        enc = OneHotEncoder(handle_unknown="ignore", sparse_output=(g % 4 == 3)).fit(X)
+        models[gkey] = _make_model(kind, rnd).fit(enc.transform(X), le.transform(ys))
+        encoders[gkey], les[gkey], classes[gkey] = enc, le, list(le.classes_)
+    groups = L1GroupStore.from_bundle(models, encoders, les, classes)
+    return L1Predictor(groups=groups, group_cols=GROUP_COLS, ohe_cols=OHE_COLS)
+
+def _users(n: int, seed: int) -> list[UserInputL1]:
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        hsg = [rnd.choice(SUBJECTS) if rnd.random() < 0.3 else None for _ in range(3)]
+        out.append(UserInputL1(
+            cong_lap=rnd.randint(0, 1), tinh_tp=rnd.choice(TINH + ["Hà Nội"]), hoc_phi=rnd.randint(0, 10) * 1e6,
+            hsg_1=hsg[0], hsg_2=hsg[1], hsg_3=hsg[2],
+            ahld=int(rnd.random() < 0.3), dan_toc_thieu_so=int(rnd.random() < 0.3),
+            haimuoi_huyen_ngheo_tnb=int(rnd.random() < 0.3), nhom_nganh=rnd.choice(NGANH),
+        ))
+    return out
+
+def _baseline(p: L1Predictor, user: UserInputL1) -> list[tuple[str, dict]]:
+    """predict trước khi chấm theo nhóm: mỗi dòng ưu tiên một lần enc.transform + predict_proba."""
+    df = preprocess_input_data_L1(user).reset_index(drop=True)
+    out = []
+    for _, r in df.iterrows():
+        gkey = tuple(r[c] for c in GROUP_COLS)
+        loai = L1Predictor.infer_loai_uu_tien(r)
+        if loai == "Không ưu tiên" or gkey not in p.groups:
+            out.append((loai, {}))
+            continue
+        g = p.groups.get(gkey)
+        if g.model is None:
+            out.append((loai, {g.class_list[0]: 1.0}))
+            continue
+        X = g.encoder.transform(r[list(g.encoder.feature_names_in_)].astype(str).to_frame().T)
+        if hasattr(g.model, "predict_proba"):
+            pr = g.model.predict_proba(X)[0]
+            order = np.argsort(pr)[::-1]
+            out.append((loai, {str(lab): float(v) for lab, v in zip(g.label_encoder.classes_[order], pr[order] / pr.sum())}))
+        else:
+            out.append((loai, {str(g.label_encoder.inverse_transform(g.model.predict(X))[0]): 1.0}))
+    return out or [("Không ưu tiên", {})]
+
+def _plain(results) -> list[tuple[str, dict]]:
+    return [(r.loai_uu_tien, r.ma_xet_tuyen) for r in results]
+
+def test_predict_many_matches_baseline_exactly(predictor):
+    users = _users(300, seed=1)
+    got = predictor.predict_many(users)
+    assert [_plain(r) for r in got] == [_baseline(predictor, u) for u in users]
+
+def test_score_independent_of_batch(predictor):
+    users = _users(200, seed=2)
+    alone = [_plain(predictor.predict(u)) for u in users]
+    assert [_plain(r) for r in predictor.predict_many(users)] == alone
+    order = list(range(len(users)))
+    random.Random(3).shuffle(order)
+    shuffled = predictor.predict_many([users[i] for i in order])
+    assert [_plain(shuffled[j]) for j in np.argsort(order)] == alone
+    assert [_plain(r) for r in predictor.predict_many(users[:7])] == alone[:7]
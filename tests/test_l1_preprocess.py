@@ -0,0 +1,46 @@
+"""expand_priority_rows sinh đúng các dòng (và thứ tự) của clean_and_cast_L1."""
+import itertools
+
+import pandas as pd
+import pytest
+
+from src.services.l1.preprocess import (
+    FLAG_COLS, clean_and_cast_L1, expand_priority_rows, expand_priority_rows_many,
+)
+from src.services.l1.schema import UserInputL1
+
+HSG_CHOICES = [
+    (None, None, None),
+    ("Toán", None, None),
+    (None, "0", "Văn"),
+    ("0", "0", "0"),
+    ("Tiếng Nhật", "Anh", None),
+]
+COLS = ["cong_lap", "tinh_tp", "hoc_phi", "nhom_nganh", "hsg_subject", *FLAG_COLS]
+
+def _user(hsg, flags, i: int = 0) -> UserInputL1:
+    return UserInputL1(
+        cong_lap=i % 2, tinh_tp="TP. Hồ Chí Minh" if i % 3 else "Cần Thơ", hoc_phi=1e6 * i,
+        hsg_1=hsg[0], hsg_2=hsg[1], hsg_3=hsg[2], nhom_nganh=714 if i % 2 else 732,
+        **dict(zip(FLAG_COLS, flags)),
+    )
+
+CASES = [(hsg, flags) for hsg in HSG_CHOICES for flags in itertools.product((0, 1), repeat=3)]
+
+def _expected(user: UserInputL1) -> list[tuple]:
+    df = clean_and_cast_L1(pd.DataFrame([user.model_dump()]))
+    return [tuple(r) for r in df[COLS].itertuples(index=False, name=None)]
+
+def _got(rows) -> list[tuple]:
+    return [tuple(r[c] for c in COLS) for r in rows]
+
+@pytest.mark.parametrize("hsg,flags", CASES)
+def test_expand_matches_clean_and_cast(hsg, flags):
+    user = _user(hsg, flags)
+    assert _got(expand_priority_rows(user)) == _expected(user)
+
+def test_expand_many_keeps_user_order():
+    users = [_user(hsg, flags, i) for i, (hsg, flags) in enumerate(CASES)]
+    rows = expand_priority_rows_many(users)
+    assert [r.uid for r in rows] == sorted(r.uid for r in rows)
+    assert _got(rows) == [row for u in users for row in _expected(u)]
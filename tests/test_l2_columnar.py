@@ -0,0 +1,45 @@
+"""validate_columns nhận/từ chối giống hệt UserInputL2 (endpoint rows)."""
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from src.services.l2.columnar import validate_columns
+from src.services.l2.features import L2Students
+from src.services.l2.schema import UserInputL2
+
+BASE = dict(cong_lap=1, tinh_tp="TP. Hồ Chí Minh", to_hop_mon="D01", diem_chuan=25.0, hoc_phi=30_000_000,
+            ten_ccta="0", diem_ccta="0", hk10=1, hk11=2, hk12=1, hl10=1, hl11=1, hl12=3, nhom_nganh=748)
+
+CASES = [
+    ("hk10", v) for v in ("2.", "2.0", "2.00", " 2 ", "+2", "2_0", "٢", "２", 2.0, 2.5, True, "", None, "1e0")
+] + [
+    ("nhom_nganh", v) for v in ("7_48", "74_8", "748.", "748.0", " 748 ", 748.0, True, "0x2EC", "748_")
+] + [
+    ("cong_lap", v) for v in ("١", "１", "1_0", "1.0", " 1 ", 1.5, 0.9, True, None, [1], "inf", "1_")
+] + [
+    ("hoc_phi", v) for v in ("1e30", 1e30, 9.2e18, 10**30, "1__0", "_1", "1_", "1_000", " 5 ", "inf", "nan", "+_2")
+] + [
+    ("diem_chuan", v) for v in ("1__0", "_1", "25.", ".5", "2_5", "nan", -1)
+]
+
+def _pydantic_ok(user: dict) -> bool:
+    try:
+        UserInputL2(**user)
+    except ValidationError:
+        return False
+    return True
+
+@pytest.mark.parametrize("field, value", CASES)
+def test_columnar_accepts_like_pydantic(field, value):
+    user = {**BASE, field: value}
+    batch = validate_columns({k: [v] for k, v in user.items()})
+    assert (not batch.errors) == _pydantic_ok(user)
+
+def test_columnar_students_match_rows_path():
+    users = [{**BASE, f: v} for f, v in CASES]
+    users = [u for u in users if _pydantic_ok(u)]
+    batch = validate_columns({k: [u[k] for u in users] for k in BASE})
+    assert not batch.errors
+    expected = L2Students.from_users([UserInputL2(**u) for u in users])
+    for f in ("cong_lap", "nhom_nganh", "diem_chuan", "budget_max", "hb"):
+        assert np.array_equal(getattr(batch.students, f).astype(float), getattr(expected, f).astype(float)), f
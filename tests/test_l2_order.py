@@ -0,0 +1,56 @@
+"""Thứ tự kết quả L2: điểm giảm dần, cùng điểm theo ma_xet_tuyen; mỗi mã một lần với điểm cao nhất."""
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.services.l2.predictor import L2Predictor
+
+THRESHOLD = 0.5
+
+def _expected(codes: list[str], score: np.ndarray) -> list[tuple[str, float]]:
+    out = pd.DataFrame({"cand_ma_xet_tuyen": codes, "score": score})
+    top = (
+        out.loc[out["score"] >= THRESHOLD]
+          .sort_values(["score", "cand_ma_xet_tuyen"], ascending=[False, True], kind="stable")
+          .drop_duplicates(subset="cand_ma_xet_tuyen", keep="first")
+    )
+    return list(zip(top["cand_ma_xet_tuyen"], top["score"]))
+
+def _batch(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"M{i:03d}" for i in range(60)] + ["nan"], dtype=object)
+    features = SimpleNamespace(ma_xet_tuyen=vocab, uef_thptqg=np.zeros(len(vocab), dtype=bool))
+    counts = rng.integers(0, 80, 50)
+    item = np.repeat(np.arange(counts.size), counts)
+    codes = rng.integers(0, 60, item.size)
+    score = rng.integers(0, 8, item.size) / 8      # nhiều mã cùng điểm
+    return features, item, codes, score
+
+def _top(item, codes, score, features, top_k=None):
+    return L2Predictor._top_results(SimpleNamespace(threshold=THRESHOLD), [None] * (item.max() + 1),
+                                    item, codes, score, features, top_k)
+
+def test_ties_ordered_by_code():
+    features, item, codes, score = _batch()
+    for i, res in enumerate(_top(item, codes, score, features)):
+        rows = item == i
+        assert [(r.ma_xet_tuyen, r.score) for r in res] == _expected(features.ma_xet_tuyen[codes[rows]].tolist(), score[rows])
+
+def test_order_independent_of_row_order():
+    # thứ tự dòng trong catalog (hay cặp bị prune) không đổi kết quả
+    features, item, codes, score = _batch(1)
+    perm = np.random.default_rng(2).permutation(item.size)
+    perm = perm[np.argsort(item[perm], kind="stable")]      # giữ item không giảm
+    a = _top(item, codes, score, features)
+    b = _top(item[perm], codes[perm], score[perm], features)
+    assert [[(r.ma_xet_tuyen, r.score) for r in x] for x in a] == [[(r.ma_xet_tuyen, r.score) for r in x] for x in b]
+
+@pytest.mark.parametrize("k", [1, 3, 10, 40, 100])
+def test_top_k_matches_full_prefix(k):
+    # chọn bằng argpartition phải ra đúng k phần tử đầu của thứ tự đầy đủ, kể cả cùng điểm ở biên
+    features, item, codes, score = _batch(3)
+    full = _top(item, codes, score, features)
+    top = _top(item, codes, score, features, k)
+    assert [[(r.ma_xet_tuyen, r.score) for r in x] for x in top] == [[(r.ma_xet_tuyen, r.score) for r in x[:k]] for x in full]
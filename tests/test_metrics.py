@@ -0,0 +1,70 @@
+"""Metric multiprocess: /metrics gộp mọi tiến trình, worker được thay giữ counter/histogram và bỏ gauge."""
+import os
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from src.core import metrics
+from src.core.metrics import Gauge, Histogram, REGISTRY
+
+HIST = Histogram("test_stage_seconds", "Stage time.", ("stage",), buckets=(0.1, 1.0))
+GAUGE = Gauge("test_inflight", "In-flight batches.", ("kind",))
+metrics.declare(HIST, [("encode",), ("predict",)])
+
+def _samples() -> dict:
+    text = REGISTRY.render().decode()
+    return {(s.name, tuple(sorted(s.labels.items()))): s.value
+            for fam in text_string_to_metric_families(text) for s in fam.samples}
+
+def _in_child(fn) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            fn()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+def test_render_text_format():
+    HIST.labels("predict").observe(0.5)
+    HIST.labels("predict").observe(2.0)
+    text = REGISTRY.render().decode()
+    assert "# TYPE test_stage_seconds histogram" in text
+    assert 'test_stage_seconds_bucket{le="1.0",stage="predict"} 1.0' in text
+    assert 'test_stage_seconds_bucket{le="+Inf",stage="predict"} 2.0' in text
+    assert 'test_stage_seconds_count{stage="predict"} 2.0' in text
+    assert 'test_stage_seconds_sum{stage="predict"} 2.5' in text
+    assert 'test_stage_seconds_count{stage="encode"} 0.0' in text      # đã khai báo, chưa ghi
+    assert f'process_resident_memory_bytes{{pid="{os.getpid()}"}}' in text
+
+def test_restarted_worker_keeps_counters_drops_gauges():
+    key = ("test_stage_seconds_count", (("stage", "encode"),))
+    gauge = ("test_inflight", (("kind", "l2"),))
+    before = _samples()[key]
+
+    def work():
+        HIST.labels("encode").observe(0.05)
+        GAUGE.labels("l2").inc(3)       # chết khi batch còn đang chấm
+
+    dead = _in_child(work)
+    assert _samples()[key] == before + 1
+    assert _samples()[gauge] == 3
+    metrics.mark_dead(dead)
+    assert _samples().get(gauge, 0) == 0
+    assert _samples()[key] == before + 1
+
+    _in_child(lambda: HIST.labels("encode").observe(0.05))      # worker thay thế
+    assert _samples()[key] == before + 2
+    assert f'pid="{dead}"' not in REGISTRY.render().decode()
+
+def test_disabled_records_nothing():
+    key = ("test_stage_seconds_count", (("stage", "predict"),))
+    before = _samples()[key]
+    REGISTRY.enabled = False
+    try:
+        HIST.labels("predict").observe(0.5)
+        GAUGE.labels("l1").inc()
+    finally:
+        REGISTRY.enabled = True
+    after = _samples()
+    assert after[key] == before and after.get(("test_inflight", (("kind", "l1"),)), 0) == 0
@@ -0,0 +1,60 @@
+"""stream_predictions: dòng input hỏng chỉ sinh dòng lỗi của nó, stream vẫn chạy tới cuối."""
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ValidationError, field_validator
+
+from src.api.ndjson import NDJSONStreamingResponse, stream_predictions
+from src.services.l1.schema import UserInputL1
+from src.services.l2.schema import UserInputL2
+
+class _Executor:
+    async def run(self, kind, users, top_k=None):
+        return [[] for _ in users]
+
+class _Raw(BaseModel):
+    tinh_tp: str = "x"
+    n: int = 0
+
+    @property
+    def is_tinh_tp_valid(self) -> bool:
+        return True
+
+    @field_validator("n", mode="before")
+    @classmethod
+    def _n(cls, v):
+        return len(v)       # TypeError với số: pydantic không bọc
+
+def _client() -> TestClient:
+    app = FastAPI()
+    app.state.executor = _Executor()
+
+    @app.post("/stream")
+    async def stream(request: Request):
+        return NDJSONStreamingResponse(stream_predictions(request, "l2", _Raw))
+
+    return TestClient(app)
+
+def test_unwrapped_validator_error_is_a_line_error():
+    body = b'{"n": "ab"}\n{"n": 5}\n{"n": "c"}\n'
+    with _client() as c:
+        r = c.post("/stream", content=body)
+    out = [json.loads(line) for line in r.text.splitlines()]
+    assert r.status_code == 200
+    assert [o["index"] for o in out] == [0, 1, 2]
+    assert "result" in out[0] and "error" in out[1] and "result" in out[2]
+
+@pytest.mark.parametrize("schema, raw", [
+    (UserInputL2, '{"cong_lap": null}'),
+    (UserInputL2, '{"cong_lap": [1]}'),
+    (UserInputL1, '{"cong_lap": {}}'),
+    (UserInputL1, '{"hoc_phi": null}'),
+    (UserInputL1, '{"ahld": [0]}'),
+])
+def test_schema_rejects_non_numeric_with_validation_error(schema, raw):
+    with pytest.raises(ValidationError) as e:
+        schema.model_validate_json(raw)
+    field = next(iter(json.loads(raw)))
+    assert any(err["loc"] == (field,) and err["type"] == "value_error" for err in e.value.errors())
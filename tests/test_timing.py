@@ -0,0 +1,38 @@
+"""?debug_timing: tham số bool của route là nguồn duy nhất, có hay không có ServerTimingMiddleware."""
+import pytest
+from fastapi import APIRouter, FastAPI, Query
+from fastapi.testclient import TestClient
+
+from src.api.middleware import ServerTimingMiddleware, TimedRoute
+from src.core import timing
+
+def _app(server_timing: bool) -> FastAPI:
+    router = APIRouter(route_class=TimedRoute)
+
+    @router.post("/predict/x/batch")
+    async def batch(debug_timing: bool = Query(False)):
+        with timing.requested(debug_timing) as rt:
+            if rt is not None:
+                rt.count("pairs", 3)
+            return {"detail": timing.detail() is not None, "counts": rt.summary()["counts"] if rt else None}
+
+    app = FastAPI()
+    app.include_router(router)
+    if server_timing:
+        app.add_middleware(ServerTimingMiddleware)
+    return app
+
+@pytest.mark.parametrize("server_timing", [True, False])
+@pytest.mark.parametrize("value, on", [("1", True), ("true", True), ("yes", True), ("on", True),
+                                       ("0", False), ("off", False), ("no", False)])
+def test_debug_timing_follows_route_param(server_timing, value, on):
+    with TestClient(_app(server_timing)) as c:
+        r = c.post(f"/predict/x/batch?debug_timing={value}")
+    assert r.status_code == 200
+    assert r.json() == {"detail": on, "counts": {"pairs": 3} if on else None}
+    assert ("server-timing" in r.headers) == server_timing
+
+def test_requested_outside_request():
+    with timing.requested(True) as rt:
+        assert timing.current() is rt and rt.detail
+    assert timing.current() is None
@@ -0,0 +1,84 @@
+"""FlatTreeEngine khớp Booster.predict tới 1e-9 (binary, regression, split phân loại, NaN, mã lạ)."""
+import numpy as np
+import pytest
+
+lgb = pytest.importorskip("lightgbm")
+
+from src.services.l2.tree_engine import FlatTreeEngine, verify_against_booster
+
+TOL = 1e-9
+
+def _data(n: int = 600, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.normal(size=n),
+        rng.uniform(-3, 3, size=n),
+        rng.integers(0, 12, size=n).astype(np.float64),   # phân loại
+        rng.integers(0, 4, size=n).astype(np.float64),    # phân loại
+        rng.normal(size=n),
+    ])
+    X[rng.random(n) < 0.1, 0] = np.nan
+    X[rng.random(n) < 0.1, 4] = 0.0
+    logit = X[:, 1] + np.where(np.isin(X[:, 2], (1, 3, 5, 7)), 1.5, -1.0) + 0.5 * X[:, 3] + np.nan_to_num(X[:, 0])
+    return X, logit, rng
+
+def _train(objective: str, categorical: bool, **params) -> "lgb.Booster":
+    X, logit, rng = _data()
+    if objective == "binary":
+        y = (logit + rng.normal(scale=0.5, size=len(logit)) > 0).astype(int)
+    elif objective == "cross_entropy":
+        y = 1 / (1 + np.exp(-logit))
+    else:
+        y = logit
+    ds = lgb.Dataset(X, y, categorical_feature=[2, 3] if categorical else "auto", free_raw_data=False)
+    params = {"objective": objective, "num_leaves": 15, "min_data_in_leaf": 5, "min_data_per_group": 5,
+              "cat_smooth": 1, "verbose": -1, "seed": 0, **params}
+    return lgb.train(params, ds, num_boost_round=30)
+
+def _edge_rows(n_feat: int) -> np.ndarray:
+    X = np.zeros((6, n_feat))
+    X[0] = np.nan                          # toàn NaN
+    X[1, 2], X[1, 3] = 999, 57             # mã phân loại chưa gặp
+    X[2, 2], X[2, 3] = -1, -3              # mã âm
+    X[3, 0] = np.nan
+    X[3, 2] = np.nan                       # NaN ở cột phân loại
+    X[4, 2] = 3.0                          # mã đã gặp
+    X[5, 4] = 1e-36                        # sát ngưỡng zero của LightGBM
+    return X
+
+@pytest.mark.parametrize("objective,categorical,params", [
+    ("binary", False, {}),
+    ("binary", True, {}),
+    ("regression", False, {}),
+    ("regression", True, {"zero_as_missing": True}),
+    ("cross_entropy", True, {"use_missing": False}),
+])
+def test_flat_engine_matches_booster(tmp_path, objective, categorical, params):
+    booster = _train(objective, categorical, **params)
+    model_file = tmp_path / "model.txt"
+    booster.save_model(str(model_file))
+    engine = FlatTreeEngine.from_model_file(model_file)
+    if categorical:
+        assert np.any(engine.decision_type & 1), "mô hình không có split phân loại"
+
+    X, _, _ = _data(n=400, seed=1)
+    X = np.vstack([X, _edge_rows(X.shape[1])])
+    assert np.max(np.abs(engine.predict(X) - booster.predict(X))) <= TOL
+    assert verify_against_booster(model_file, rows=2000, seed=2) <= TOL
+
+def test_flat_engine_saved_arrays_match(tmp_path):
+    booster = _train("binary", True)
+    engine = FlatTreeEngine.from_model_string(booster.model_to_string())
+    engine.save(tmp_path / "flat")
+    loaded = FlatTreeEngine.load(tmp_path / "flat")
+
+    X = np.vstack([_data(n=200, seed=3)[0], _edge_rows(5)])
+    assert np.max(np.abs(loaded.predict(X) - booster.predict(X))) <= TOL
+
+def test_flat_engine_scores_large_batches_in_blocks(monkeypatch):
+    from src.services.l2 import tree_engine
+    engine = FlatTreeEngine.from_model_string(_train("binary", True).model_to_string())
+    X = np.vstack([_data(n=500, seed=4)[0], _edge_rows(5)])
+    whole = engine.predict(X)
+    monkeypatch.setattr(tree_engine, "_MAX_CELLS", engine.roots.size * 7)     # khối 7 dòng
+    assert np.array_equal(engine.predict(X), whole)